@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Platform, Album, Track, RoyaltyStatement, CsvUpload
+from .models import Platform, Album, Track, RoyaltyStatement, CsvUpload, UploadBatch, DataExport
+from .rollups import mark_artist_data_changed
 
 
 @admin.register(Platform)
@@ -24,14 +25,67 @@ class TrackAdmin(admin.ModelAdmin):
 
 @admin.register(RoyaltyStatement)
 class RoyaltyStatementAdmin(admin.ModelAdmin):
-    list_display = ('track', 'platform', 'period_end', 'streams', 'revenue', 'currency')
-    list_filter = ('platform', 'period_end', 'currency')
+    list_display = ('track', 'platform', 'period_end', 'territory', 'streams', 'revenue', 'currency')
+    list_filter = ('platform', 'period_end', 'currency', 'territory')
     search_fields = ('track__name', 'platform__name')
     raw_id_fields = ('artist', 'track', 'platform')
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        mark_artist_data_changed(obj.artist_id)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        mark_artist_data_changed(obj.artist_id, create=False)
+
+    def delete_queryset(self, request, queryset):
+        artist_ids = set(queryset.values_list('artist_id', flat=True))
+        super().delete_queryset(request, queryset)
+        for artist_id in artist_ids:
+            mark_artist_data_changed(artist_id, create=False)
+
+class CsvUploadInline(admin.TabularInline):
+    model = CsvUpload
+    fields = ('filename', 'status', 'total_rows', 'success_count', 'error_count', 'finished_at')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+    show_change_link = True
+
 @admin.register(CsvUpload)
 class CsvUploadAdmin(admin.ModelAdmin):
-    list_display = ('filename', 'artist', 'status', 'uploaded_at', 'success_count', 'error_count')
+    list_display = ('filename', 'artist', 'status', 'uploaded_at', 'size_bytes', 'queued_at', 'started_at',
+                    'success_count', 'error_count', 'duration_seconds', 'rows_per_second', 'process_rss_peak_mb')
     list_filter = ('status', 'uploaded_at')
     search_fields = ('filename', 'artist__username')
-    readonly_fields = ('uploaded_at',)
\ No newline at end of file
+    raw_id_fields = ('batch',)
+    readonly_fields = ('uploaded_at', 'queued_at', 'started_at', 'finished_at', 'heartbeat_at', 'stage_breakdown',
+                       'duration_seconds', 'rows_per_second', 'process_rss_peak_bytes',
+                       'process_tracemalloc_peak_bytes')
+    exclude = ('stage_timings',)
+
+    @admin.display(description='Process peak RSS (MB)', ordering='process_rss_peak_bytes')
+    def process_rss_peak_mb(self, obj):
+        return round(obj.process_rss_peak_bytes / 2 ** 20, 1) if obj.process_rss_peak_bytes else None
+
+    @admin.display(description='Stage timings')
+    def stage_breakdown(self, obj):
+        timings = obj.stage_timings or {}
+        total = sum(timings.values()) or 1
+        return ', '.join(
+            f'{name} {seconds:.2f}s ({seconds / total:.0%})' for name, seconds in timings.items()
+        ) or '-'
+
+@admin.register(UploadBatch)
+class UploadBatchAdmin(admin.ModelAdmin):
+    list_display = ('id', 'artist', 'file_count', 'created_at')
+    search_fields = ('artist__username',)
+    readonly_fields = ('created_at',)
+    inlines = [CsvUploadInline]
+
+@admin.register(DataExport)
+class DataExportAdmin(admin.ModelAdmin):
+    list_display = ('id', 'artist', 'file_format', 'status', 'row_count', 'created_at', 'completed_at')
+    list_filter = ('status', 'file_format', 'created_at')
+    search_fields = ('artist__username',)
+    readonly_fields = ('created_at', 'completed_at')
\ No newline at end of file
@@ -0,0 +1,53 @@
+import hashlib
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .rollups import get_artist_data_state
+
+
+def artist_data_etag(view_name, state, request):
+    """Strong ETag for one representation: the data version, the query (normalized) and the media type."""
+    query = urlencode(sorted(request.query_params.lists()), doseq=True)
+    variant = hashlib.sha1(f"{query}|{request.accepted_media_type}".encode()).hexdigest()[:16]
+    return quote_etag(f"{view_name}-{state.artist_id}-v{state.version}-{variant}")
+
+
+def conditional_on_artist_data(handler=None, *, volatile=None):
+    """Add ETag/Last-Modified validators derived from the artist's data version.
+
+    Conditional requests that still match are answered with a 304 before the
+    handler runs, so no aggregate queries are executed. Only the artist's
+    ArtistDataState row is read. The ETag also covers the query string and
+    the negotiated media type, which select the representation. When
+    `volatile(request)` is true the response depends on more than the data
+    version (e.g. upload queue positions), so it is served without validators.
+    """
+    if handler is None:
+        return lambda handler: conditional_on_artist_data(handler, volatile=volatile)
+
+    @wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        if volatile is not None and volatile(request):
+            response = handler(self, request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_store=True)
+            return response
+        state = get_artist_data_state(request.user.id)
+        etag = artist_data_etag(type(self).__name__, state, request)
+        last_modified = int(state.changed_at.timestamp())
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(self, request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ['Accept'])
+        # Private data: browsers may keep it but must revalidate each time
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    return wrapper
@@ -0,0 +1,57 @@
+from django.db.models import Count, F, Max, Sum
+from rest_framework.pagination import PageNumberPagination
+
+from .models import Album, Track
+from .money import sum_micros
+from .rollups import rollups_available
+
+CATALOG_METRICS = ['streams', 'revenue', 'platform_count', 'last_period_end']
+TRACK_SORT_FIELDS = CATALOG_METRICS + ['name', 'track_number', 'created_at']
+ALBUM_SORT_FIELDS = CATALOG_METRICS + ['title', 'release_date', 'created_at', 'track_count']
+
+
+class CatalogPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+def _metrics(artist_id, prefix=''):
+    """Per-row performance aggregates over the artist's rollups (when current) or statements."""
+    if rollups_available(artist_id):
+        relation, last_period, source = f'{prefix}rollups', f'{prefix}rollups__last_period_end', 'rollup'
+    else:
+        relation, last_period, source = f'{prefix}royalty_statements', f'{prefix}royalty_statements__period_end', \
+            'statements'
+    return {
+        'streams': Sum(f'{relation}__streams', default=0),
+        'revenue': sum_micros(f'{relation}__revenue_micros', default=0),
+        'platform_count': Count(f'{relation}__platform', distinct=True),
+        'last_period_end': Max(last_period),
+    }, source
+
+
+def _order(queryset, sort_by, descending):
+    primary = F(sort_by).desc(nulls_last=True) if descending else F(sort_by).asc(nulls_last=True)
+    return queryset.order_by(primary, 'id')
+
+
+def track_catalog(artist_id, sort_by='streams', descending=True):
+    """The artist's tracks with streams, revenue, platform count and last period, in one grouped query.
+
+    Returns (queryset, source); the queryset is ordered and ready to paginate.
+    """
+    metrics, source = _metrics(artist_id)
+    queryset = Track.objects.filter(artist_id=artist_id).values(
+        'id', 'name', 'album_id', 'track_number', 'duration_seconds', 'created_at', album_title=F('album__title'),
+    ).annotate(**metrics)
+    return _order(queryset, sort_by, descending), source
+
+
+def album_catalog(artist_id, sort_by='streams', descending=True):
+    """The artist's albums with track count and the same aggregates as track_catalog."""
+    metrics, source = _metrics(artist_id, prefix='tracks__')
+    queryset = Album.objects.filter(artist_id=artist_id).values(
+        'id', 'title', 'release_date', 'created_at',
+    ).annotate(track_count=Count('tracks', distinct=True), **metrics)
+    return _order(queryset, sort_by, descending), source
@@ -0,0 +1,283 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .models import RoyaltyStatement, Track
+from .reference import platforms_by_id
+from .rollups import get_artist_data_state
+
+
+def analytics_engine(engine=None):
+    """'sql' or 'columnar'; an explicit argument wins over ANALYTICS_ENGINE."""
+    return engine or getattr(settings, 'ANALYTICS_ENGINE', 'sql')
+
+
+class ArtistColumns:
+    """One artist's statement columns as NumPy arrays.
+
+    period_end is datetime64[D], revenue is the stored int64 micro-units, so
+    sums are exact and match the SQL sums, and territory is the 2-letter code
+    packed into a big-endian uint16 (sorting the codes sorts the letters).
+    """
+    __slots__ = ('version', 'period_end', 'platform_id', 'track_id', 'streams', 'revenue', 'territory')
+
+    def __init__(self, version, period_end, platform_id, track_id, streams, revenue, territory):
+        self.version = version
+        self.period_end = period_end
+        self.platform_id = platform_id
+        self.track_id = track_id
+        self.streams = streams
+        self.revenue = revenue
+        self.territory = territory
+
+    @classmethod
+    def load(cls, artist_id, version):
+        rows = RoyaltyStatement.objects.filter(artist_id=artist_id).values_list(
+            'period_end', 'platform_id', 'track_id', 'streams', 'revenue_micros', 'territory'
+        ).order_by()
+        period_end, platform_id, track_id, streams, revenue, territory = (
+            list(zip(*rows.iterator(chunk_size=10000))) or [()] * 6
+        )
+        return cls(
+            version,
+            np.array(period_end, dtype='datetime64[D]'),
+            np.array(platform_id, dtype=np.int64),
+            np.array(track_id, dtype=np.int64),
+            np.array(streams, dtype=np.int64),
+            np.array(revenue, dtype=np.int64),
+            np.array(territory, dtype='S2').view('>u2'),
+        )
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.__slots__[1:])
+
+    def mask(self, start_date=None, end_date=None):
+        if not start_date and not end_date:
+            return None
+        keep = np.ones(len(self.period_end), dtype=bool)
+        if start_date:
+            keep &= self.period_end >= np.datetime64(start_date, 'D')
+        if end_date:
+            keep &= self.period_end <= np.datetime64(end_date, 'D')
+        return keep
+
+
+class ColumnCache:
+    """Thread-safe LRU of per-artist entries bounded by total bytes.
+
+    Entries expose `version` (the ArtistDataState version they were built
+    from) and `nbytes`; ArtistColumns and search.SearchIndex both qualify.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, artist_id, version):
+        with self._lock:
+            columns = self._entries.get(artist_id)
+            if columns is None or columns.version != version:
+                return None
+            self._entries.move_to_end(artist_id)
+            return columns
+
+    def put(self, artist_id, columns):
+        if columns.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            self._pop(artist_id)
+            self._entries[artist_id] = columns
+            self.nbytes += columns.nbytes
+            while self.nbytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def discard(self, artist_id):
+        with self._lock:
+            self._pop(artist_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def _pop(self, artist_id):
+        columns = self._entries.pop(artist_id, None)
+        if columns is not None:
+            self.nbytes -= columns.nbytes
+
+    def __len__(self):
+        return len(self._entries)
+
+
+column_cache = ColumnCache(getattr(settings, 'ANALYTICS_COLUMN_CACHE_BYTES', 256 * 1024 * 1024))
+
+
+def artist_columns(artist_id):
+    """Cached columns for the artist's current data version, loading them on a miss.
+
+    Entries are keyed by ArtistDataState.version, so any upload or delete that
+    bumps the version invalidates them in every process.
+    """
+    version = get_artist_data_state(artist_id).version
+    columns = column_cache.get(artist_id, version)
+    if columns is None:
+        columns = ArtistColumns.load(artist_id, version)
+        column_cache.put(artist_id, columns)
+    return columns
+
+
+def _group_sums(keys, columns, keep):
+    """Vectorized GROUP BY keys -> (unique keys, stream sums, revenue sums)."""
+    streams, revenue = columns.streams, columns.revenue
+    if keep is not None:
+        keys, streams, revenue = keys[keep], streams[keep], revenue[keep]
+    unique, inverse = np.unique(keys, return_inverse=True)
+    # bincount sums in float64, which is exact for integer totals below 2**53 (about 9 billion currency units)
+    stream_sums = np.bincount(inverse, weights=streams, minlength=len(unique))
+    revenue_sums = np.bincount(inverse, weights=revenue, minlength=len(unique))
+    return unique, np.rint(stream_sums).astype(np.int64), np.rint(revenue_sums).astype(np.int64)
+
+
+def _bucket(period_end, granularity):
+    """Truncate dates the way the SQL Trunc* functions do."""
+    if granularity == 'week':
+        days = period_end.astype(np.int64)
+        return (days - (days + 3) % 7).astype('datetime64[D]')  # 1970-01-01 was a Thursday
+    if granularity == 'month':
+        return period_end.astype('datetime64[M]').astype('datetime64[D]')
+    if granularity == 'quarter':
+        months = period_end.astype('datetime64[M]').astype(np.int64)
+        return (months - months % 3).astype('datetime64[M]').astype('datetime64[D]')
+    if granularity == 'year':
+        return period_end.astype('datetime64[Y]').astype('datetime64[D]')
+    return period_end
+
+
+def totals(artist_id, start_date=None, end_date=None):
+    columns = artist_columns(artist_id)
+    keep = columns.mask(start_date, end_date)
+    streams = columns.streams if keep is None else columns.streams[keep]
+    revenue = columns.revenue if keep is None else columns.revenue[keep]
+    return {'streams': int(streams.sum()), 'revenue': int(revenue.sum())}
+
+
+def platform_totals(artist_id, start_date=None, end_date=None):
+    """Per-platform sums ordered by streams descending."""
+    columns = artist_columns(artist_id)
+    keys, streams, revenue = _group_sums(columns.platform_id, columns, columns.mask(start_date, end_date))
+    order = np.lexsort((keys, -streams))
+    platforms = platforms_by_id(keys.tolist())
+    return [
+        {
+            'platform_id': int(keys[i]),
+            'platform_name': platforms[int(keys[i])].name,
+            'platform_icon': platforms[int(keys[i])].api_name,
+            'streams': int(streams[i]),
+            'revenue': int(revenue[i]),
+        }
+        for i in order
+    ]
+
+
+def territory_totals(artist_id, start_date=None, end_date=None):
+    """Per-territory sums ordered by streams descending."""
+    columns = artist_columns(artist_id)
+    keys, streams, revenue = _group_sums(
+        columns.territory.astype(np.int64), columns, columns.mask(start_date, end_date)
+    )
+    codes = keys.astype('>u2').view('S2')
+    order = np.lexsort((keys, -streams))
+    return [
+        {'territory': codes[i].decode(), 'streams': int(streams[i]), 'revenue': int(revenue[i])}
+        for i in order
+    ]
+
+
+def pair_frame(artist_id, start_date=None, end_date=None):
+    """(track_id, platform_id, streams, revenue) sums, the shape dashboard's pair scan produces."""
+    columns = artist_columns(artist_id)
+    # Pack both ids into one int64 key so a single unique() does the 2-column group-by
+    pairs = (columns.track_id << 32) | columns.platform_id
+    keys, streams, revenue = _group_sums(pairs, columns, columns.mask(start_date, end_date))
+    return pd.DataFrame({
+        'track_id': keys >> 32,
+        'platform_id': keys & 0xFFFFFFFF,
+        'streams': streams,
+        'revenue': revenue,
+    })
+
+
+def bucket_frame(artist_id, granularity, split='none', start_date=None, end_date=None):
+    """(bucket, key, label, streams, revenue) sums, the input expected by timeseries.fill_series."""
+    columns = artist_columns(artist_id)
+    keep = columns.mask(start_date, end_date)
+    buckets = _bucket(columns.period_end, granularity).astype(np.int64)
+    if split == 'none':
+        split_ids = np.zeros(len(buckets), dtype=np.int64)
+    else:
+        split_ids = columns.platform_id if split == 'platform' else columns.track_id
+    # Buckets before 1970 are negative day numbers: pack their low 32 bits and sign-extend them back
+    keys, streams, revenue = _group_sums((split_ids << 32) | (buckets & 0xFFFFFFFF), columns, keep)
+    frame = pd.DataFrame({
+        'bucket': (keys & 0xFFFFFFFF).astype(np.uint32).view(np.int32).astype('datetime64[D]'),
+        'key': keys >> 32,
+        'streams': streams,
+        'revenue': revenue,
+    })
+    if split == 'none':
+        frame['label'] = 'All'
+    else:
+        ids = frame['key'].unique().tolist()
+        if split == 'platform':
+            names = {pk: platform.name for pk, platform in platforms_by_id(ids).items()}
+        else:
+            names = dict(Track.objects.filter(id__in=ids).values_list('id', 'name'))
+        frame['label'] = frame['key'].map(names)
+    return frame
+
+
+def top_tracks(artist_id, limit=10, start_date=None, end_date=None, sort_by='streams'):
+    """Same rows as queries.top_tracks, ranked with a vectorized sort."""
+    frame = pair_frame(artist_id, start_date, end_date)
+    track_ids = frame['track_id'].to_numpy()
+    unique, inverse = np.unique(track_ids, return_inverse=True)
+    streams = np.bincount(inverse, weights=frame['streams'].to_numpy(), minlength=len(unique)).astype(np.int64)
+    revenue = np.bincount(inverse, weights=frame['revenue'].to_numpy(), minlength=len(unique)).astype(np.int64)
+    platform_count = np.bincount(inverse, minlength=len(unique))
+    metric = streams if sort_by == 'streams' else revenue
+    order = np.lexsort((unique, -metric))[:limit]
+    names = dict(Track.objects.filter(id__in=unique[order].tolist()).values_list('id', 'name'))
+    return [
+        {
+            'track_id': int(unique[i]),
+            'track_name': names[int(unique[i])],
+            'streams': int(streams[i]),
+            'revenue': int(revenue[i]),
+            'platform_count': int(platform_count[i]),
+        }
+        for i in order
+    ]
+
+
+def top_tracks_per_platform(artist_id, limit=5, start_date=None, end_date=None, sort_by='streams'):
+    """Same rows as queries.top_tracks_per_platform: rank within each platform, keep the top `limit`."""
+    frame = pair_frame(artist_id, start_date, end_date)
+    if frame.empty:
+        return []
+    platforms = {pk: p.name for pk, p in platforms_by_id(frame['platform_id'].unique().tolist()).items()}
+    frame['platform_name'] = frame['platform_id'].map(platforms)
+    frame = frame.sort_values(['platform_name', 'platform_id', sort_by, 'track_id'],
+                              ascending=[True, True, False, True])
+    frame['rank'] = frame.groupby('platform_id').cumcount() + 1
+    frame = frame[frame['rank'] <= limit]
+    names = dict(Track.objects.filter(id__in=frame['track_id'].unique().tolist()).values_list('id', 'name'))
+    frame['track_name'] = frame['track_id'].map(names)
+    return frame[['platform_id', 'track_id', 'platform_name', 'track_name', 'streams', 'revenue', 'rank']].to_dict(
+        'records'
+    )
@@ -0,0 +1,151 @@
+from datetime import date, timedelta
+
+import pandas as pd
+from django.db.models import Max, Q, Sum
+
+from .models import RoyaltyStatement, Track
+from .money import micros_to_float, sum_micros
+from .reference import platforms_by_id
+from .rollups import aggregate_source, month_aligned
+
+COMPARE_TO = ['previous', 'year']
+MOVER_SORT_FIELDS = ['streams', 'revenue']
+
+
+def _month_start(day, months=0):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _shift_year(day):
+    try:
+        return day.replace(year=day.year - 1)
+    except ValueError:  # 29 February
+        return day.replace(year=day.year - 1, day=28)
+
+
+def default_window(artist_id):
+    """The calendar month of the artist's latest statement (or the current month)."""
+    latest = RoyaltyStatement.objects.filter(artist_id=artist_id).aggregate(
+        latest=Max('period_end'))['latest'] or date.today()
+    start = latest.replace(day=1)
+    return start, _month_start(start, 1) - timedelta(days=1)
+
+
+def comparison_window(start_date, end_date, compare_to='previous'):
+    """The window to compare (start_date, end_date) against.
+
+    'year' is the same dates a year earlier. 'previous' is the window of the
+    same length immediately before; whole-month windows shift by whole months.
+    """
+    if compare_to == 'year':
+        return _shift_year(start_date), _shift_year(end_date)
+    if month_aligned(start_date, end_date):
+        months = (end_date.year - start_date.year) * 12 + end_date.month - start_date.month + 1
+        return _month_start(start_date, -months), start_date - timedelta(days=1)
+    length = end_date - start_date
+    previous_end = start_date - timedelta(days=1)
+    return previous_end - length, previous_end
+
+
+def _pct(change, previous):
+    return round(change / previous * 100, 2) if previous else None
+
+
+def _change_row(current_streams, previous_streams, current_revenue, previous_revenue):
+    return {
+        'current_streams': int(current_streams),
+        'previous_streams': int(previous_streams),
+        'streams_change': int(current_streams - previous_streams),
+        'streams_change_pct': _pct(current_streams - previous_streams, previous_streams),
+        'current_revenue': micros_to_float(current_revenue),
+        'previous_revenue': micros_to_float(previous_revenue),
+        'revenue_change': micros_to_float(current_revenue - previous_revenue),
+        'revenue_change_pct': _pct(current_revenue - previous_revenue, previous_revenue),
+    }
+
+
+def _movers(frame, key, names, sort_by, limit):
+    grouped = frame.groupby(key)[['current_streams', 'previous_streams', 'current_revenue', 'previous_revenue']].sum()
+    grouped['change'] = grouped[f'current_{sort_by}'] - grouped[f'previous_{sort_by}']
+    grouped = grouped.reset_index().sort_values(['change', key], ascending=[False, True])
+    gainers = grouped[grouped['change'] > 0].head(limit)
+    losers = grouped[grouped['change'] < 0].sort_values(['change', key]).head(limit)
+    ids = set(gainers[key]) | set(losers[key])
+    labels = names(ids)
+
+    def rows(part):
+        return [
+            dict({'id': int(row[key]), 'name': labels.get(row[key])}, **_change_row(
+                row['current_streams'], row['previous_streams'], row['current_revenue'], row['previous_revenue']
+            ))
+            for _, row in part.iterrows()
+        ]
+
+    return {'gainers': rows(gainers), 'losers': rows(losers)}
+
+
+def compare_periods(artist_id, start_date, end_date, compare_to='previous', sort_by='streams', limit=5):
+    """Current vs comparison window totals, per-platform changes and movers.
+
+    Both windows are summed in one grouped query with conditional aggregation
+    (SUM ... FILTER (WHERE ...)) at (track, platform) grain; totals, platform
+    rows and movers are derived from that result. Returns (data, source).
+    """
+    previous_start, previous_end = comparison_window(start_date, end_date, compare_to)
+    queryset, source = aggregate_source(
+        artist_id, min(start_date, previous_start), max(end_date, previous_end),
+        allow_rollup=month_aligned(start_date, end_date) and month_aligned(previous_start, previous_end),
+    )
+    date_field = 'month' if source == 'rollup' else 'period_end'
+
+    def in_window(start, end):
+        if source == 'rollup':
+            end = end.replace(day=1)
+        return Q(**{f'{date_field}__gte': start, f'{date_field}__lte': end})
+
+    current = in_window(start_date, end_date)
+    previous = in_window(previous_start, previous_end)
+    rows = queryset.filter(current | previous).values('track_id', 'platform_id').annotate(
+        current_streams=Sum('streams', filter=current, default=0),
+        previous_streams=Sum('streams', filter=previous, default=0),
+        current_revenue=sum_micros('revenue_micros', filter=current, default=0),
+        previous_revenue=sum_micros('revenue_micros', filter=previous, default=0),
+    ).order_by()
+
+    columns = ['track_id', 'platform_id', 'current_streams', 'previous_streams', 'current_revenue',
+               'previous_revenue']
+    frame = pd.DataFrame.from_records(list(rows), columns=columns)
+    for column in columns[2:]:
+        frame[column] = frame[column].astype('int64')
+
+    sums = frame[columns[2:]].sum()
+    platform_names = {pk: p.name for pk, p in platforms_by_id(frame['platform_id'].unique().tolist()).items()}
+    by_platform = frame.groupby('platform_id')[columns[2:]].sum().sort_values(
+        'current_streams', ascending=False
+    )
+
+    def track_names(ids):
+        return dict(Track.objects.filter(id__in=[int(i) for i in ids]).values_list('id', 'name'))
+
+    data = {
+        'compare_to': compare_to,
+        'current': {'start_date': start_date, 'end_date': end_date,
+                    'streams': int(sums['current_streams']), 'revenue': micros_to_float(sums['current_revenue'])},
+        'previous': {'start_date': previous_start, 'end_date': previous_end,
+                     'streams': int(sums['previous_streams']), 'revenue': micros_to_float(sums['previous_revenue'])},
+        'change': {
+            name: value for name, value in _change_row(*sums[columns[2:]].tolist()).items() if '_change' in name
+        },
+        'platforms': [
+            dict({'platform_id': int(platform_id), 'platform_name': platform_names[platform_id]},
+                 **_change_row(row.current_streams, row.previous_streams, row.current_revenue, row.previous_revenue))
+            for platform_id, row in by_platform.iterrows()
+        ],
+        'movers': {
+            'sort_by': sort_by,
+            'tracks': _movers(frame, 'track_id', track_names, sort_by, limit),
+            'platforms': _movers(frame, 'platform_id', lambda ids: platform_names, sort_by, limit),
+        },
+    }
+    return data, source
@@ -0,0 +1,156 @@
+import pandas as pd
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+
+from . import columnar
+from .columnar import analytics_engine
+from .models import Album, Track
+from .money import micros_to_float, sum_micros
+from .queries import territory_totals
+from .reference import platforms_by_id
+from .rollups import aggregate_source
+from .serializers import (
+    DashboardSummarySerializer, StreamsOverTimeSerializer, TerritoryBreakdownSerializer, TopTracksSerializer
+)
+from .territories import territory_name
+from .timeseries import fill_series
+
+BUNDLE_WIDGETS = ['summary', 'total_streams', 'total_revenue', 'by_platform', 'by_territory', 'over_time',
+                  'top_tracks']
+PAIR_SCAN_WIDGETS = {'summary', 'total_streams', 'total_revenue', 'by_platform', 'top_tracks'}
+SUMMARY_TERRITORIES = 10
+
+
+def _pair_scan(artist_id, engine=None):
+    """(track, platform) sums; totals, platform breakdowns and top tracks all derive from these."""
+    if analytics_engine(engine) == 'columnar':
+        return columnar.pair_frame(artist_id), 'columnar'
+    queryset, source = aggregate_source(artist_id)
+    rows = queryset.values('track_id', 'platform_id').annotate(
+        streams=Sum('streams'), revenue=sum_micros('revenue_micros')
+    ).order_by()
+    frame = pd.DataFrame.from_records(list(rows), columns=['track_id', 'platform_id', 'streams', 'revenue'])
+    frame['streams'] = frame['streams'].fillna(0).astype('int64')
+    frame['revenue'] = frame['revenue'].fillna(0).astype('int64')
+    return frame, source
+
+
+def _bucket_scan(artist_id, granularity, engine=None):
+    if analytics_engine(engine) == 'columnar':
+        return columnar.bucket_frame(artist_id, granularity), 'columnar'
+    queryset, source = aggregate_source(artist_id, allow_rollup=granularity == 'month')
+    date_field = 'month' if source == 'rollup' else 'period_end'
+    trunc = TruncMonth if granularity == 'month' else TruncWeek
+    rows = queryset.annotate(bucket=trunc(date_field)).values('bucket').annotate(
+        streams=Sum('streams'), revenue=sum_micros('revenue_micros')
+    ).order_by()
+    frame = pd.DataFrame.from_records(list(rows), columns=['bucket', 'streams', 'revenue'])
+    frame['key'] = 0
+    frame['label'] = 'All'
+    return frame, source
+
+
+def _platform_rows(frame):
+    """Per-platform sums ordered like queries.platform_totals; revenue stays in micros."""
+    by_platform = frame.groupby('platform_id')[['streams', 'revenue']].sum().reset_index().sort_values(
+        ['streams', 'platform_id'], ascending=[False, True]
+    ).set_index('platform_id')
+    platforms = platforms_by_id(by_platform.index.tolist())
+    return [
+        {
+            'platform_name': platforms[platform_id].name,
+            'platform_icon': platforms[platform_id].api_name,
+            'streams': int(row.streams),
+            'revenue': int(row.revenue),
+        }
+        for platform_id, row in by_platform.iterrows()
+    ]
+
+
+def _top_track_rows(frame, limit=10):
+    by_track = frame.groupby('track_id').agg(
+        streams=('streams', 'sum'), revenue=('revenue', 'sum'), platform_count=('platform_id', 'nunique')
+    ).reset_index().sort_values(['streams', 'track_id'], ascending=[False, True]).head(limit)
+    names = dict(Track.objects.filter(id__in=by_track['track_id'].tolist()).values_list('id', 'name'))
+    return [
+        {
+            'track_name': names[row.track_id],
+            'track_id': int(row.track_id),
+            'streams': int(row.streams),
+            'revenue': int(row.revenue),
+            'platform_count': int(row.platform_count),
+        }
+        for row in by_track.itertuples()
+    ]
+
+
+def territory_rows(rows, limit=None):
+    """Name territory_totals rows and add each one's share of all streams; keeps the first `limit`."""
+    total_streams = sum(row['streams'] for row in rows) or 1
+    return [
+        dict(row, territory_name=territory_name(row['territory']),
+             percentage=round(row['streams'] / total_streams * 100, 2))
+        for row in rows[:limit]
+    ]
+
+
+def dashboard_bundle(artist_id, widgets, period='6months', engine=None):
+    """Compute the requested dashboard widgets from shared scans.
+
+    Totals, platform breakdowns and top tracks share one (track, platform)
+    grouped read; territory breakdowns add one grouped read and the over-time
+    series one bucketed read. Only the reads the requested widgets need run.
+    Each widget has the same shape as its standalone endpoint. Returns (data,
+    source), the source of the first read.
+    """
+    requested = set(widgets)
+    data = {}
+    sources = []
+
+    if PAIR_SCAN_WIDGETS & requested:
+        frame, source = _pair_scan(artist_id, engine)
+        sources.append(source)
+        total_streams = int(frame['streams'].sum())
+        total_revenue = int(frame['revenue'].sum())
+    platform_rows = _platform_rows(frame) if {'summary', 'by_platform'} & requested else []
+    territories = []
+    if {'summary', 'by_territory'} & requested:
+        territories, source = territory_totals(artist_id, engine=engine)
+        sources.append(source)
+
+    if 'summary' in widgets:
+        breakdown = [
+            dict(row, percentage=round((row['streams'] / (total_streams or 1)) * 100))
+            for row in sorted(platform_rows, key=lambda row: row['platform_name'])
+        ]
+        data['summary'] = DashboardSummarySerializer({
+            'total_streams': total_streams,
+            'total_revenue': total_revenue,
+            'currency': 'USD',
+            'platform_breakdown': breakdown,
+            'territory_breakdown': territory_rows(territories, SUMMARY_TERRITORIES),
+            'total_albums': Album.objects.filter(artist_id=artist_id).count(),
+            'total_tracks': Track.objects.filter(artist_id=artist_id).count(),
+        }).data
+    if 'total_streams' in widgets:
+        data['total_streams'] = {'total_streams': total_streams}
+    if 'total_revenue' in widgets:
+        data['total_revenue'] = {'total_revenue': micros_to_float(total_revenue, places=None), 'currency': 'USD'}
+    if 'by_platform' in widgets:
+        data['by_platform'] = {'platforms': [
+            dict(row, revenue=micros_to_float(row['revenue'], places=None)) for row in platform_rows
+        ]}
+    if 'by_territory' in widgets:
+        data['by_territory'] = {
+            'territories': TerritoryBreakdownSerializer(territory_rows(territories), many=True).data
+        }
+    if 'over_time' in widgets:
+        granularity = 'month' if period == '1year' else 'week'
+        buckets, source = _bucket_scan(artist_id, granularity, engine)
+        sources.append(source)
+        series = fill_series(buckets, granularity)
+        points = series[0]['points'] if series else []
+        data['over_time'] = StreamsOverTimeSerializer(points, many=True).data
+    if 'top_tracks' in widgets:
+        data['top_tracks'] = TopTracksSerializer(_top_track_rows(frame), many=True).data
+    return data, sources[0]
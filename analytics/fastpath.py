@@ -0,0 +1,68 @@
+from django.db.models import F
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+# Fields whose database values are not already in their JSON output form
+_CONVERTED_FIELDS = (serializers.DecimalField, serializers.DateTimeField, serializers.DateField)
+
+
+def _converter(field):
+    """field.to_representation, with the ISO datetime case resolved once instead of per row."""
+    if not isinstance(field, serializers.DateTimeField):
+        return field.to_representation
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    tz = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if output_format.lower() != ISO_8601 or tz is None:
+        return field.to_representation
+
+    def convert(value):
+        value = value.astimezone(tz).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+    return convert
+
+
+def output_fields(serializer_class):
+    """The serializer's readable fields, in output order."""
+    return {name: field for name, field in serializer_class().fields.items() if not field.write_only}
+
+
+def serialize_values(queryset, serializer_class, fields=None, constants=None):
+    """Build `serializer_class` output straight from a .values() query.
+
+    Each readable field is fetched through its `source` (``artist.username``
+    becomes ``artist__username``), so related names come from joins instead
+    of per-row attribute access. Only decimal and date fields are passed
+    through their serializer field; no model instances are created.
+
+    `fields` limits the output (and so the selected columns and joins) to a
+    subset; `constants` supplies values known up front, such as the
+    requester's own name, without fetching them.
+    """
+    available = output_fields(serializer_class)
+    names = [name for name in available if fields is None or name in fields]
+    constants = {name: value for name, value in (constants or {}).items() if name in names}
+    plain, aliased = [], {}
+    for name in names:
+        if name in constants:
+            continue
+        lookup = available[name].source.replace('.', '__')
+        if lookup == name:
+            plain.append(name)
+        else:
+            aliased[name] = F(lookup)
+    converters = [
+        (name, _converter(available[name])) for name in plain + list(aliased)
+        if isinstance(available[name], _CONVERTED_FIELDS)
+    ]
+    reorder = bool(constants) or plain + list(aliased) != names
+
+    rows = []
+    for row in queryset.values(*plain, **aliased):
+        for name, convert in converters:
+            if row[name] is not None:
+                row[name] = convert(row[name])
+        if constants:
+            row.update(constants)
+        rows.append({name: row[name] for name in names} if reorder else row)
+    return rows
@@ -0,0 +1,109 @@
+from datetime import datetime
+
+from rest_framework.exceptions import ValidationError
+
+STATEMENT_FILTER_PARAMS = ['start_date', 'end_date', 'platform', 'track', 'upload', 'currency', 'territory']
+
+
+def parse_date_param(params, name):
+    """Parse an optional YYYY-MM-DD query parameter."""
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValidationError({name: 'Expected a date in YYYY-MM-DD format.'})
+
+
+def parse_int_param(params, name):
+    """Parse an optional integer query parameter."""
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({name: 'Expected an integer.'})
+
+
+def filter_statements(queryset, params):
+    """Apply the royalty statement list filters from query params.
+
+    Supported params: start_date, end_date (on period_end), platform (id or
+    name), track (id), upload (id), currency and territory (ISO alpha-2 code).
+    """
+    start_date = parse_date_param(params, 'start_date')
+    end_date = parse_date_param(params, 'end_date')
+    if start_date:
+        queryset = queryset.filter(period_end__gte=start_date)
+    if end_date:
+        queryset = queryset.filter(period_end__lte=end_date)
+
+    platform = params.get('platform')
+    if platform:
+        if platform.isdigit():
+            queryset = queryset.filter(platform_id=int(platform))
+        else:
+            queryset = queryset.filter(platform__name__iexact=platform)
+
+    track = parse_int_param(params, 'track')
+    if track is not None:
+        queryset = queryset.filter(track_id=track)
+
+    upload = parse_int_param(params, 'upload')
+    if upload is not None:
+        queryset = queryset.filter(upload_id=upload)
+
+    currency = params.get('currency')
+    if currency:
+        queryset = queryset.filter(currency__iexact=currency)
+
+    territory = params.get('territory')
+    if territory:
+        queryset = queryset.filter(territory=territory.strip().upper())
+
+    return queryset
+
+
+def parse_window(params):
+    """Return the (start_date, end_date) period_end window from query params."""
+    start_date = parse_date_param(params, 'start_date')
+    end_date = parse_date_param(params, 'end_date')
+    if start_date and end_date and start_date > end_date:
+        raise ValidationError({'start_date': 'start_date must be on or before end_date.'})
+    return start_date, end_date
+
+
+def parse_choice_param(params, name, choices, default):
+    value = params.get(name) or default
+    if value not in choices:
+        raise ValidationError({name: f"Expected one of: {', '.join(choices)}."})
+    return value
+
+
+def parse_limit_param(params, name='limit', default=10, maximum=100):
+    value = parse_int_param(params, name)
+    if value is None:
+        return default
+    if value < 1 or value > maximum:
+        raise ValidationError({name: f'Expected a value between 1 and {maximum}.'})
+    return value
+
+
+def parse_fields_param(params, available, name='fields'):
+    """Parse a comma-separated sparse fieldset; None means all fields."""
+    value = params.get(name)
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise ValidationError({name: f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(available)}."})
+    return fields
+
+
+def parse_ordering_params(params, choices, default):
+    """Return (sort_by, descending) from ?sort_by=&order=asc|desc (descending by default)."""
+    sort_by = parse_choice_param(params, 'sort_by', choices, default)
+    return sort_by, parse_choice_param(params, 'order', ['asc', 'desc'], 'desc') == 'desc'
@@ -0,0 +1,158 @@
+"""Canonical RoyaltyStatement row keys.
+
+A row key identifies a statement by content so re-uploaded rows can be
+skipped. It is computed from ids and normalized values only and never
+touches the database:
+
+    artist_id|track_id|platform_id|YYYY-MM-DD|streams|revenue_units|CURRENCY[|TERRITORY]
+
+revenue_units is revenue in ten-thousandths, rounded half-even from the
+stored micro-units (analytics.money). Revenue used to be a 4-place decimal
+column, so keeping the text at that scale leaves every existing key valid.
+The territory is appended only when known, for the same reason: rows from
+before the territory column hash as they always did, while per-country rows
+of an otherwise identical line get distinct keys. A file imported before
+territories were read and uploaded again with its territory column produces
+the new, territory-bearing keys; ingestion also checks their territory-less
+key against unknown-territory rows so those lines are not imported twice.
+
+The stored key (RoyaltyStatement.row_key) is the first 128 bits of the
+SHA-256 of that text, as a UUID: 16 bytes in a native PostgreSQL uuid
+column, unique per artist.
+"""
+import hashlib
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from .money import MICROS
+from .territories import UNKNOWN_TERRITORY
+
+REVENUE_SCALE = 10000
+HASH_COLUMNS = ['artist_id', 'track_id', 'platform_id', 'period_end', 'streams', 'revenue_micros', 'currency',
+                'territory']
+_MICROS_PER_UNIT = MICROS // REVENUE_SCALE
+
+
+def revenue_units(micros):
+    """Revenue micros as integer ten-thousandths, rounded half-even."""
+    units, rest = divmod(int(micros), _MICROS_PER_UNIT)
+    half = _MICROS_PER_UNIT // 2
+    return units + (rest > half or (rest == half and units % 2 == 1))
+
+
+def _revenue_units_array(values):
+    units, rest = np.divmod(values.astype(np.int64), _MICROS_PER_UNIT)
+    half = _MICROS_PER_UNIT // 2
+    return units + ((rest > half) | ((rest == half) & (units % 2 == 1)))
+
+
+def _period(value):
+    return (value.isoformat() if hasattr(value, 'isoformat') else str(value))[:10]
+
+
+def normalize_currency(value):
+    """Currency code as stored and keyed: stripped and upper-cased, USD when missing or blank."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return 'USD'
+    return str(value).strip().upper() or 'USD'
+
+
+def _key(text):
+    return uuid.UUID(bytes=hashlib.sha256(text.encode()).digest()[:16])
+
+
+def row_text(artist_id, track_id, platform_id, period_end, streams, revenue_micros, currency='USD',
+             territory=UNKNOWN_TERRITORY):
+    """The canonical text of one statement row."""
+    values = [artist_id, track_id, platform_id, _period(period_end), int(streams), revenue_units(revenue_micros),
+              normalize_currency(currency)]
+    if territory and territory != UNKNOWN_TERRITORY:
+        values.append(territory)
+    return '|'.join(str(value) for value in values)
+
+
+def row_texts(frame):
+    """row_text for every row of a DataFrame with HASH_COLUMNS; normalization is vectorized per column."""
+    if frame.empty:
+        return pd.Series([], index=frame.index, dtype=object)
+    period = frame['period_end']
+    if pd.api.types.is_datetime64_any_dtype(period):
+        period = period.dt.strftime('%Y-%m-%d')
+    else:
+        period = period.map(_period)
+    currency = frame['currency'].fillna('USD').astype(str).str.strip().str.upper()
+    currency = currency.mask(currency == '', 'USD')
+    territory = frame['territory'].fillna(UNKNOWN_TERRITORY).astype(str)
+    territory = ('|' + territory).mask(territory.isin(['', UNKNOWN_TERRITORY]), '')
+    return (
+        frame['artist_id'].astype(str) + '|' + frame['track_id'].astype('int64').astype(str) + '|'
+        + frame['platform_id'].astype('int64').astype(str) + '|' + period + '|'
+        + frame['streams'].astype('int64').astype(str) + '|'
+        + pd.Series(_revenue_units_array(frame['revenue_micros'].to_numpy()), index=frame.index).astype(str) + '|'
+        + currency + territory
+    )
+
+
+def row_key(artist_id, track_id, platform_id, period_end, streams, revenue_micros, currency='USD',
+            territory=UNKNOWN_TERRITORY):
+    """Key of one statement row."""
+    return _key(row_text(artist_id, track_id, platform_id, period_end, streams, revenue_micros, currency, territory))
+
+
+def statement_key(statement):
+    """Key of an unsaved RoyaltyStatement, from its *_id attributes (no related-object loads)."""
+    return row_key(statement.artist_id, statement.track_id, statement.platform_id, statement.period_end,
+                   statement.streams, statement.revenue_micros, statement.currency, statement.territory)
+
+
+def key_frame(frame):
+    """Row keys for a DataFrame with HASH_COLUMNS."""
+    return pd.Series([_key(text) for text in row_texts(frame).tolist()], index=frame.index, dtype=object)
+
+
+def assign_keys(statements):
+    """Set row_key on a list of unsaved RoyaltyStatements in one vectorized pass."""
+    if not statements:
+        return statements
+    frame = pd.DataFrame({
+        column: [getattr(statement, column) for statement in statements] for column in HASH_COLUMNS
+    })
+    for statement, value in zip(statements, key_frame(frame).tolist()):
+        statement.row_key = value
+    return statements
+
+
+def rehash_statements(queryset, chunk_size=2000):
+    """Rewrite row_key to the canonical key for every row of `queryset`.
+
+    Rows whose canonical key already belongs to another row (true duplicates
+    imported before keys were consistent) keep their current key.
+    Returns (updated, duplicates).
+    """
+    model = queryset.model
+    columns = ['id', 'row_key'] + HASH_COLUMNS
+    updated = duplicates = 0
+    last_id = 0
+    while True:
+        rows = queryset.filter(id__gt=last_id).order_by('id').values(*columns)[:chunk_size]
+        chunk = pd.DataFrame.from_records(list(rows), columns=columns)
+        if chunk.empty:
+            return updated, duplicates
+        last_id = int(chunk['id'].iloc[-1])
+        chunk['canonical'] = [_key(text) for text in row_texts(chunk).tolist()]
+        chunk = chunk[chunk['canonical'] != chunk['row_key']]
+        first = ~chunk['canonical'].duplicated()
+        taken = set()
+        for artist_id, values in chunk.groupby('artist_id')['canonical']:
+            # Per artist, so the probe uses the (artist, row_key) unique index
+            taken.update(model._base_manager.filter(
+                artist_id=artist_id, row_key__in=values.tolist()
+            ).values_list('row_key', flat=True))
+        keep = first & ~chunk['canonical'].isin(taken)
+        duplicates += int((~keep).sum())
+        rows = [model(id=int(pk), row_key=value)
+                for pk, value in zip(chunk.loc[keep, 'id'], chunk.loc[keep, 'canonical'])]
+        model._base_manager.bulk_update(rows, ['row_key'])
+        updated += len(rows)
@@ -0,0 +1,276 @@
+from datetime import datetime
+
+import pandas as pd
+from django.db import connection, transaction
+
+from .hashing import key_frame, normalize_currency
+from .matching import track_match_key
+from .models import Platform, RoyaltyStatement, Track
+from .money import to_micros
+from .reference import invalidate_platforms, platform_catalog, platform_key
+from .territories import UNKNOWN_TERRITORY, territory_column
+
+KEY_LOOKUP_BATCH = 1000
+INSERT_BATCH = 1000
+TRACK_LOCK_CLASS = 4501  # pg_advisory_xact_lock(class, hashtext(artist)) namespace for track resolution
+STAGE_TABLE = 'analytics_statement_stage'  # per-transaction COPY target, see copy_statements
+PARSED_COLUMNS = [
+    'track_name', 'platform_name', 'streams', 'revenue_micros', 'currency', 'territory', 'period_start', 'period_end',
+]
+
+
+def read_statements(source):
+    """Read a statement CSV. Only empty cells are missing: "NA" is Namibia's territory code, not a null."""
+    return pd.read_csv(source, keep_default_na=False, na_values=[''])
+
+
+def _parse_date(value):
+    """Statement dates come as YYYY-MM-DD or DD/MM/YYYY."""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return datetime.strptime(value, '%d/%m/%Y').date()
+
+
+def parse_dates(df):
+    """period_end for every row, converted for the whole column at once; None where it did not parse.
+
+    Accepts the same two formats as _parse_date, YYYY-MM-DD first.
+    """
+    values = df['period_end'] if 'period_end' in df else pd.Series('', index=df.index)
+    dates = pd.to_datetime(values, format='%Y-%m-%d', errors='coerce')
+    dates = dates.fillna(pd.to_datetime(values, format='%d/%m/%Y', errors='coerce'))
+    return dates.to_numpy(dtype='datetime64[D]').tolist()  # datetime.date objects, NaT -> None
+
+
+def parse_rows(df, period_ends=None):
+    """Validate CSV rows.
+
+    Returns (rows, errors): rows are dicts of parsed values, errors are
+    "Row N: message" strings for rows that could not be parsed. Territory
+    comes from whichever territory/country column the file has, normalized
+    for the whole frame at once (see analytics.territories); so do dates
+    (parse_dates, or `period_ends` when already converted).
+    """
+    rows, errors = [], []
+    territories = territory_column(df).tolist()
+    if period_ends is None:
+        period_ends = parse_dates(df)
+    for index, record in enumerate(df.to_dict('records')):
+        try:
+            # Rows the vectorized pass rejected go through strptime for its error message
+            period_end = period_ends[index] or _parse_date(record.get('period_end', ''))
+            rows.append({
+                'track_name': str(record.get('track_name', '')),
+                'platform_name': str(record.get('platform', '')),
+                'streams': int(record.get('streams', 0)),
+                'revenue_micros': to_micros(record.get('revenue', 0.0)),
+                'currency': normalize_currency(record.get('currency')),
+                'territory': territories[index],
+                'period_start': period_end.replace(day=1),  # Assuming monthly reports
+                'period_end': period_end,
+            })
+        except Exception as e:
+            errors.append(f"Row {index + 1}: {str(e)}")
+    return rows, errors
+
+
+def lock_artist_tracks(artist_id):
+    """Hold the artist's track-resolution lock until the current transaction ends.
+
+    Track match keys are not unique in the schema, so two uploads adding
+    "Song" and "Song (feat. X)" at once could otherwise both create a track.
+    PostgreSQL takes a transaction-level advisory lock keyed by a hash of
+    the artist's UUID (a collision only makes two artists wait on each
+    other); other backends already serialize writers.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, hashtext(%s))', [TRACK_LOCK_CLASS, str(artist_id)])
+
+
+def resolve_tracks(artist_id, names):
+    """Map track names to canonical Track ids, creating one Track per unseen match key.
+
+    Variants that share a match key ("Song", "Song (feat. X)") resolve to the
+    oldest existing track with that key. Runs in its own short transaction
+    under the artist's track lock, so concurrent uploads from one artist
+    wait on each other only while resolving tracks.
+    """
+    # First spelling in the file names a new track
+    keys = {name: track_match_key(name) for name in dict.fromkeys(names)}
+
+    def lookup(match_keys):
+        found = Track.objects.filter(artist_id=artist_id, match_key__in=match_keys).order_by('-id')
+        return dict(found.values_list('match_key', 'id'))  # lowest id wins
+
+    with transaction.atomic():
+        lock_artist_tracks(artist_id)
+        canonical = lookup(set(keys.values()))
+        missing = {}
+        for name, key in keys.items():
+            if key not in canonical:
+                missing.setdefault(key, name)
+        if missing:
+            # ON CONFLICT DO NOTHING: an exact name may exist under a stale match key
+            Track.objects.bulk_create([
+                Track(artist_id=artist_id, name=name, match_key=key) for key, name in sorted(missing.items())
+            ], ignore_conflicts=True)
+            canonical.update(lookup(set(missing)))
+            # A track whose stored key is stale still owns its exact name
+            unresolved = [name for key, name in missing.items() if key not in canonical]
+            for name, pk in Track.objects.filter(artist_id=artist_id, name__in=unresolved).values_list('name', 'id'):
+                canonical[keys[name]] = pk
+    return {name: canonical[key] for name, key in keys.items()}
+
+
+def resolve_platforms(names):
+    """Map platform names to Platform ids (see PlatformCatalog.lookup), creating unknown platforms.
+
+    New platforms are inserted with ON CONFLICT DO NOTHING in their own
+    transaction: a concurrent upload creating the same platform makes the
+    insert wait for that upload's commit instead of failing, and the reloaded
+    catalog then finds the row. A name whose insert conflicted with a
+    differently named platform's api_name resolves to that platform.
+    """
+    names = list(dict.fromkeys(names))
+    catalog = platform_catalog()
+    missing = {}
+    for name in names:
+        if catalog.lookup(name) is None:
+            missing.setdefault(platform_key(name), name)
+    if missing:
+        with transaction.atomic():
+            # Sorted so concurrent inserts of overlapping sets take row locks in the same order
+            Platform.objects.bulk_create([
+                Platform(name=name, api_name=_api_name(name)) for _, name in sorted(missing.items())
+            ], ignore_conflicts=True)
+            invalidate_platforms()  # bulk_create sends no post_save
+        catalog = platform_catalog()
+    return {name: (catalog.lookup(name) or catalog.by_api_name[_api_name(name).casefold()]).id for name in names}
+
+
+def _api_name(name):
+    return name.lower().replace(' ', '_')
+
+
+def copy_statements(statements):
+    """Bulk loader: COPY statements into a temporary table, then move them over in one INSERT.
+
+    PostgreSQL only, inside a transaction. The INSERT ... SELECT runs in
+    row-key order with ON CONFLICT DO NOTHING, like the batched
+    bulk_create path, but the rows cross the wire in one COPY stream instead
+    of one INSERT per INSERT_BATCH rows. Returns the number of rows inserted.
+    """
+    fields = [field for field in RoyaltyStatement._meta.concrete_fields if not field.primary_key]
+    quote = connection.ops.quote_name
+    table = quote(RoyaltyStatement._meta.db_table)
+    columns = ', '.join(quote(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {STAGE_TABLE}')
+        cursor.execute(f'CREATE TEMP TABLE {STAGE_TABLE} ON COMMIT DROP AS SELECT {columns} FROM {table} WITH NO DATA')
+        with cursor.copy(f'COPY {STAGE_TABLE} ({columns}) FROM STDIN') as copy:
+            for statement in statements:
+                copy.write_row([
+                    field.get_db_prep_save(field.pre_save(statement, True), connection) for field in fields
+                ])
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}) SELECT {columns} FROM {STAGE_TABLE} '
+            f'ORDER BY {quote("row_key")} ON CONFLICT DO NOTHING'
+        )
+        return cursor.rowcount
+
+
+def _existing_keys(artist_id, keys, **filters):
+    """The subset of `keys` the artist already has, in batched per-artist lookups."""
+    existing = set()
+    for i in range(0, len(keys), KEY_LOOKUP_BATCH):
+        existing.update(RoyaltyStatement.objects.filter(
+            artist_id=artist_id, row_key__in=keys[i:i + KEY_LOOKUP_BATCH], **filters
+        ).values_list('row_key', flat=True))
+    return existing
+
+
+def _bulk_insert(statements):
+    RoyaltyStatement.objects.bulk_create(statements, ignore_conflicts=True)
+
+
+def ingest_dataframe(upload, df, progress=None, loader=None):
+    """Import the statements in `df` for upload.artist.
+
+    Tracks and platforms are resolved in bulk, each in its own short
+    transaction, row keys are computed over the whole frame
+    (analytics.hashing) and already-imported rows are filtered with batched
+    per-artist key lookups. A row with a known territory also counts as
+    imported when its territory-less key matches a stored unknown-territory
+    row, since that is how the same line was keyed before territories were
+    read: re-uploading an old file that has a territory column adds nothing
+    (the stored rows stay unknown-territory). New statements are inserted in
+    row-key order with INSERT ... ON CONFLICT DO NOTHING, so a row imported
+    by a concurrent upload in the meantime is skipped rather than failing the
+    upload.
+    Returns (success_count, error_messages); success_count counts the rows
+    this upload actually inserted.
+
+    `progress(stage, processed_rows=None, error_count=None)` is called as
+    each stage (dates, parsing, resolving, deduplicating, inserting) starts
+    and after every insert batch; processed_rows counts
+    rows handled so far, including failed and duplicate ones.
+
+    `loader(statements)` inserts the new statements in one call instead of
+    the default INSERT_BATCH-row bulk_create batches (see copy_statements).
+    """
+    progress = progress or (lambda stage, processed_rows=None, error_count=None: None)
+    progress('dates', 0)
+    period_ends = parse_dates(df)
+    progress('parsing')
+    rows, errors = parse_rows(df, period_ends)
+    artist_id = upload.artist_id
+
+    progress('resolving', len(errors), len(errors))
+    track_ids = resolve_tracks(artist_id, [row['track_name'] for row in rows])
+    platform_ids = resolve_platforms([row['platform_name'] for row in rows])
+
+    progress('deduplicating')
+    frame = pd.DataFrame(rows, columns=PARSED_COLUMNS)
+    frame['artist_id'] = artist_id
+    frame['track_id'] = frame['track_name'].map(track_ids)
+    frame['platform_id'] = frame['platform_name'].map(platform_ids)
+    frame['row_key'] = key_frame(frame)
+    frame = frame.drop_duplicates('row_key').sort_values('row_key')
+    known = frame['territory'] != UNKNOWN_TERRITORY
+    legacy_keys = key_frame(frame[known].assign(territory=UNKNOWN_TERRITORY))
+
+    with transaction.atomic():
+        existing = _existing_keys(artist_id, frame['row_key'].tolist())
+        legacy = _existing_keys(artist_id, legacy_keys.tolist(), territory=UNKNOWN_TERRITORY)
+        existing.update(frame.loc[legacy_keys[legacy_keys.isin(legacy)].index, 'row_key'])
+        new_statements = [
+            RoyaltyStatement(
+                artist_id=artist_id,
+                track_id=int(row.track_id),
+                platform_id=int(row.platform_id),
+                upload=upload,
+                period_start=row.period_start,
+                period_end=row.period_end,
+                streams=int(row.streams),
+                revenue_micros=int(row.revenue_micros),
+                currency=row.currency,
+                territory=row.territory,
+                row_key=row.row_key,
+            )
+            for row in frame.itertuples(index=False) if row.row_key not in existing
+        ]
+        if not new_statements:
+            return 0, errors
+        skipped = len(errors) + len(rows) - len(new_statements)
+        progress('inserting', skipped)
+        # Row-key order keeps lock order consistent between uploads that share rows
+        batch_size = INSERT_BATCH if loader is None else len(new_statements)
+        for i in range(0, len(new_statements), batch_size):
+            batch = new_statements[i:i + batch_size]
+            (loader or _bulk_insert)(batch)
+            progress('inserting', skipped + i + len(batch))
+        success_count = RoyaltyStatement.objects.filter(upload=upload).count()
+
+    return success_count, errors
@@ -0,0 +1,129 @@
+"""Per-stage timing and memory measurements for upload imports.
+
+UploadMetrics is fed the same stage names as the progress reporter
+(reading, dates, parsing, resolving, deduplicating, inserting) and records
+wall time per stage, rows per second and peak memory. Memory is not
+measured per upload, which Python cannot do for threads sharing one heap;
+both figures are process-wide samples, named process_* in the API and the
+admin. Resident set size is sampled at every stage change and progress
+report. With ANALYTICS_UPLOAD_TRACEMALLOC enabled the tracemalloc peak is
+recorded too; it is reset only when no other traced upload is running in
+the process, so uploads that overlap report the peak since the first of
+them started rather than clearing each other's.
+"""
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+
+from .models import CsvUpload
+
+THROUGHPUT_GRANULARITIES = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+_tracing_lock = threading.Lock()
+_traced_uploads = 0  # UploadMetrics with trace_memory between __init__ and finish()
+
+
+def current_rss():
+    """Resident set size in bytes; the process's peak RSS where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class UploadMetrics:
+    """Stage clock and memory high-water marks for one upload."""
+
+    def __init__(self, trace_memory=None):
+        if trace_memory is None:
+            trace_memory = getattr(settings, 'ANALYTICS_UPLOAD_TRACEMALLOC', False)
+        self.trace_memory = trace_memory
+        if trace_memory:
+            global _traced_uploads
+            with _tracing_lock:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                if not _traced_uploads:
+                    tracemalloc.reset_peak()
+                _traced_uploads += 1
+        self.started = time.perf_counter()
+        self.stages = {}
+        self._stage, self._stage_started = None, self.started
+        self.rss_peak = current_rss()
+
+    def stage(self, name):
+        """Start stage `name` (a repeated name just samples memory)."""
+        now = time.perf_counter()
+        self.rss_peak = max(self.rss_peak, current_rss())
+        if name == self._stage:
+            return
+        if self._stage is not None:
+            self.stages[self._stage] = self.stages.get(self._stage, 0) + now - self._stage_started
+        self._stage, self._stage_started = name, now
+
+    def finish(self, rows):
+        """Close the last stage; returns the CsvUpload metric fields for `rows` handled rows."""
+        self.stage(None)
+        duration = time.perf_counter() - self.started
+        traced_peak = None
+        if self.trace_memory:
+            global _traced_uploads
+            with _tracing_lock:
+                traced_peak = tracemalloc.get_traced_memory()[1]
+                _traced_uploads -= 1
+            self.trace_memory = False  # finish() releases the reset hold once
+        return {
+            'stage_timings': {name: round(seconds, 4) for name, seconds in self.stages.items()},
+            'duration_seconds': round(duration, 4),
+            'rows_per_second': round(rows / duration, 1) if duration > 0 else None,
+            'process_rss_peak_bytes': self.rss_peak,
+            'process_tracemalloc_peak_bytes': traced_peak,
+        }
+
+
+def ingestion_throughput(granularity='day', start_date=None, end_date=None):
+    """Finished uploads bucketed by finish time: counts, rows, rows/second and average stage times.
+
+    rows_per_second is total rows over total processing time in the
+    bucket, so large uploads weigh more than small ones.
+    """
+    uploads = CsvUpload.objects.filter(finished_at__isnull=False, duration_seconds__isnull=False)
+    if start_date:
+        uploads = uploads.filter(finished_at__date__gte=start_date)
+    if end_date:
+        uploads = uploads.filter(finished_at__date__lte=end_date)
+    bucket = THROUGHPUT_GRANULARITIES[granularity]('finished_at')
+    rows = uploads.annotate(bucket=bucket).values('bucket').annotate(
+        uploads=Count('id'), failed=Count('id', filter=Q(status='failed')),
+        total_rows=Sum('total_rows'), seconds=Sum('duration_seconds'),
+        process_rss_peak_bytes=Max('process_rss_peak_bytes'),
+    ).order_by('bucket')
+    buckets = {row['bucket']: row for row in rows}
+    stage_sums = {}
+    for bucket_value, timings in uploads.annotate(bucket=bucket).values_list('bucket', 'stage_timings').iterator():
+        sums = stage_sums.setdefault(bucket_value, {})
+        for name, seconds in (timings or {}).items():
+            sums[name] = sums.get(name, 0) + seconds
+    return [
+        {
+            'bucket': bucket_value.date(),
+            'uploads': row['uploads'],
+            'failed': row['failed'],
+            'total_rows': row['total_rows'] or 0,
+            'rows_per_second': round((row['total_rows'] or 0) / row['seconds'], 1) if row['seconds'] else None,
+            'process_rss_peak_bytes': row['process_rss_peak_bytes'],
+            'average_stage_seconds': {
+                name: round(seconds / row['uploads'], 4) for name, seconds in stage_sums.get(bucket_value, {}).items()
+            },
+        }
+        for bucket_value, row in buckets.items()
+    ]
@@ -0,0 +1,264 @@
+import fnmatch
+import glob
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from analytics.columnar import column_cache
+from analytics.ingestion import copy_statements, ingest_dataframe, read_statements
+from analytics.instrumentation import UploadMetrics
+from analytics.models import CsvUpload, RoyaltyStatement
+from analytics.rollups import mark_artist_data_changed, rebuild_artist_rollups
+from analytics.scheduler import BACKFILL_STAGE
+
+DONE_STATUSES = ['completed', 'completed_with_errors']
+
+
+class Command(BaseCommand):
+    help = (
+        "Import historical statement files straight into the database, in parallel. Each file is recorded as a "
+        "CsvUpload named by its path, which is the checkpoint: a re-run skips files already imported."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('sources', nargs='+', help="Directories (searched recursively) or glob patterns")
+        parser.add_argument('--pattern', default='*.csv', help="File name pattern within directories")
+        parser.add_argument('--mapping',
+                            help='JSON file of {"glob pattern": artist}, matched against each path and file name '
+                                 'in order; artists are usernames or ids')
+        parser.add_argument('--artist', help="Artist (username or id) for files the mapping does not match")
+        parser.add_argument('--workers', type=int, default=4, help="Files imported at once")
+        parser.add_argument('--defer-indexes', action='store_true',
+                            help="Drop the secondary statement indexes during the load and rebuild them at the end. "
+                                 "Every statement query scans the table meanwhile, so this is refused on PostgreSQL "
+                                 "while other sessions are connected; stop the app first")
+        parser.add_argument('--dry-run', action='store_true', help="Show what would be imported")
+
+    def handle(self, *args, **options):
+        files = self._discover(options['sources'], options['pattern'])
+        if not files:
+            raise CommandError("No statement files found.")
+        artists = self._assign_artists(files, options['mapping'], options['artist'])
+        done = set(CsvUpload.objects.filter(
+            artist_id__in=set(artists.values()), filename__in=[self._name(path) for path in files],
+            status__in=DONE_STATUSES,
+        ).values_list('artist_id', 'filename', 'size_bytes'))
+        pending = [path for path in files if (artists[path], self._name(path), path.stat().st_size) not in done]
+        # Largest first, so one big file does not run alone at the end
+        pending.sort(key=lambda path: path.stat().st_size, reverse=True)
+        self.stdout.write(
+            f"{len(files)} files, {len(files) - len(pending)} already imported, {len(pending)} to import."
+        )
+
+        if options['dry_run']:
+            for path in pending:
+                self.stdout.write(f"{path} -> artist {artists[path]}")
+            return
+        if not pending:
+            self._restore_indexes()
+            self.stdout.write(self.style.SUCCESS("Nothing to import."))
+            return
+
+        if options['defer_indexes']:
+            self._check_no_traffic()
+        artist_ids = {artists[path] for path in pending}
+        for artist_id in artist_ids:
+            # Rollups are stale from here on; analytics read statements until they are rebuilt at the end
+            mark_artist_data_changed(artist_id)
+        if options['defer_indexes']:
+            self._drop_indexes()
+        loader = copy_statements if connection.vendor == 'postgresql' else None
+
+        started = time.perf_counter()
+        totals = {'rows': 0, 'inserted': 0, 'errors': 0, 'failed': 0}
+        try:
+            with ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='analytics-backfill') as pool:
+                futures = {pool.submit(self._run, path, artists[path], loader): path for path in pending}
+                for count, future in enumerate(as_completed(futures), 1):
+                    result = future.result()
+                    for name in ['rows', 'inserted', 'errors']:
+                        totals[name] += result[name]
+                    totals['failed'] += result['status'] == 'failed'
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f"[{count}/{len(pending)}] {futures[future]}: {result['status']}, {result['rows']} rows, "
+                        f"{result['inserted']} new, {result['errors']} errors in {result['seconds']:.1f}s "
+                        f"({self._per_minute(totals['rows'], elapsed)} rows/min overall)"
+                    )
+        finally:
+            loaded = time.perf_counter() - started
+            # Always: this also rebuilds indexes an interrupted --defer-indexes run left dropped
+            self._restore_indexes()
+
+        self.stdout.write(f"Rebuilding rollups for {len(artist_ids)} artists...")
+        for artist_id in artist_ids:
+            column_cache.discard(artist_id)
+            rebuild_artist_rollups(artist_id)
+        total = time.perf_counter() - started
+
+        summary = (
+            f"Imported {len(pending) - totals['failed']} files ({totals['failed']} failed): {totals['rows']} rows, "
+            f"{totals['inserted']} new, {totals['errors']} errors. Load {loaded:.1f}s at "
+            f"{self._per_minute(totals['rows'], loaded)} rows/min; {total:.1f}s at "
+            f"{self._per_minute(totals['rows'], total)} rows/min including index and rollup rebuilds."
+        )
+        self.stdout.write(self.style.WARNING(summary) if totals['failed'] else self.style.SUCCESS(summary))
+
+    def _discover(self, sources, pattern):
+        files = set()
+        for source in sources:
+            path = Path(source)
+            if path.is_dir():
+                matches = path.rglob(pattern)
+            else:
+                matches = [Path(match) for match in glob.glob(source, recursive=True)]
+                if not matches:
+                    raise CommandError(f"No files match {source}")
+            files.update(match.resolve() for match in matches if match.is_file())
+        return sorted(files)
+
+    def _assign_artists(self, files, mapping_path, default):
+        """{path: artist id}; every file must be matched by the mapping or covered by --artist."""
+        mapping = {}
+        if mapping_path:
+            try:
+                with open(mapping_path) as fh:
+                    mapping = json.load(fh)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read the mapping: {e}")
+            if not isinstance(mapping, dict):
+                raise CommandError('The mapping must be a JSON object of {"glob pattern": artist}.')
+        ids = {value: self._artist_id(value) for value in {*map(str, mapping.values()), default} if value}
+        artists, unmapped = {}, []
+        for path in files:
+            value = next((
+                str(artist) for pattern, artist in mapping.items()
+                if fnmatch.fnmatch(str(path), pattern) or fnmatch.fnmatch(path.name, pattern)
+            ), default)
+            if value is None:
+                unmapped.append(str(path))
+            else:
+                artists[path] = ids[value]
+        if unmapped:
+            raise CommandError(f"No artist for {len(unmapped)} files, e.g. {', '.join(unmapped[:3])}; "
+                               f"extend the mapping or pass --artist.")
+        return artists
+
+    def _artist_id(self, value):
+        users = get_user_model().objects
+        user = users.filter(username=value).first()
+        if user is None:
+            try:
+                user = users.filter(pk=value).first()
+            except (ValueError, ValidationError):
+                pass
+        if user is None:
+            raise CommandError(f"Unknown artist {value!r}")
+        return user.pk
+
+    @staticmethod
+    def _name(path):
+        # The checkpoint key; the end of the path is the distinctive part
+        return str(path)[-CsvUpload._meta.get_field('filename').max_length:]
+
+    @staticmethod
+    def _per_minute(rows, seconds):
+        return f"{rows * 60 / seconds:,.0f}" if seconds > 0 else "-"
+
+    def _run(self, path, artist_id, loader):
+        close_old_connections()
+        try:
+            return self._import(path, artist_id, loader)
+        finally:
+            close_old_connections()
+
+    def _import(self, path, artist_id, loader):
+        """Import one file under its checkpoint CsvUpload; failures are recorded, not raised."""
+        metrics = UploadMetrics(trace_memory=False)
+        name, size = self._name(path), path.stat().st_size
+        # An earlier run's unfinished record is picked up again; its committed rows count as imported
+        upload = CsvUpload.objects.filter(artist_id=artist_id, filename=name, size_bytes=size).exclude(
+            status__in=DONE_STATUSES
+        ).order_by('-id').first() or CsvUpload(artist_id=artist_id, filename=name, size_bytes=size)
+        # BACKFILL_STAGE keeps the upload scheduler from counting or failing it; a killed run resumes it
+        upload.status, upload.stage, upload.error_log = 'processing', BACKFILL_STAGE, ''
+        upload.started_at, upload.finished_at = timezone.now(), None
+        upload.save()
+        try:
+            metrics.stage('reading')
+            df = read_statements(path)
+            upload.total_rows = len(df)
+            success_count, errors = ingest_dataframe(
+                upload, df, progress=lambda stage, processed_rows=None, error_count=None: metrics.stage(stage),
+                loader=loader,
+            )
+            upload.success_count = success_count
+            upload.error_count = len(errors)
+            upload.processed_rows = upload.total_rows
+            upload.error_log = "\n".join(errors[:10])
+            upload.status = 'completed' if not errors else 'completed_with_errors'
+        except Exception as e:
+            upload.status = 'failed'
+            upload.error_log = str(e)
+        for field, value in metrics.finish(upload.total_rows).items():
+            setattr(upload, field, value)
+        upload.stage = ''
+        upload.finished_at = timezone.now()
+        upload.save()
+        if upload.success_count:
+            # Cheap version bump so cached responses revalidate; rollups wait for the end of the run
+            mark_artist_data_changed(artist_id)
+        return {
+            'status': upload.status, 'rows': upload.total_rows, 'inserted': upload.success_count,
+            'errors': upload.error_count, 'seconds': upload.duration_seconds,
+        }
+
+    def _check_no_traffic(self):
+        """Refuse --defer-indexes while other sessions use the database (PostgreSQL); warn elsewhere."""
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING(
+                "--defer-indexes: make sure nothing else queries statements until the indexes are rebuilt."
+            ))
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*) FROM pg_stat_activity WHERE datname = current_database() "
+                "AND pid <> pg_backend_pid() AND backend_type = 'client backend'"
+            )
+            sessions = cursor.fetchone()[0]
+        if sessions:
+            raise CommandError(
+                f"--defer-indexes: {sessions} other sessions are connected to the database. Dropping the statement "
+                f"indexes would slow every query they run; stop the app (and other clients) first, or run without "
+                f"--defer-indexes."
+            )
+
+    def _drop_indexes(self):
+        """Drop RoyaltyStatement's secondary indexes for the load; the unique row-key constraint stays."""
+        existing = self._existing_indexes()
+        with connection.schema_editor() as editor:
+            for index in RoyaltyStatement._meta.indexes:
+                if index.name in existing:
+                    editor.remove_index(RoyaltyStatement, index)
+
+    def _restore_indexes(self):
+        """Create every declared statement index that is missing (also repairs an interrupted run)."""
+        existing = self._existing_indexes()
+        missing = [index for index in RoyaltyStatement._meta.indexes if index.name not in existing]
+        if not missing:
+            return
+        self.stdout.write(f"Rebuilding {len(missing)} statement indexes...")
+        with connection.schema_editor() as editor:
+            for index in missing:
+                editor.add_index(RoyaltyStatement, index)
+
+    def _existing_indexes(self):
+        with connection.cursor() as cursor:
+            return connection.introspection.get_constraints(cursor, RoyaltyStatement._meta.db_table)
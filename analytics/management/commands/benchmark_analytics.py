@@ -0,0 +1,356 @@
+import hashlib
+import random
+import statistics
+import time
+import uuid
+from datetime import date
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import DecimalField, Sum
+from django.db.models.functions import Cast
+from django.test import Client
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from analytics import columnar, queries, timeseries
+from analytics.fastpath import serialize_values
+from analytics.money import from_micros, sum_micros
+from analytics.models import Platform, RoyaltyStatement, Track
+from analytics.renderers import FastJSONRenderer
+from analytics.search import search_catalog
+from analytics.serializers import MicroAmountField, RoyaltyStatementSerializer
+from analytics.rollups import mark_artist_data_changed, rebuild_artist_rollups
+
+DASHBOARD_ENDPOINTS = [
+    '/api/artist/dashboard-summary',
+    '/api/streams/total',
+    '/api/revenue/total',
+    '/api/streams/by-platform',
+    '/api/streams/by-territory',
+    '/api/streams/over-time',
+    '/api/streams/top-tracks',
+]
+
+
+class _Rollback(Exception):
+    pass
+
+
+# Scenarios that build their own scratch data instead of a seeded artist
+UNSEEDED_SCENARIOS = {'dedup_keys'}
+
+
+# Weighted toward a few big markets, like real store reports
+SEED_TERRITORIES = ['US', 'US', 'US', 'GB', 'GB', 'DE', 'BR', 'FR', 'JP', 'MX', 'SE', 'NG']
+
+TRACK_WORDS = ['love', 'night', 'summer', 'city', 'dream', 'fire', 'heart', 'river', 'gold', 'blue', 'dance',
+               'midnight', 'shadow', 'light', 'rain', 'road', 'home', 'wild', 'echo', 'storm']
+
+
+def _track_name(i):
+    words = len(TRACK_WORDS)
+    return f'{TRACK_WORDS[i % words].title()} {TRACK_WORDS[(i * 7 + 3) % words]} {i}'
+
+
+def seed_artist(rows, tracks=200, platforms=8, months=36):
+    """Create a throwaway artist with `rows` synthetic royalty statements."""
+    suffix = uuid.uuid4().hex[:12]
+    artist = get_user_model().objects.create_user(
+        username=f'bench-{suffix}', email=f'bench-{suffix}@example.com', password=uuid.uuid4().hex
+    )
+    platform_objs = [
+        Platform.objects.get_or_create(name=f'Bench Platform {i}', defaults={'api_name': f'bench_platform_{i}'})[0]
+        for i in range(platforms)
+    ]
+    track_objs = Track.objects.bulk_create(
+        [Track(artist=artist, name=_track_name(i)) for i in range(tracks)], batch_size=5000
+    )
+    if connection.vendor == 'postgresql':
+        _seed_statements_sql(artist, track_objs, platform_objs, rows, months, suffix)
+        return artist
+
+    rng = random.Random(42)
+    batch = []
+    for i in range(rows):
+        month = i % months
+        period_end = date(2022 + month // 12, month % 12 + 1, 28)
+        batch.append(RoyaltyStatement(
+            artist=artist,
+            track=track_objs[rng.randrange(tracks)],
+            platform=platform_objs[rng.randrange(platforms)],
+            period_start=period_end.replace(day=1),
+            period_end=period_end,
+            streams=rng.randint(0, 5000),
+            revenue_micros=rng.randint(0, 500000) * 100,
+            territory=rng.choice(SEED_TERRITORIES),
+            row_key=uuid.uuid4(),
+        ))
+        if len(batch) >= 5000:
+            RoyaltyStatement.objects.bulk_create(batch)
+            batch = []
+    RoyaltyStatement.objects.bulk_create(batch)
+    return artist
+
+
+def _seed_statements_sql(artist, tracks, platforms, rows, months, suffix):
+    """Server-side generate_series insert; seeds 10M rows in minutes instead of hours."""
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO analytics_royaltystatement
+                (artist_id, track_id, platform_id, period_start, period_end, streams, revenue_micros,
+                 currency, territory, row_key, created_at)
+            SELECT %(artist)s,
+                   (%(tracks)s::bigint[])[1 + (i * 7919) %% %(track_count)s],
+                   (%(platforms)s::bigint[])[1 + (i * 104729) %% %(platform_count)s],
+                   make_date(2022 + (i %% %(months)s) / 12, 1 + (i %% %(months)s) %% 12, 1),
+                   make_date(2022 + (i %% %(months)s) / 12, 1 + (i %% %(months)s) %% 12, 28),
+                   (i * 31) %% 5000,
+                   ((i * 17) %% 500000) * 100,
+                   'USD',
+                   (%(territories)s::text[])[1 + (i * 6007) %% %(territory_count)s],
+                   md5(%(suffix)s || '-' || i)::uuid,
+                   now()
+            FROM generate_series(0, %(rows)s - 1) AS i
+        """, {
+            'artist': artist.pk,
+            'tracks': [t.id for t in tracks], 'track_count': len(tracks),
+            'platforms': [p.id for p in platforms], 'platform_count': len(platforms),
+            'territories': SEED_TERRITORIES, 'territory_count': len(SEED_TERRITORIES),
+            'months': months, 'suffix': suffix, 'rows': rows,
+        })
+        cursor.execute('ANALYZE analytics_royaltystatement')
+
+
+def timed(func, iterations, tail=95):
+    """Run func `iterations` times; return (median_ms, tail-percentile ms)."""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * tail / 100))]
+
+
+class Command(BaseCommand):
+    help = "Benchmark analytics code paths against a throwaway synthetic artist (rolled back afterwards)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=[
+            'dashboard', 'aggregates', 'engine', 'serialization', 'fields', 'search', 'dedup_keys', 'revenue',
+        ])
+        parser.add_argument('--rows', type=int, default=50000)
+        parser.add_argument('--tracks', type=int, default=200)
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--rollups', action='store_true', help="Build rollups before measuring")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options['scenario'] in UNSEEDED_SCENARIOS:
+                    getattr(self, f"bench_{options['scenario']}")(None, options)
+                    raise _Rollback
+                self.stdout.write(f"Seeding {options['rows']} statements over {options['tracks']} tracks...")
+                artist = seed_artist(options['rows'], tracks=options['tracks'])
+                if options['rollups']:
+                    mark_artist_data_changed(artist.id)
+                    rebuild_artist_rollups(artist.id)
+                getattr(self, f"bench_{options['scenario']}")(artist, options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _client(self, artist):
+        token = RefreshToken.for_user(artist).access_token
+        return Client(HTTP_AUTHORIZATION=f'Bearer {token}', HTTP_HOST='localhost')
+
+    def report(self, label, median, tail, tail_label='p95'):
+        self.stdout.write(f"{label:<40} median {median:9.2f} ms   {tail_label} {tail:9.2f} ms")
+
+    def bench_dashboard(self, artist, options):
+        """Separate dashboard calls vs. one dashboard-bundle call."""
+        client = self._client(artist)
+
+        def separate():
+            for path in DASHBOARD_ENDPOINTS:
+                client.get(path, secure=True)
+
+        def bundle():
+            client.get('/api/artist/dashboard-bundle', secure=True)
+
+        self.report(f'{len(DASHBOARD_ENDPOINTS)} separate calls', *timed(separate, options['iterations']))
+        self.report('dashboard-bundle', *timed(bundle, options['iterations']))
+
+    def bench_aggregates(self, artist, options):
+        """The main analytics aggregates straight against RoyaltyStatement (index coverage)."""
+        statements = RoyaltyStatement.objects.filter(artist=artist)
+        queries = {
+            'totals': lambda: statements.aggregate(streams=Sum('streams'), revenue=Sum('revenue_micros')),
+            'by platform': lambda: list(statements.values('platform_id').annotate(
+                streams=Sum('streams'), revenue=Sum('revenue_micros'))),
+            'by track': lambda: list(statements.values('track_id').annotate(
+                streams=Sum('streams'), revenue=Sum('revenue_micros'))),
+            'by territory': lambda: list(statements.values('territory').annotate(
+                streams=Sum('streams'), revenue=Sum('revenue_micros'))),
+            'by platform, 6-month window': lambda: list(statements.filter(
+                period_end__gte=date(2023, 1, 1), period_end__lte=date(2023, 6, 30)
+            ).values('platform_id').annotate(streams=Sum('streams'), revenue=Sum('revenue_micros'))),
+        }
+        for label, query in queries.items():
+            self.report(label, *timed(query, options['iterations']))
+        if connection.vendor == 'postgresql':
+            # Shows whether the covering index is used and how many heap fetches it still needs
+            self.stdout.write(statements.values('platform_id').annotate(
+                streams=Sum('streams'), revenue=Sum('revenue_micros')).explain(analyze=True, buffers=True))
+
+    def bench_engine(self, artist, options):
+        """SQL engine vs. the in-process columnar engine for the same queries."""
+        columnar.column_cache.discard(artist.id)
+        self.report('columnar cold load', *timed(
+            lambda: columnar.ArtistColumns.load(artist.id, 0), max(1, options['iterations'] // 10)))
+        columnar.artist_columns(artist.id)
+        self.stdout.write(f"cached columns: {columnar.column_cache.nbytes / 1024 / 1024:.1f} MiB")
+
+        queries_by_label = {
+            'totals': lambda engine: queries.totals(artist.id, engine=engine),
+            'by platform': lambda engine: queries.platform_totals(artist.id, engine=engine),
+            'by territory': lambda engine: queries.territory_totals(artist.id, engine=engine),
+            'top 10 tracks': lambda engine: queries.top_tracks(artist.id, engine=engine),
+            'top 5 per platform': lambda engine: queries.top_tracks_per_platform(artist.id, engine=engine),
+            'monthly series by track': lambda engine: timeseries.time_series(
+                artist.id, 'month', 'track', engine=engine),
+        }
+        for label, query in queries_by_label.items():
+            for engine in ('sql', 'columnar'):
+                self.report(f'{label} [{engine}]', *timed(lambda: query(engine), options['iterations']))
+
+    def bench_serialization(self, artist, options):
+        """Per-row cost of the statement list: ModelSerializer + JSONRenderer vs. .values() + orjson."""
+        statements = RoyaltyStatement.objects.filter(artist=artist)
+        rows = statements.count()
+
+        def serializer_path():
+            JSONRenderer().render(RoyaltyStatementSerializer(
+                statements.select_related('artist', 'track', 'platform'), many=True).data)
+
+        def fast_path():
+            FastJSONRenderer().render(serialize_values(statements, RoyaltyStatementSerializer))
+
+        for label, func in [('serializer + JSONRenderer', serializer_path), ('values + FastJSONRenderer', fast_path)]:
+            median, p95 = timed(func, options['iterations'])
+            self.report(label, median, p95)
+            self.stdout.write(f"{'':<40} {median * 1000 / max(rows, 1):9.2f} us/row")
+
+    def bench_fields(self, artist, options):
+        """Statement list payload size and latency, full vs. sparse fieldsets."""
+        client = self._client(artist)
+        for fields in [None, 'id,period_end,platform_name,streams,revenue', 'period_end,streams,revenue']:
+            path = '/api/royalty-statements' + (f'?fields={fields}' if fields else '')
+            size = len(client.get(path, secure=True).content)
+            median, p95 = timed(lambda: client.get(path, secure=True), options['iterations'])
+            self.report(fields or 'all fields', median, p95)
+            self.stdout.write(f"{'':<40} {size / 1024:9.1f} KiB")
+
+    def bench_search(self, artist, options):
+        """Search latency per backend (use --tracks 100000 for the catalog-size target)."""
+        backends = ['memory'] + (['database'] if connection.vendor == 'postgresql' else [])
+        terms = ['lo', 'love', 'midnight ci', 'sumer', 'storm 12', 'xyz']
+        for backend in backends:
+            start = time.perf_counter()
+            search_catalog(artist.id, 'warm up', backend=backend)
+            self.stdout.write(f"{backend} first query (builds in-process index): "
+                              f"{(time.perf_counter() - start) * 1000:.0f} ms")
+            for term in terms:
+                self.report(f'{backend}: {term!r}', *timed(
+                    lambda: search_catalog(artist.id, term, backend=backend), options['iterations'], tail=99
+                ), tail_label='p99')
+
+    def bench_dedup_keys(self, artist, options):
+        """Dedup index size, insert throughput and probe latency: 64-char hex hash vs. per-artist uuid key.
+
+        Builds two scratch tables with --rows rows each (use --rows 10000000 for the 10M-row comparison),
+        inserted in batches so throughput can be seen falling as each index grows.
+        """
+        if connection.vendor != 'postgresql':
+            raise CommandError("The dedup_keys benchmark needs PostgreSQL (index sizes come from pg_relation_size).")
+        rows, batch = options['rows'], max(1, min(options['rows'], 1000000))
+        artists = 1000
+        layouts = {
+            'hex varchar(64) unique': (
+                'CREATE TEMP TABLE bench_dedup_hex (source_row_hash varchar(64) NOT NULL UNIQUE)',
+                "INSERT INTO bench_dedup_hex SELECT encode(sha256(('row-' || i)::bytea), 'hex') "
+                'FROM generate_series(%s, %s) AS i',
+                'SELECT count(*) FROM bench_dedup_hex WHERE source_row_hash = ANY(%s)',
+                lambda ids: [hashlib.sha256(f'row-{i}'.encode()).hexdigest() for i in ids],
+                'bench_dedup_hex',
+            ),
+            '(artist uuid, row_key uuid) unique': (
+                'CREATE TEMP TABLE bench_dedup_key (artist_id uuid NOT NULL, row_key uuid NOT NULL, '
+                'UNIQUE (artist_id, row_key))',
+                f"INSERT INTO bench_dedup_key SELECT md5('artist-' || (i %% {artists}))::uuid, "
+                "substr(encode(sha256(('row-' || i)::bytea), 'hex'), 1, 32)::uuid "
+                'FROM generate_series(%s, %s) AS i',
+                "SELECT count(*) FROM bench_dedup_key WHERE artist_id = md5('artist-' || %s)::uuid "
+                'AND row_key = ANY(%s::uuid[])',
+                lambda ids: [str(uuid.UUID(bytes=hashlib.sha256(f'row-{i}'.encode()).digest()[:16])) for i in ids],
+                'bench_dedup_key',
+            ),
+        }
+        rng = random.Random(7)
+        with connection.cursor() as cursor:
+            for label, (create, insert, probe, keys, table) in layouts.items():
+                cursor.execute(create)
+                total = 0.0
+                for start in range(0, rows, batch):
+                    began = time.perf_counter()
+                    cursor.execute(insert, [start, min(rows, start + batch) - 1])
+                    elapsed = time.perf_counter() - began
+                    total += elapsed
+                    self.stdout.write(f"{label:<40} rows {min(rows, start + batch):>10}   "
+                                      f"{batch / max(elapsed, 1e-9):12,.0f} rows/s")
+                cursor.execute(f'ANALYZE {table}')
+                cursor.execute(
+                    "SELECT coalesce(sum(pg_relation_size(indexrelid)), 0) FROM pg_index WHERE indrelid = %s::regclass",
+                    [table],
+                )
+                index_bytes = cursor.fetchone()[0]
+                self.stdout.write(f"{label:<40} overall {rows / max(total, 1e-9):12,.0f} rows/s   index "
+                                  f"{index_bytes / 1024 / 1024:9.1f} MiB ({index_bytes / max(rows, 1):.1f} B/row)")
+
+                # A 1000-row upload probe; the uuid layout probes one artist, as ingestion does
+                artist_id = rng.randrange(artists)
+                ids = [artist_id + artists * rng.randrange(max(1, rows // artists)) for _ in range(1000)]
+                params = [keys(ids)] if 'hex' in label else [artist_id, keys(ids)]
+                self.report(f'{label} probe x1000', *timed(
+                    lambda: cursor.execute(probe, params) or cursor.fetchone(), options['iterations']))
+
+    def bench_revenue(self, artist, options):
+        """Revenue as integer micros vs. Decimal: SQL sums, Python sums, columnar load and serialization."""
+        statements = RoyaltyStatement.objects.filter(artist=artist)
+        as_numeric = Cast('revenue_micros', DecimalField(max_digits=18, decimal_places=6))
+        self.report('SQL sum, numeric', *timed(
+            lambda: statements.aggregate(revenue=Sum(as_numeric)), options['iterations']))
+        self.report('SQL sum, bigint micros', *timed(
+            lambda: statements.aggregate(revenue=sum_micros('revenue_micros')), options['iterations']))
+
+        micros = list(statements.values_list('revenue_micros', flat=True).order_by())
+        decimals = [from_micros(value, places=4) for value in micros]
+        self.report('Python sum, Decimal', *timed(lambda: sum(decimals), options['iterations']))
+        self.report('Python sum, int micros', *timed(lambda: sum(micros), options['iterations']))
+        self.report('columnar load, Decimal.scaleb', *timed(
+            lambda: np.fromiter((int(value.scaleb(4)) for value in decimals), dtype=np.int64, count=len(decimals)),
+            options['iterations']))
+        self.report('columnar load, int micros', *timed(
+            lambda: np.array(micros, dtype=np.int64), options['iterations']))
+
+        decimal_field = serializers.DecimalField(max_digits=16, decimal_places=4)
+        micro_field = MicroAmountField(max_digits=16, decimal_places=4)
+        for label, func in [('serialize, DecimalField', lambda: [decimal_field.to_representation(v) for v in decimals]),
+                            ('serialize, MicroAmountField', lambda: [micro_field.to_representation(v) for v in micros])]:
+            median, p95 = timed(func, options['iterations'])
+            self.report(label, median, p95)
+            self.stdout.write(f"{'':<40} {median * 1000 / max(len(micros), 1):9.3f} us/value")
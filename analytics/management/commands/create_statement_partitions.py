@@ -0,0 +1,42 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from analytics.partitioning import (
+    convert_to_partitioned, create_partitions, is_partitioned, partition_interval, partitioning_enabled,
+)
+
+
+def _add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class Command(BaseCommand):
+    help = "Create RoyaltyStatement partitions ahead of time (run monthly from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3)
+        parser.add_argument('--convert', action='store_true',
+                            help="Convert the plain table to a partitioned one first")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Statement partitioning requires PostgreSQL.")
+        if not partitioning_enabled():
+            raise CommandError("Set ANALYTICS_PARTITION_STATEMENTS=True to manage statement partitions.")
+
+        with transaction.atomic():
+            if not is_partitioned():
+                if not options['convert']:
+                    raise CommandError("RoyaltyStatement is not partitioned yet; rerun with --convert.")
+                convert_to_partitioned()
+                self.stdout.write("Converted RoyaltyStatement to a partitioned table.")
+            today = date.today()
+            created = create_partitions(
+                date(today.year, today.month, 1), _add_months(today, options['months_ahead']), partition_interval()
+            )
+        for name in created:
+            self.stdout.write(f"Created {name}")
+        self.stdout.write(self.style.SUCCESS(f"{len(created)} partition(s) created."))
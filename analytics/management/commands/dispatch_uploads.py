@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from analytics.models import CsvUpload
+from analytics.scheduler import fail_stale_uploads, upload_scheduler
+
+
+class Command(BaseCommand):
+    help = (
+        "Fail uploads stuck in processing past ANALYTICS_UPLOAD_STALE_SECONDS and process the pending queue in "
+        "this process until it is empty (after a restart, or from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recover-only', action='store_true', help="Only fail stale uploads")
+
+    def handle(self, *args, **options):
+        failed = fail_stale_uploads()
+        self.stdout.write(f"Marked {failed} stale uploads failed.")
+        if options['recover_only']:
+            return
+        pending = CsvUpload.objects.filter(status='pending', queued_at__isnull=False)
+        before = pending.count()
+        upload_scheduler.dispatch(inline=True)
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {before - pending.count()} pending uploads, {pending.count()} left queued."
+        ))
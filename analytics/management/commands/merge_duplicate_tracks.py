@@ -0,0 +1,74 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, Count, When
+
+from analytics.hashing import rehash_statements
+from analytics.models import RoyaltyStatement, Track
+from analytics.rollups import mark_artist_data_changed, rebuild_artist_rollups
+
+METADATA_FIELDS = ['album_id', 'external_id', 'duration_seconds', 'track_number']
+REPOINT_BATCH = 500
+
+
+class Command(BaseCommand):
+    help = "Merge tracks whose names share a match key (platform name variants) into the oldest track."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--artist', help="Only merge this artist's tracks")
+        parser.add_argument('--dry-run', action='store_true', help="Report the merges without applying them")
+
+    def handle(self, *args, **options):
+        tracks = Track.objects.exclude(match_key='')
+        if options['artist']:
+            tracks = tracks.filter(artist_id=options['artist'])
+        groups = tracks.values('artist_id', 'match_key').annotate(n=Count('id')).filter(n__gt=1).order_by()
+
+        duplicates = defaultdict(list)  # artist_id -> [[canonical, duplicate, ...], ...]
+        for group in groups:
+            members = list(Track.objects.filter(artist_id=group['artist_id'], match_key=group['match_key'])
+                           .order_by('id'))
+            duplicates[group['artist_id']].append(members)
+
+        merged = 0
+        for artist_id, artist_groups in duplicates.items():
+            for canonical, *others in artist_groups:
+                names = ', '.join(repr(track.name) for track in others)
+                self.stdout.write(f"artist {artist_id}: {canonical.name!r} <- {names}")
+                merged += len(others)
+            if not options['dry_run']:
+                self._merge(artist_id, artist_groups)
+
+        verb = "Would merge" if options['dry_run'] else "Merged"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {merged} duplicate tracks for {len(duplicates)} artists."))
+
+    def _merge(self, artist_id, groups):
+        target = {track.id: canonical.id for canonical, *others in groups for track in others}
+        with transaction.atomic():
+            duplicate_ids = list(target)
+            for i in range(0, len(duplicate_ids), REPOINT_BATCH):
+                batch = duplicate_ids[i:i + REPOINT_BATCH]
+                RoyaltyStatement.objects.filter(track_id__in=batch).update(track_id=Case(
+                    *[When(track_id=pk, then=target[pk]) for pk in batch], output_field=BigIntegerField(),
+                ))
+
+            # Row keys include the track id
+            rehash_statements(RoyaltyStatement.objects.filter(track_id__in=set(target.values())))
+
+            for canonical, *others in groups:
+                # Fill metadata the canonical track is missing from its variants
+                changed = []
+                for field in METADATA_FIELDS:
+                    if getattr(canonical, field) is None:
+                        value = next((getattr(t, field) for t in others if getattr(t, field) is not None), None)
+                        if value is not None:
+                            setattr(canonical, field, value)
+                            changed.append(field)
+                if changed:
+                    Track.objects.filter(pk=canonical.pk).update(**{f: getattr(canonical, f) for f in changed})
+
+            # Rollup rows of the duplicates cascade away here and are rebuilt below
+            Track.objects.filter(id__in=duplicate_ids).delete()
+            mark_artist_data_changed(artist_id)
+        rebuild_artist_rollups(artist_id)
@@ -0,0 +1,34 @@
+"""Normalized track identity.
+
+Platforms report the same recording under slightly different names ("Song
+Title", "Song Title (feat. X)", "song title - Remastered 2011"). The match key
+folds those variants together so ingestion resolves them to one Track.
+"""
+import re
+import unicodedata
+
+_FEATURING = r'(?:feat\.?|ft\.?|featuring)\s'
+_VERSION = (
+    r'(?:\d{4}\s+)?(?:digital(?:ly)?\s+)?re-?master(?:ed)?(?:\s+\d{4})?(?:\s+version)?'
+    r'|radio\s+edit|single\s+version|album\s+version|explicit(?:\s+version)?|clean(?:\s+version)?'
+)
+# One bracket group at a time: "Song (feat. X) (Live)" keeps its "(Live)"
+_BRACKETED = re.compile(rf'[(\[]\s*(?:(?:{_FEATURING}|with\s)[^)\]]*|{_VERSION})\s*[)\]]')
+# "with" only counts inside brackets: "Song - With You" is a title
+_DASH_SUFFIX = re.compile(rf'\s+-\s+(?:{_FEATURING}.*|{_VERSION})\s*$')
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def track_match_key(name):
+    """Case-, accent- and punctuation-insensitive key with feat./remaster suffixes removed.
+
+    Featured artists are only removed in brackets or after " - ".
+    """
+    text = unicodedata.normalize('NFKD', str(name or ''))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).casefold().replace('&', ' and ')
+    stripped = _BRACKETED.sub(' ', text)
+    # A bare "ft." is left alone ("Welcome to Ft. Lauderdale")
+    stripped = _DASH_SUFFIX.sub('', stripped)
+    key = _NON_WORD.sub(' ', stripped).strip()
+    # A title that is nothing but a suffix keeps its own text rather than collapsing to ''
+    return (key or _NON_WORD.sub(' ', text).strip())[:255]
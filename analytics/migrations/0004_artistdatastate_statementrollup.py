@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-18 23:28
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0003_dataexport'),
+        ('user', '0003_alter_customuser_avatar_url'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArtistDataState',
+            fields=[
+                ('artist', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='data_state', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('rollup_version', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StatementRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('streams', models.BigIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=4, default=0, max_digits=16)),
+                ('statement_count', models.IntegerField(default=0)),
+                ('artist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statement_rollups', to=settings.AUTH_USER_MODEL)),
+                ('platform', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='analytics.platform')),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='analytics.track')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['artist', 'month'], name='analytics_s_artist__4c5b7f_idx')],
+                'unique_together': {('artist', 'track', 'platform', 'month')},
+            },
+        ),
+    ]
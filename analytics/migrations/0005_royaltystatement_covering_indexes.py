@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 23:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_artistdatastate_statementrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='royaltystatement',
+            index=models.Index(fields=['artist', 'period_end'], include=('streams', 'revenue', 'platform', 'track'), name='stmt_artist_period_cov_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='royaltystatement',
+            index=models.Index(fields=['artist', 'track'], include=('streams', 'revenue', 'platform', 'period_end'), name='stmt_artist_track_cov_idx'),
+        ),
+        # Superseded by the covering (artist, period_end) index above
+        migrations.RemoveIndex(
+            model_name='royaltystatement',
+            name='analytics_r_artist__cec831_idx',
+        ),
+    ]
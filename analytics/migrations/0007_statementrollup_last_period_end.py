@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-18 23:52
+
+from django.db import migrations, models
+
+
+def invalidate_rollups(apps, schema_editor):
+    # Existing rollups have no last_period_end; serve from statements until the next rebuild
+    apps.get_model('analytics', 'ArtistDataState').objects.update(rollup_version=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0006_partition_royaltystatement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='statementrollup',
+            name='last_period_end',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.RunPython(invalidate_rollups, migrations.RunPython.noop),
+    ]
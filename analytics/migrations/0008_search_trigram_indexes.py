@@ -0,0 +1,43 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# (table, column); each gets a GIN index for trigram word similarity (<%) and
+# one on UPPER(column) for the icontains/istartswith filters Django emits
+SEARCH_COLUMNS = [
+    ('analytics_track', 'name'),
+    ('analytics_album', 'title'),
+    ('analytics_platform', 'name'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column in SEARCH_COLUMNS:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {table}_{column}_trgm ON {table} USING gin ({column} gin_trgm_ops)'
+        )
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {table}_{column}_upper_trgm ON {table} '
+            f'USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column in SEARCH_COLUMNS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {table}_{column}_trgm')
+        schema_editor.execute(f'DROP INDEX IF EXISTS {table}_{column}_upper_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0007_statementrollup_last_period_end'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
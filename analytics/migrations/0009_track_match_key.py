@@ -0,0 +1,63 @@
+# Generated by Django 5.2.6 on 2026-10-18 23:56
+
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Frozen copy of analytics.matching.track_match_key as of this migration, so
+# later changes to the live function do not change what it writes (0018
+# recomputes the keys with the current rules).
+_FEATURING = r'(?:feat\.?|ft\.?|featuring|with)\s.*'
+_VERSION = (
+    r'(?:\d{4}\s+)?(?:digital(?:ly)?\s+)?re-?master(?:ed)?(?:\s+\d{4})?(?:\s+version)?'
+    r'|radio\s+edit|single\s+version|album\s+version|explicit(?:\s+version)?|clean(?:\s+version)?'
+)
+_BRACKETED = re.compile(rf'[(\[]\s*(?:{_FEATURING}|{_VERSION})\s*[)\]]')
+_DASH_SUFFIX = re.compile(rf'\s+-\s+(?:{_FEATURING}|{_VERSION})\s*$')
+_TRAILING_FEATURING = re.compile(r'\s+(?:feat\.?|ft\.?|featuring)\s.*$')
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def track_match_key(name):
+    text = unicodedata.normalize('NFKD', str(name or ''))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).casefold().replace('&', ' and ')
+    stripped = _BRACKETED.sub(' ', text)
+    stripped = _DASH_SUFFIX.sub('', stripped)
+    stripped = _TRAILING_FEATURING.sub('', stripped)
+    key = _NON_WORD.sub(' ', stripped).strip()
+    return (key or _NON_WORD.sub(' ', text).strip())[:255]
+
+
+def backfill_match_keys(apps, schema_editor):
+    Track = apps.get_model('analytics', 'Track')
+    batch = []
+    for track in Track.objects.only('id', 'name').iterator(chunk_size=2000):
+        track.match_key = track_match_key(track.name)
+        batch.append(track)
+        if len(batch) >= 2000:
+            Track.objects.bulk_update(batch, ['match_key'])
+            batch = []
+    Track.objects.bulk_update(batch, ['match_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0008_search_trigram_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='match_key',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(fields=['artist', 'match_key'], name='analytics_t_artist__10e503_idx'),
+        ),
+        migrations.RunPython(backfill_match_keys, migrations.RunPython.noop),
+    ]
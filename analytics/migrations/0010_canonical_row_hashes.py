@@ -0,0 +1,67 @@
+import hashlib
+from decimal import ROUND_HALF_EVEN, Decimal
+
+import pandas as pd
+from django.db import migrations
+
+# Frozen copy of the analytics.hashing rules this migration was written with (hex SHA-256 of
+# artist|track|platform|YYYY-MM-DD|streams|revenue_units|CURRENCY over the decimal revenue column), so
+# later changes to the live module do not change what it writes.
+REVENUE_SCALE = 10000
+HASH_COLUMNS = ['artist_id', 'track_id', 'platform_id', 'period_end', 'streams', 'revenue', 'currency']
+CHUNK_SIZE = 2000
+
+
+def revenue_units(value):
+    return int((Decimal(value) * REVENUE_SCALE).to_integral_value(ROUND_HALF_EVEN))
+
+
+def _period(value):
+    return (value.isoformat() if hasattr(value, 'isoformat') else str(value))[:10]
+
+
+def _currency(value):
+    if value is None or (isinstance(value, float) and value != value):
+        return 'USD'
+    return str(value).strip().upper() or 'USD'
+
+
+def row_hash(row):
+    values = [row['artist_id'], row['track_id'], row['platform_id'], _period(row['period_end']),
+              int(row['streams']), revenue_units(row['revenue']), _currency(row['currency'])]
+    return hashlib.sha256('|'.join(str(value) for value in values).encode()).hexdigest()
+
+
+def backfill_row_hashes(apps, schema_editor):
+    """Rewrite source_row_hash to the canonical hash; rows whose hash another row already holds keep theirs."""
+    RoyaltyStatement = apps.get_model('analytics', 'RoyaltyStatement')
+    columns = ['id', 'source_row_hash'] + HASH_COLUMNS
+    last_id = 0
+    while True:
+        rows = RoyaltyStatement.objects.filter(id__gt=last_id).order_by('id').values(*columns)[:CHUNK_SIZE]
+        chunk = pd.DataFrame.from_records(list(rows), columns=columns)
+        if chunk.empty:
+            return
+        last_id = int(chunk['id'].iloc[-1])
+        chunk['canonical'] = [row_hash(row) for row in chunk.to_dict('records')]
+        chunk = chunk[chunk['canonical'] != chunk['source_row_hash']]
+        first = ~chunk['canonical'].duplicated()
+        taken = set(RoyaltyStatement.objects.filter(
+            source_row_hash__in=chunk['canonical'].tolist()
+        ).values_list('source_row_hash', flat=True))
+        keep = first & ~chunk['canonical'].isin(taken)
+        RoyaltyStatement.objects.bulk_update([
+            RoyaltyStatement(id=int(pk), source_row_hash=value)
+            for pk, value in zip(chunk.loc[keep, 'id'], chunk.loc[keep, 'canonical'])
+        ], ['source_row_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0009_track_match_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_row_hashes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,202 @@
+import hashlib
+import re
+import uuid
+from decimal import ROUND_HALF_EVEN, Decimal
+
+from django.db import migrations, models, transaction
+
+TABLE = 'analytics_royaltystatement'
+CONSTRAINT = 'stmt_artist_row_key_uniq'
+HASH_CONSTRAINT = f'{TABLE}_source_row_hash_key'
+HEX_HASH = re.compile(r'[0-9a-f]{64}')
+SQL_BATCH = 50000
+ORM_BATCH = 2000
+
+
+def is_partitioned(connection):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [TABLE])
+        row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def key_from_hash(value):
+    """Canonical hex hashes keep their first 128 bits (the same key analytics.hashing computes); others are hashed."""
+    if HEX_HASH.fullmatch(value):
+        return uuid.UUID(hex=value[:32])
+    return uuid.UUID(bytes=hashlib.sha256(value.encode()).digest()[:16])
+
+
+def backfill_row_keys(apps, schema_editor):
+    """Fill row_key from source_row_hash in id-range batches, one short transaction each."""
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT min(id), max(id) FROM {TABLE}')
+            first, last = cursor.fetchone()
+        for start in range(first or 0, (last or -1) + 1, SQL_BATCH):
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                cursor.execute(f"""
+                    UPDATE {TABLE} SET row_key = CASE
+                        WHEN source_row_hash ~ '^[0-9a-f]{{64}}$' THEN substr(source_row_hash, 1, 32)::uuid
+                        ELSE substr(encode(sha256(convert_to(source_row_hash, 'UTF8')), 'hex'), 1, 32)::uuid
+                    END
+                    WHERE id >= %s AND id < %s AND row_key IS NULL
+                """, [start, start + SQL_BATCH])
+        return
+
+    RoyaltyStatement = apps.get_model('analytics', 'RoyaltyStatement')
+    pending = RoyaltyStatement.objects.using(connection.alias).filter(row_key__isnull=True).order_by('id')
+    while True:
+        batch = list(pending.only('id', 'source_row_hash')[:ORM_BATCH])
+        if not batch:
+            return
+        for statement in batch:
+            statement.row_key = key_from_hash(statement.source_row_hash)
+        with transaction.atomic(using=connection.alias):
+            RoyaltyStatement.objects.using(connection.alias).bulk_update(batch, ['row_key'])
+
+
+def source_row_hash(statement):
+    """The hex SHA-256 0010 stored: artist|track|platform|YYYY-MM-DD|streams|revenue_units|CURRENCY."""
+    units = int((Decimal(statement.revenue) * 10000).to_integral_value(ROUND_HALF_EVEN))
+    currency = (statement.currency or '').strip().upper() or 'USD'
+    text = '|'.join(str(value) for value in [
+        statement.artist_id, statement.track_id, statement.platform_id, statement.period_end.isoformat()[:10],
+        int(statement.streams), units, currency,
+    ])
+    value = hashlib.sha256(text.encode()).hexdigest()
+    if key_from_hash(value) != statement.row_key:
+        # A duplicate that kept a legacy hash, or a row keyed on data this hash does not cover (territory):
+        # derive a value from its unique (artist, row_key) instead
+        value = hashlib.sha256(f'row_key|{statement.artist_id}|{statement.row_key}'.encode()).hexdigest()
+    return value
+
+
+def rebuild_source_row_hashes(apps, schema_editor):
+    """Reverse of dropping source_row_hash: refill it from the row content in id-order batches."""
+    connection = schema_editor.connection
+    RoyaltyStatement = apps.get_model('analytics', 'RoyaltyStatement')
+    manager = RoyaltyStatement._base_manager.using(connection.alias)
+    last_id = 0
+    while True:
+        batch = list(manager.filter(id__gt=last_id).order_by('id')[:ORM_BATCH])
+        if not batch:
+            return
+        for statement in batch:
+            statement.source_row_hash = source_row_hash(statement)
+        with transaction.atomic(using=connection.alias):
+            manager.bulk_update(batch, ['source_row_hash'])
+        last_id = batch[-1].id
+
+
+def _source_row_hash_field(model, **options):
+    field = models.CharField(max_length=64, **options)
+    field.set_attributes_from_name('source_row_hash')
+    field.model = model
+    return field
+
+
+def loosen_source_row_hash(apps, schema_editor):
+    """Make source_row_hash nullable and non-unique (SQLite cannot drop a unique column)."""
+    if is_partitioned(schema_editor.connection):
+        # Dropping the column takes its (source_row_hash, period_end) constraint with it
+        schema_editor.execute(f'ALTER TABLE {TABLE} ALTER COLUMN source_row_hash DROP NOT NULL')
+        return
+    model = apps.get_model('analytics', 'RoyaltyStatement')
+    tight, loose = _source_row_hash_field(model, unique=True), _source_row_hash_field(model, null=True)
+    schema_editor.alter_field(model, tight, loose)
+
+
+def tighten_source_row_hash(apps, schema_editor):
+    """Restore source_row_hash as NOT NULL and unique once it is filled again."""
+    if is_partitioned(schema_editor.connection):
+        # Unique constraints on a partitioned table must include the partition column
+        schema_editor.execute(f'ALTER TABLE {TABLE} ALTER COLUMN source_row_hash SET NOT NULL')
+        schema_editor.execute(
+            f'ALTER TABLE {TABLE} ADD CONSTRAINT {HASH_CONSTRAINT} UNIQUE (source_row_hash, period_end)'
+        )
+        return
+    model = apps.get_model('analytics', 'RoyaltyStatement')
+    loose, tight = _source_row_hash_field(model, null=True), _source_row_hash_field(model, unique=True)
+    schema_editor.alter_field(model, loose, tight)
+
+
+def _constraint():
+    return models.UniqueConstraint(fields=['artist', 'row_key'], name=CONSTRAINT)
+
+
+def add_row_key_constraint(apps, schema_editor):
+    """Build the unique index without blocking writes where PostgreSQL allows it."""
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        schema_editor.add_constraint(apps.get_model('analytics', 'RoyaltyStatement'), _constraint())
+    elif is_partitioned(connection):
+        # CONCURRENTLY is not available on partitioned tables; the key must include the partition column
+        schema_editor.execute(
+            f'ALTER TABLE {TABLE} ADD CONSTRAINT {CONSTRAINT} UNIQUE (artist_id, row_key, period_end)'
+        )
+    else:
+        schema_editor.execute(
+            f'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {CONSTRAINT} ON {TABLE} (artist_id, row_key)'
+        )
+        schema_editor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {CONSTRAINT} UNIQUE USING INDEX {CONSTRAINT}')
+
+
+def remove_row_key_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'ALTER TABLE {TABLE} DROP CONSTRAINT IF EXISTS {CONSTRAINT}')
+    else:
+        schema_editor.remove_constraint(apps.get_model('analytics', 'RoyaltyStatement'), _constraint())
+
+
+class Migration(migrations.Migration):
+    # Backfill batches and CREATE INDEX CONCURRENTLY each run outside one big transaction
+    atomic = False
+
+    dependencies = [
+        ('analytics', '0010_canonical_row_hashes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='royaltystatement',
+            name='row_key',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_row_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='royaltystatement',
+            name='row_key',
+            field=models.UUIDField(editable=False),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddConstraint(model_name='royaltystatement', constraint=_constraint()),
+            ],
+            database_operations=[
+                migrations.RunPython(add_row_key_constraint, remove_row_key_constraint),
+            ],
+        ),
+        # Loosened before it is dropped, so on the way back source_row_hash is re-added nullable, refilled and
+        # only then made NOT NULL and unique: the migration reverses on a populated table
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='royaltystatement',
+                    name='source_row_hash',
+                    field=models.CharField(max_length=64, null=True),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(loosen_source_row_hash, tighten_source_row_hash),
+            ],
+        ),
+        migrations.RunPython(migrations.RunPython.noop, rebuild_source_row_hashes),
+        migrations.RemoveField(
+            model_name='royaltystatement',
+            name='source_row_hash',
+        ),
+    ]
@@ -0,0 +1,117 @@
+from decimal import ROUND_HALF_EVEN, Decimal
+
+from django.db import migrations, models, transaction
+
+# Frozen copies of the analytics.money converters this migration was written with, so later
+# changes to the live module do not change what it writes. Values come from the decimal columns.
+MICROS = 1_000_000
+
+SQL_BATCH = 50000
+ORM_BATCH = 2000
+MODELS = ['RoyaltyStatement', 'StatementRollup']
+
+
+def to_micros(value):
+    if value is None:
+        return 0
+    return int(Decimal(value).scaleb(6).to_integral_value(ROUND_HALF_EVEN))
+
+
+def from_micros(micros, places):
+    return Decimal(int(micros or 0)).scaleb(-6).quantize(Decimal(1).scaleb(-places), rounding=ROUND_HALF_EVEN)
+
+
+def _copy(apps, schema_editor, source, target, convert, sql):
+    """Fill `target` from `source` in id-range batches, one short transaction each."""
+    connection = schema_editor.connection
+    for name in MODELS:
+        model = apps.get_model('analytics', name)
+        manager = model._base_manager.using(connection.alias)
+        if connection.vendor == 'postgresql':
+            table = model._meta.db_table
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT min(id), max(id) FROM {table}')
+                first, last = cursor.fetchone()
+            for start in range(first or 0, (last or -1) + 1, SQL_BATCH):
+                with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                    cursor.execute(f'UPDATE {table} SET {target} = {sql} WHERE id >= %s AND id < %s',
+                                   [start, start + SQL_BATCH])
+            continue
+        last_id = 0
+        while True:
+            batch = list(manager.filter(id__gt=last_id).order_by('id').only('id', source)[:ORM_BATCH])
+            if not batch:
+                break
+            for row in batch:
+                setattr(row, target, convert(getattr(row, source)))
+            with transaction.atomic(using=connection.alias):
+                manager.bulk_update(batch, [target])
+            last_id = batch[-1].id
+
+
+def revenue_to_micros(apps, schema_editor):
+    _copy(apps, schema_editor, 'revenue', 'revenue_micros', to_micros, f'round(revenue * {MICROS})::bigint')
+
+
+def micros_to_revenue(apps, schema_editor):
+    # Back to the old 4-place column; anything finer than 0.0001 is rounded half-even
+    _copy(apps, schema_editor, 'revenue_micros', 'revenue', lambda micros: from_micros(micros, places=4),
+          f'round(revenue_micros::numeric / {MICROS}, 4)')
+
+
+class Migration(migrations.Migration):
+    # Backfill batches each commit on their own instead of holding one long transaction
+    atomic = False
+
+    dependencies = [
+        ('analytics', '0011_royaltystatement_row_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='royaltystatement',
+            name='revenue_micros',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='statementrollup',
+            name='revenue_micros',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.RunPython(revenue_to_micros, micros_to_revenue),
+        migrations.AlterField(
+            model_name='royaltystatement',
+            name='revenue_micros',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='statementrollup',
+            name='revenue_micros',
+            field=models.BigIntegerField(default=0),
+        ),
+        # Covering indexes now carry the integer column
+        migrations.RemoveIndex(
+            model_name='royaltystatement',
+            name='stmt_artist_period_cov_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='royaltystatement',
+            name='stmt_artist_track_cov_idx',
+        ),
+        migrations.AddIndex(
+            model_name='royaltystatement',
+            index=models.Index(fields=['artist', 'period_end'], include=('streams', 'revenue_micros', 'platform', 'track'), name='stmt_artist_period_cov_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='royaltystatement',
+            index=models.Index(fields=['artist', 'track'], include=('streams', 'revenue_micros', 'platform', 'period_end'), name='stmt_artist_track_cov_idx'),
+        ),
+        migrations.RemoveField(
+            model_name='royaltystatement',
+            name='revenue',
+        ),
+        migrations.RemoveField(
+            model_name='statementrollup',
+            name='revenue',
+        ),
+    ]
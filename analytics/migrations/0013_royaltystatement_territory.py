@@ -0,0 +1,99 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+TABLE = 'analytics_royaltystatement'
+INDEX = 'stmt_artist_territory_cov_idx'
+
+
+def is_partitioned(connection):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [TABLE])
+        row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def _index():
+    return models.Index(fields=['artist', 'territory', 'period_end'], include=('streams', 'revenue_micros'), name=INDEX)
+
+
+def add_territory_index(apps, schema_editor):
+    """Build the covering index without blocking writes where PostgreSQL allows it."""
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        schema_editor.add_index(apps.get_model('analytics', 'RoyaltyStatement'), _index())
+        return
+    # CONCURRENTLY is not available on partitioned tables
+    concurrently = '' if is_partitioned(connection) else 'CONCURRENTLY '
+    schema_editor.execute(
+        f'CREATE INDEX {concurrently}IF NOT EXISTS {INDEX} ON {TABLE} (artist_id, territory, period_end) '
+        f'INCLUDE (streams, revenue_micros)'
+    )
+
+
+def remove_territory_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX}')
+    else:
+        schema_editor.remove_index(apps.get_model('analytics', 'RoyaltyStatement'), _index())
+
+
+def seed_territory_rollups(apps, schema_editor):
+    # Every existing statement is in the unknown territory, so current rollups fold into one row per month
+    StatementRollup = apps.get_model('analytics', 'StatementRollup')
+    TerritoryRollup = apps.get_model('analytics', 'TerritoryRollup')
+    monthly = StatementRollup.objects.values('artist_id', 'month').annotate(
+        total_streams=models.Sum('streams'), total_revenue=models.Sum('revenue_micros'),
+        row_count=models.Sum('statement_count'),
+    ).order_by()
+    TerritoryRollup.objects.bulk_create([
+        TerritoryRollup(
+            artist_id=row['artist_id'], territory='ZZ', month=row['month'], streams=row['total_streams'] or 0,
+            revenue_micros=int(row['total_revenue'] or 0), statement_count=row['row_count'] or 0,
+        )
+        for row in monthly.iterator(chunk_size=2000)
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('analytics', '0012_revenue_micros'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='royaltystatement',
+            name='territory',
+            field=models.CharField(default='ZZ', max_length=2),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name='royaltystatement', index=_index()),
+            ],
+            database_operations=[
+                migrations.RunPython(add_territory_index, remove_territory_index),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TerritoryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('territory', models.CharField(max_length=2)),
+                ('month', models.DateField()),
+                ('streams', models.BigIntegerField(default=0)),
+                ('revenue_micros', models.BigIntegerField(default=0)),
+                ('statement_count', models.IntegerField(default=0)),
+                ('artist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='territory_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('artist', 'territory', 'month')},
+            },
+        ),
+        migrations.RunPython(seed_territory_rollups, migrations.RunPython.noop),
+    ]
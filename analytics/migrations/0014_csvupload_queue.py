@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-19 00:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0013_royaltystatement_territory'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='csvupload',
+            name='file',
+            field=models.FileField(blank=True, null=True, upload_to='uploads/%Y/%m/'),
+        ),
+        migrations.AddField(
+            model_name='csvupload',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='csvupload',
+            name='queued_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='csvupload',
+            name='size_bytes',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='csvupload',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='csvupload',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'processing'])), fields=['status', 'queued_at'], name='upload_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 00:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0014_csvupload_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='csvupload',
+            name='stage',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+    ]
@@ -0,0 +1,49 @@
+import re
+import unicodedata
+
+from django.db import migrations
+
+# Frozen copy of analytics.matching.track_match_key: feat./ft. only in brackets or after " - ", one
+# bracket group at a time, and "with" only in brackets.
+_FEATURING = r'(?:feat\.?|ft\.?|featuring)\s'
+_VERSION = (
+    r'(?:\d{4}\s+)?(?:digital(?:ly)?\s+)?re-?master(?:ed)?(?:\s+\d{4})?(?:\s+version)?'
+    r'|radio\s+edit|single\s+version|album\s+version|explicit(?:\s+version)?|clean(?:\s+version)?'
+)
+_BRACKETED = re.compile(rf'[(\[]\s*(?:(?:{_FEATURING}|with\s)[^)\]]*|{_VERSION})\s*[)\]]')
+_DASH_SUFFIX = re.compile(rf'\s+-\s+(?:{_FEATURING}.*|{_VERSION})\s*$')
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def track_match_key(name):
+    text = unicodedata.normalize('NFKD', str(name or ''))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).casefold().replace('&', ' and ')
+    stripped = _DASH_SUFFIX.sub('', _BRACKETED.sub(' ', text))
+    key = _NON_WORD.sub(' ', stripped).strip()
+    return (key or _NON_WORD.sub(' ', text).strip())[:255]
+
+
+def recompute_match_keys(apps, schema_editor):
+    """Rewrite keys the earlier rules over-merged ("Song (feat. X) (Live)" was keyed like "Song")."""
+    Track = apps.get_model('analytics', 'Track')
+    batch = []
+    for track in Track.objects.only('id', 'name', 'match_key').iterator(chunk_size=2000):
+        key = track_match_key(track.name)
+        if key != track.match_key:
+            track.match_key = key
+            batch.append(track)
+        if len(batch) >= 2000:
+            Track.objects.bulk_update(batch, ['match_key'])
+            batch = []
+    Track.objects.bulk_update(batch, ['match_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0017_upload_batch'),
+    ]
+
+    operations = [
+        migrations.RunPython(recompute_match_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """Name the memory metrics for what they are: process-wide samples, not per-upload figures."""
+
+    dependencies = [
+        ('analytics', '0018_recompute_track_match_keys'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='csvupload',
+            old_name='peak_memory_bytes',
+            new_name='process_rss_peak_bytes',
+        ),
+        migrations.RenameField(
+            model_name='csvupload',
+            old_name='tracemalloc_peak_bytes',
+            new_name='process_tracemalloc_peak_bytes',
+        ),
+    ]
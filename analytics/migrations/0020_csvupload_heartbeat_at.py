@@ -0,0 +1,17 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """Judge stuck uploads by their last heartbeat instead of their start time."""
+
+    dependencies = [
+        ('analytics', '0019_csvupload_process_memory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='csvupload',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
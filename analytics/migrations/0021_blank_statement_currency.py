@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def blank_currency_to_usd(apps, schema_editor):
+    # Blank currency cells used to be stored as 'nan' while their row keys were computed with USD
+    RoyaltyStatement = apps.get_model('analytics', 'RoyaltyStatement')
+    RoyaltyStatement.objects.filter(currency__in=['nan', 'NaN', '']).update(currency='USD')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0020_csvupload_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(blank_currency_to_usd, migrations.RunPython.noop),
+    ]
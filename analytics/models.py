@@ -1,5 +1,21 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
+
+from .money import from_micros, to_micros
+
+
+class UploadBatch(models.Model):
+    """Several files uploaded in one request; each file is a child CsvUpload."""
+    artist = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_batches')
+    created_at = models.DateTimeField(auto_now_add=True)
+    file_count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Upload batch {self.id}: {self.file_count} files by {self.artist_id}"
 
 
 class CsvUpload(models.Model):
@@ -13,6 +29,7 @@ class CsvUpload(models.Model):
     ]
 
     artist = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='csv_uploads')
+    batch = models.ForeignKey(UploadBatch, on_delete=models.CASCADE, related_name='uploads', null=True, blank=True)
     filename = models.CharField(max_length=255)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=25, choices=UPLOAD_STATUS_CHOICES, default='pending')  # Changed to 25
@@ -21,9 +38,30 @@ class CsvUpload(models.Model):
     success_count = models.IntegerField(default=0)
     error_count = models.IntegerField(default=0)
     error_log = models.TextField(blank=True, null=True)
+    # Uploads are queued ('pending') and imported by analytics.scheduler
+    file = models.FileField(upload_to='uploads/%Y/%m/', blank=True, null=True)
+    size_bytes = models.BigIntegerField(default=0)
+    queued_at = models.DateTimeField(blank=True, null=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)  # last sign of life while processing
+    stage = models.CharField(max_length=20, blank=True, default='')  # while processing; see analytics.progress
+    # Import measurements; see analytics.instrumentation
+    stage_timings = models.JSONField(default=dict, blank=True)  # {stage: seconds}
+    duration_seconds = models.FloatField(blank=True, null=True)
+    rows_per_second = models.FloatField(blank=True, null=True)
+    # Process-wide samples (see analytics.instrumentation): uploads running alongside share them
+    process_rss_peak_bytes = models.BigIntegerField(blank=True, null=True)
+    process_tracemalloc_peak_bytes = models.BigIntegerField(blank=True, null=True)
 
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            # The scheduler's queue: only pending and processing uploads are indexed
+            models.Index(fields=['status', 'queued_at'], name='upload_queue_idx',
+                         condition=models.Q(status__in=['pending', 'processing'])),
+            models.Index(fields=['finished_at'], name='upload_finished_idx'),
+        ]
 
     def __str__(self):
         return f"CSV Upload: {self.filename} by {self.artist.username} ({self.status})"
@@ -74,15 +112,33 @@ class Track(models.Model):
     external_id = models.CharField(max_length=255, blank=True, null=True)
     duration_seconds = models.IntegerField(blank=True, null=True)
     track_number = models.IntegerField(blank=True, null=True)
+    match_key = models.CharField(max_length=255, blank=True, default='')  # see analytics.matching
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = ['artist', 'name']
         ordering = ['album', 'track_number', 'name']
+        indexes = [
+            models.Index(fields=['artist', 'match_key']),
+        ]
 
     def __str__(self):
         return f"{self.name} by {self.artist.username}"
 
+    def save(self, *args, **kwargs):
+        from .matching import track_match_key
+        self.match_key = track_match_key(self.name)
+        super().save(*args, **kwargs)
+
+
+class RoyaltyStatementQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        """bulk_create skips save(), so fill missing row keys here (see analytics.hashing)."""
+        from .hashing import assign_keys
+        objs = list(objs)
+        assign_keys([obj for obj in objs if obj.row_key is None])
+        return super().bulk_create(objs, *args, **kwargs)
+
 
 class RoyaltyStatement(models.Model):
     artist = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='royalty_statements')
@@ -93,28 +149,135 @@ class RoyaltyStatement(models.Model):
     period_start = models.DateField()
     period_end = models.DateField()
     streams = models.IntegerField(default=0)
-    revenue = models.DecimalField(max_digits=12, decimal_places=4, default=0.0)
+    revenue_micros = models.BigIntegerField(default=0)  # integer millionths; see analytics.money
     currency = models.CharField(max_length=3, default='USD')
-    source_row_hash = models.CharField(max_length=64, unique=True)
+    territory = models.CharField(max_length=2, default='ZZ')  # ISO 3166-1 alpha-2; see analytics.territories
+    row_key = models.UUIDField(editable=False)  # dedup key, unique per artist; see analytics.hashing
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = RoyaltyStatementQuerySet.as_manager()
+
     class Meta:
         ordering = ['-period_end', 'platform']
         indexes = [
-            models.Index(fields=['artist', 'period_end']),
+            # Covering indexes (PostgreSQL INCLUDE) so per-artist aggregates are index-only scans
+            models.Index(fields=['artist', 'period_end'], include=['streams', 'revenue_micros', 'platform', 'track'],
+                         name='stmt_artist_period_cov_idx'),
+            models.Index(fields=['artist', 'track'], include=['streams', 'revenue_micros', 'platform', 'period_end'],
+                         name='stmt_artist_track_cov_idx'),
+            models.Index(fields=['artist', 'territory', 'period_end'], include=['streams', 'revenue_micros'],
+                         name='stmt_artist_territory_cov_idx'),
             models.Index(fields=['platform', 'period_end']),
         ]
+        constraints = [
+            models.UniqueConstraint(fields=['artist', 'row_key'], name='stmt_artist_row_key_uniq'),
+        ]
 
     def __str__(self):
         return f"Royalty: {self.track.name} on {self.platform.name} ({self.period_end})"
 
+    @property
+    def revenue(self):
+        """Revenue as an exact Decimal; assigning a Decimal, float or string stores micro-units."""
+        return from_micros(self.revenue_micros)
+
+    @revenue.setter
+    def revenue(self, value):
+        self.revenue_micros = to_micros(value)
+
     def save(self, *args, **kwargs):
-        import hashlib
-        if not self.pk:
-            source_string = f"{self.artist}-{self.track}-{self.platform}-{self.period_end}-{self.streams}-{self.revenue}-{self.currency}"
-            self.source_row_hash = hashlib.sha256(source_string.encode()).hexdigest()
+        from .hashing import statement_key
+        if self.row_key is None:
+            self.row_key = statement_key(self)
         super().save(*args, **kwargs)
 
+
+class StatementRollup(models.Model):
+    """Monthly pre-aggregate of royalty statements per artist, track and platform.
+
+    Rebuilt per artist by analytics.rollups after each upload; only trusted while
+    the artist's ArtistDataState says it is current.
+    """
+    artist = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='statement_rollups')
+    track = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='rollups')
+    platform = models.ForeignKey(Platform, on_delete=models.CASCADE, related_name='rollups')
+    month = models.DateField()  # first day of the month of period_end
+    streams = models.BigIntegerField(default=0)
+    revenue_micros = models.BigIntegerField(default=0)
+    statement_count = models.IntegerField(default=0)
+    last_period_end = models.DateField(blank=True, null=True)
+
+    class Meta:
+        unique_together = ['artist', 'track', 'platform', 'month']
+        indexes = [
+            models.Index(fields=['artist', 'month']),
+        ]
+
+    def __str__(self):
+        return f"Rollup: track {self.track_id} on platform {self.platform_id} ({self.month})"
+
+
+class TerritoryRollup(models.Model):
+    """Monthly pre-aggregate of royalty statements per artist and territory.
+
+    Rebuilt together with StatementRollup, so the same ArtistDataState check
+    decides whether it can be trusted.
+    """
+    artist = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='territory_rollups')
+    territory = models.CharField(max_length=2)
+    month = models.DateField()  # first day of the month of period_end
+    streams = models.BigIntegerField(default=0)
+    revenue_micros = models.BigIntegerField(default=0)
+    statement_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['artist', 'territory', 'month']
+
+    def __str__(self):
+        return f"Rollup: territory {self.territory} ({self.month})"
+
+
+class ArtistDataState(models.Model):
+    """Per-artist data version, bumped whenever the artist's statements change."""
+    artist = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True,
+                                  related_name='data_state')
+    version = models.PositiveBigIntegerField(default=0)
+    rollup_version = models.PositiveBigIntegerField(blank=True, null=True)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Data state for {self.artist_id} (v{self.version})"
+
+    @property
+    def rollups_current(self):
+        return self.rollup_version == self.version
+
+
+class DataExport(models.Model):
+    """Tracks asynchronous (Parquet) exports of royalty statements."""
+    EXPORT_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    artist = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='data_exports')
+    file_format = models.CharField(max_length=10, default='parquet')
+    filters = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=25, choices=EXPORT_STATUS_CHOICES, default='pending')
+    file = models.FileField(upload_to='exports/', blank=True, null=True)
+    row_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+    error_log = models.TextField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Export {self.id} ({self.file_format}) by {self.artist.username} ({self.status})"
+
 #
 # from django.db import models
 # from django.conf import settings
@@ -0,0 +1,76 @@
+"""Revenue as integer micro-units.
+
+Revenue is stored (RoyaltyStatement.revenue_micros, StatementRollup.revenue_micros)
+and aggregated as integer millionths of the currency unit, so sums are exact
+integer arithmetic in the database, NumPy and pandas alike. Aggregation
+helpers return micros; views and serializers convert once at the API
+boundary, exactly, through the functions below.
+"""
+from decimal import ROUND_HALF_EVEN, Decimal, InvalidOperation
+
+import numpy as np
+from django.db import models
+from django.db.models import Sum
+from django.db.models.functions import Cast
+
+MICROS = 1_000_000
+
+
+def to_micros(value):
+    """Micro-units of a Decimal, int, float or numeric string, rounded half-even.
+
+    Floats go through their shortest repr, so a CSV value parsed as 1.0001
+    becomes exactly 1000100 rather than inheriting binary noise.
+    """
+    if value is None:
+        return 0
+    if isinstance(value, (int, np.integer)):
+        return int(value) * MICROS
+    if isinstance(value, (float, np.floating)):
+        value = repr(float(value))
+    try:
+        amount = Decimal(value)
+    except (InvalidOperation, TypeError):
+        raise ValueError(f"Invalid amount: {value!r}")
+    if not amount.is_finite():
+        raise ValueError(f"Invalid amount: {value!r}")
+    return int(amount.scaleb(6).to_integral_value(ROUND_HALF_EVEN))
+
+
+def from_micros(micros, places=None):
+    """Exact Decimal value of `micros`, quantized half-even to `places` when given."""
+    value = Decimal(int(micros or 0)).scaleb(-6)
+    if places is None:
+        return value
+    return value.quantize(Decimal(1).scaleb(-places), rounding=ROUND_HALF_EVEN)
+
+
+def format_micros(micros, places):
+    """str(from_micros(micros, places)) with integer arithmetic only; places must be 0-6."""
+    step = 10 ** (6 - places)
+    units, rest = divmod(int(micros or 0), step)
+    if rest * 2 > step or (rest * 2 == step and units % 2):
+        units += 1
+    whole, fraction = divmod(abs(units), 10 ** places)
+    sign = '-' if units < 0 else ''
+    return f'{sign}{whole}.{fraction:0{places}d}' if places else f'{sign}{whole}'
+
+
+def micros_to_float(micros, places=4):
+    """JSON number for endpoints that have always returned revenue as a float."""
+    value = int(micros or 0) / MICROS  # int / int is correctly rounded, like float(Decimal)
+    return value if places is None else round(value, places)
+
+
+def micros_to_units(values):
+    """Float currency units for an array or Series of micros (time-series math, not totals)."""
+    return values / MICROS
+
+
+def sum_micros(field, **extra):
+    """SUM over a micros column, cast back to bigint.
+
+    PostgreSQL's sum(bigint) is numeric, which drivers hand back as Decimal;
+    the cast keeps aggregates plain Python ints end to end.
+    """
+    return Cast(Sum(field, **extra), models.BigIntegerField())
@@ -0,0 +1,188 @@
+"""PostgreSQL declarative partitioning of RoyaltyStatement by period_end.
+
+Enabled with ANALYTICS_PARTITION_STATEMENTS. The table keeps its name, columns
+and index names, so the ORM and later migrations see the same schema. Two
+things differ from the plain table:
+
+* The primary key is (id, period_end), because PostgreSQL requires the
+  partition key in every unique constraint.
+* Unique constraints gain period_end: (artist, row_key) becomes
+  (artist, row_key, period_end). Every row key is computed over period_end,
+  so equal keys imply equal period_end, and the wider constraint still
+  rejects every duplicate key across partitions.
+"""
+from datetime import date
+
+from django.conf import settings
+from django.db import connection as default_connection
+
+TABLE = 'analytics_royaltystatement'
+DEFAULT_PARTITION = f'{TABLE}_default'
+SEQUENCE = f'{TABLE}_id_seq'
+
+
+def partitioning_enabled():
+    return getattr(settings, 'ANALYTICS_PARTITION_STATEMENTS', False)
+
+
+def partition_interval():
+    return getattr(settings, 'ANALYTICS_STATEMENT_PARTITION_INTERVAL', 'month')
+
+
+def is_partitioned(connection=default_connection):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [TABLE])
+        row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def _next_bound(start, interval):
+    if interval == 'year':
+        return date(start.year + 1, 1, 1)
+    return date(start.year + (start.month == 12), start.month % 12 + 1, 1)
+
+
+def _floor(day, interval):
+    return date(day.year, 1, 1) if interval == 'year' else date(day.year, day.month, 1)
+
+
+def partition_name(start, interval):
+    if interval == 'year':
+        return f'{TABLE}_p{start.year}'
+    return f'{TABLE}_p{start.year}_{start.month:02d}'
+
+
+def unique_key(constraint, partitioned):
+    """Column list of a UNIQUE constraint definition, with period_end appended when partitioned."""
+    columns = [c.strip() for c in constraint[constraint.index('(') + 1:constraint.rindex(')')].split(',')]
+    columns = [c for c in columns if c != 'period_end'] + (['period_end'] if partitioned else [])
+    return f"({', '.join(columns)})"
+
+
+def _table_definition(cursor):
+    """Snapshot column, index and foreign key DDL of the current table."""
+    cursor.execute("""
+        SELECT a.attname, format_type(a.atttypid, a.atttypmod), a.attnotnull
+        FROM pg_attribute a
+        WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+        ORDER BY a.attnum
+    """, [TABLE])
+    columns = cursor.fetchall()
+    cursor.execute("""
+        SELECT i.relname, pg_get_indexdef(i.oid), c.contype, pg_get_constraintdef(c.oid)
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        LEFT JOIN pg_constraint c ON c.conindid = i.oid AND c.conrelid = x.indrelid
+        WHERE x.indrelid = %s::regclass
+    """, [TABLE])
+    indexes = cursor.fetchall()
+    cursor.execute("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype = 'f'
+    """, [TABLE])
+    foreign_keys = cursor.fetchall()
+    return columns, indexes, foreign_keys
+
+
+def _rebuild(cursor, partitioned, interval):
+    columns, indexes, foreign_keys = _table_definition(cursor)
+    legacy = f'{TABLE}_legacy'
+
+    cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {legacy}')
+    cursor.execute(f'CREATE SEQUENCE IF NOT EXISTS {SEQUENCE}_new')
+    column_sql = []
+    for name, type_sql, not_null in columns:
+        sql = f'"{name}" {type_sql}'
+        if name == 'id':
+            sql = f"\"id\" bigint NOT NULL DEFAULT nextval('{SEQUENCE}_new')"
+        elif not_null:
+            sql += ' NOT NULL'
+        column_sql.append(sql)
+    suffix = ' PARTITION BY RANGE (period_end)' if partitioned else ''
+    cursor.execute(f'CREATE TABLE {TABLE} ({", ".join(column_sql)}){suffix}')
+
+    if partitioned:
+        cursor.execute(f'SELECT min(period_end), max(period_end) FROM {legacy}')
+        first, last = cursor.fetchone()
+        today = date.today()
+        create_partitions(_floor(first or today, interval), _floor(max(last or today, today), interval),
+                          interval, cursor=cursor)
+        cursor.execute(f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT')
+
+    column_names = ', '.join(f'"{name}"' for name, _, _ in columns)
+    cursor.execute(f'INSERT INTO {TABLE} ({column_names}) SELECT {column_names} FROM {legacy}')
+    cursor.execute(f'DROP TABLE {legacy} CASCADE')
+
+    # Swap the sequence in under the original name so Django's sequence reset keeps working
+    cursor.execute(f'DROP SEQUENCE IF EXISTS {SEQUENCE}')
+    cursor.execute(f'ALTER SEQUENCE {SEQUENCE}_new RENAME TO {SEQUENCE}')
+    cursor.execute(f'ALTER SEQUENCE {SEQUENCE} OWNED BY {TABLE}.id')
+    cursor.execute(f"SELECT setval('{SEQUENCE}', COALESCE((SELECT max(id) FROM {TABLE}), 0) + 1, false)")
+
+    for name, definition, contype, constraint in indexes:
+        definition = definition.replace(f'{legacy}', TABLE)
+        if contype == 'p':
+            key = '(id, period_end)' if partitioned else '(id)'
+            cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {name} PRIMARY KEY {key}')
+        elif contype == 'u':
+            cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {name} UNIQUE {unique_key(constraint, partitioned)}')
+        else:
+            cursor.execute(definition)
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}')
+
+
+def convert_to_partitioned(connection=default_connection, interval=None):
+    """Rebuild the statement table as a range-partitioned table, copying all rows."""
+    if connection.vendor != 'postgresql' or is_partitioned(connection):
+        return False
+    with connection.cursor() as cursor:
+        _rebuild(cursor, partitioned=True, interval=interval or partition_interval())
+    return True
+
+
+def convert_to_plain(connection=default_connection):
+    """Undo convert_to_partitioned."""
+    if not is_partitioned(connection):
+        return False
+    with connection.cursor() as cursor:
+        _rebuild(cursor, partitioned=False, interval=None)
+    return True
+
+
+def create_partitions(first, last, interval=None, cursor=None):
+    """Create any missing partitions whose ranges start between first and last.
+
+    Rows that already landed in the default partition for a new range are
+    moved into it. Returns the names of the partitions created.
+    """
+    interval = interval or partition_interval()
+    if cursor is None:
+        with default_connection.cursor() as cursor:
+            return create_partitions(first, last, interval, cursor)
+
+    created = []
+    start = _floor(first, interval)
+    while start <= last:
+        end = _next_bound(start, interval)
+        name = partition_name(start, interval)
+        cursor.execute('SELECT to_regclass(%s)', [name])
+        if cursor.fetchone()[0] is None:
+            cursor.execute('SELECT to_regclass(%s)', [DEFAULT_PARTITION])
+            has_default = cursor.fetchone()[0] is not None
+            if has_default:
+                cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}')
+            cursor.execute(
+                f'CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)', [start, end]
+            )
+            if has_default:
+                cursor.execute(
+                    f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE period_end >= %s AND period_end < %s '
+                    f'RETURNING *) INSERT INTO {name} SELECT * FROM moved', [start, end]
+                )
+                cursor.execute(f'ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT')
+            created.append(name)
+        start = end
+    return created
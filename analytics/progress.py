@@ -0,0 +1,266 @@
+"""Live upload progress, streamed to clients as Server-Sent Events.
+
+The worker importing an upload reports its stage and row count through a
+ProgressReporter. Reports go to subscribers in the same process directly
+and, on PostgreSQL, are also written to the CsvUpload row over a separate
+autocommit connection (the import itself runs in one transaction) and
+announced with NOTIFY on CHANNEL.
+
+Each process runs at most one ProgressHub listener thread, and only while
+it has subscribers. On PostgreSQL the thread LISTENs on one connection and
+fans the notifications out; elsewhere it polls the subscribed uploads with
+one query every ANALYTICS_UPLOAD_EVENTS_POLL_SECONDS. The stream itself is
+an async generator, so the app is served over ASGI (see Procfile): an open
+stream is a coroutine waiting on its own asyncio queue, holding no worker
+thread and no database connection between events. Under WSGI every stream
+would tie up a worker for its whole lifetime.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.utils import timezone
+
+from .models import CsvUpload
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'analytics_upload_progress'
+TERMINAL_STATUSES = {'completed', 'completed_with_errors', 'failed'}
+EVENT_FIELDS = ['id', 'status', 'stage', 'processed_rows', 'total_rows', 'error_count', 'started_at']
+_PROGRESS_COLUMNS = ['stage', 'processed_rows', 'total_rows', 'error_count', 'heartbeat_at']
+HEARTBEAT_SECONDS = 30  # heartbeat writes on databases without live progress rows
+
+
+def progress_event(upload, now=None):
+    """Event payload for an upload (a dict with EVENT_FIELDS), with throughput and ETA while processing."""
+    now = now or timezone.now()
+    started_at = upload['started_at']
+    processed, total = upload['processed_rows'], upload['total_rows']
+    elapsed = (now - started_at).total_seconds() if started_at else 0
+    # Rows only flow steadily once inserting starts; earlier stages have no meaningful rate
+    counting = upload['stage'] == 'inserting' or upload['status'] in TERMINAL_STATUSES
+    rate = processed / elapsed if counting and processed and elapsed > 0 else None
+    eta = None
+    if rate and upload['status'] == 'processing' and total >= processed:
+        eta = round((total - processed) / rate, 1)
+    return {
+        'id': upload['id'],
+        'status': upload['status'],
+        'stage': upload['stage'] or upload['status'],
+        'processed_rows': processed,
+        'total_rows': total,
+        'error_count': upload['error_count'],
+        'rows_per_second': round(rate, 1) if rate else None,
+        'eta_seconds': eta,
+    }
+
+
+def format_event(event):
+    return f"event: progress\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+
+class ProgressHub:
+    """In-process fan-out of progress events to open streams, fed by the listener thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # upload id -> set of (event loop, asyncio queue)
+        self._thread = None
+
+    def subscribe(self, upload_id):
+        """An asyncio queue of the upload's events, bound to the running event loop."""
+        events = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._subscribers.setdefault(upload_id, set()).add(events)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._listen, name='analytics-progress', daemon=True)
+                self._thread.start()
+        return events
+
+    def unsubscribe(self, upload_id, events):
+        with self._lock:
+            streams = self._subscribers.get(upload_id, set())
+            streams.discard(events)
+            if not streams:
+                self._subscribers.pop(upload_id, None)
+
+    def publish(self, event):
+        """Queue `event` for its upload's streams; safe to call from any thread."""
+        with self._lock:
+            streams = list(self._subscribers.get(event['id'], ()))
+        for loop, events in streams:
+            try:
+                loop.call_soon_threadsafe(events.put_nowait, event)
+            except RuntimeError:
+                pass  # the stream's loop has closed; it unsubscribes on its way out
+
+    def _watched(self):
+        """Subscribed upload ids; when there are none the listener thread is retired (under the lock)."""
+        with self._lock:
+            if not self._subscribers:
+                self._thread = None
+            return list(self._subscribers)
+
+    def _listen(self):
+        """Feed subscribers until none are left; one connection or one poll query for all of them."""
+        try:
+            if connection.vendor == 'postgresql':
+                self._listen_postgresql()
+            else:
+                self._poll()
+        except Exception:
+            logger.exception("Upload progress listener stopped")
+            with self._lock:
+                self._thread = None
+        finally:
+            connections.close_all()
+
+    def _listen_postgresql(self):
+        listener = connections.create_connection(DEFAULT_DB_ALIAS)
+        listener.ensure_connection()
+        try:
+            raw = listener.connection
+            raw.execute(f'LISTEN {CHANNEL}')
+            # Changes announced before LISTEN took effect are caught up from the rows
+            self._publish_current(self._watched(), {})
+            while self._watched():
+                for notify in raw.notifies(timeout=settings.ANALYTICS_UPLOAD_EVENTS_POLL_SECONDS):
+                    self.publish(json.loads(notify.payload))
+        finally:
+            listener.close()
+
+    def _publish_current(self, watched, last):
+        """Publish the stored state of the `watched` uploads that changed since `last` ({id: state})."""
+        for upload in CsvUpload.objects.filter(id__in=watched).values(*EVENT_FIELDS):
+            event = progress_event(upload)
+            state = (event['status'], event['stage'], event['processed_rows'], event['error_count'])
+            if last.get(upload['id']) != state:
+                last[upload['id']] = state
+                self.publish(event)
+
+    def _poll(self):
+        last = {}
+        while True:
+            watched = self._watched()
+            if not watched:
+                return
+            self._publish_current(watched, last)
+            time.sleep(settings.ANALYTICS_UPLOAD_EVENTS_POLL_SECONDS)
+
+
+progress_hub = ProgressHub()
+
+
+def _notify(event, cursor):
+    cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, json.dumps(event, separators=(',', ':'))])
+
+
+class ProgressReporter:
+    """Reports one upload's progress while it is imported.
+
+    update() calls are throttled to one per `interval` seconds except on
+    stage changes. On PostgreSQL each report updates the CsvUpload row and
+    sends NOTIFY over a separate autocommit connection, so it is visible
+    while the import transaction is still open. Reports also touch
+    heartbeat_at, which the scheduler's stale check reads; elsewhere only
+    that column is written, at most every HEARTBEAT_SECONDS.
+    """
+
+    def __init__(self, upload, interval=0.5):
+        self.upload = upload
+        self.interval = interval
+        self._sent_at = 0.0
+        self._beat_at = None
+        self._stage = None
+        self._side = None
+
+    def update(self, stage, processed_rows=None, error_count=None):
+        now = time.monotonic()
+        if stage == self._stage and now - self._sent_at < self.interval:
+            return
+        self._stage, self._sent_at = stage, now
+        upload = self.upload
+        upload.stage = stage
+        upload.heartbeat_at = timezone.now()
+        if processed_rows is not None:
+            upload.processed_rows = processed_rows
+        if error_count is not None:
+            upload.error_count = error_count
+        event = progress_event({name: getattr(upload, name) for name in EVENT_FIELDS})
+        progress_hub.publish(event)
+        if connection.vendor == 'postgresql':
+            self._write(event)
+        elif self._beat_at is None or now - self._beat_at >= HEARTBEAT_SECONDS:
+            self._beat_at = now
+            CsvUpload.objects.filter(id=upload.id).update(heartbeat_at=upload.heartbeat_at)
+
+    def _write(self, event):
+        if self._side is None:
+            self._side = connections.create_connection(DEFAULT_DB_ALIAS)
+        quote = self._side.ops.quote_name
+        assignments = ', '.join(f'{quote(name)} = %s' for name in _PROGRESS_COLUMNS)
+        try:
+            with self._side.cursor() as cursor:
+                cursor.execute(
+                    f'UPDATE {quote(CsvUpload._meta.db_table)} SET {assignments} WHERE id = %s',
+                    [getattr(self.upload, name) for name in _PROGRESS_COLUMNS] + [self.upload.id],
+                )
+                _notify(event, cursor)
+        except Exception:
+            # Progress is best effort; the import carries on
+            logger.exception("Could not report progress for upload %s", self.upload.id)
+
+    def finish(self):
+        """Announce the upload's saved final state and release the side connection."""
+        if self._side is not None:
+            self._side.close()
+            self._side = None
+        event = progress_event({name: getattr(self.upload, name) for name in EVENT_FIELDS})
+        progress_hub.publish(event)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                _notify(event, cursor)
+
+
+def _current_event(upload_id):
+    upload = CsvUpload.objects.filter(id=upload_id).values(*EVENT_FIELDS).get()
+    if not connection.in_atomic_block:
+        connection.close()  # nothing else to read; don't hold a connection while streaming
+    return progress_event(upload)
+
+
+async def event_stream(upload_id):
+    """SSE body for an upload: its current state, then each change until it finishes.
+
+    Sends a comment line every ANALYTICS_UPLOAD_EVENTS_HEARTBEAT seconds so
+    proxies keep the connection open, and ends after
+    ANALYTICS_UPLOAD_EVENTS_TIMEOUT seconds; EventSource clients reconnect.
+    """
+    subscription = progress_hub.subscribe(upload_id)
+    events = subscription[1]
+    try:
+        # Subscribed before reading, so no change between the two is missed
+        event = sent = await sync_to_async(_current_event)(upload_id)
+        yield f"retry: {settings.ANALYTICS_UPLOAD_EVENTS_RETRY_MS}\n" + format_event(event)
+        deadline = time.monotonic() + settings.ANALYTICS_UPLOAD_EVENTS_TIMEOUT
+        while event['status'] not in TERMINAL_STATUSES and time.monotonic() < deadline:
+            try:
+                event = await asyncio.wait_for(events.get(), timeout=settings.ANALYTICS_UPLOAD_EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            # Coalesce a backlog into its latest state
+            while not events.empty():
+                event = events.get_nowait()
+            if event != sent:
+                sent = event
+                yield format_event(event)
+    finally:
+        progress_hub.unsubscribe(upload_id, subscription)
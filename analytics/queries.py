@@ -0,0 +1,80 @@
+from django.db.models import Count, F, Sum, Window
+from django.db.models.functions import RowNumber
+
+from . import columnar
+from .columnar import analytics_engine
+from .money import sum_micros
+from .rollups import aggregate_source, territory_source
+
+TOP_TRACKS_SORT_FIELDS = ['streams', 'revenue']
+
+
+def totals(artist_id, engine=None):
+    """Total streams and revenue (in micros, see analytics.money). Returns ({'streams', 'revenue'}, source)."""
+    if analytics_engine(engine) == 'columnar':
+        return columnar.totals(artist_id), 'columnar'
+    queryset, source = aggregate_source(artist_id)
+    sums = queryset.aggregate(streams=Sum('streams'), revenue=sum_micros('revenue_micros'))
+    return {'streams': sums['streams'] or 0, 'revenue': sums['revenue'] or 0}, source
+
+
+def platform_totals(artist_id, engine=None):
+    """Per-platform sums, most streamed first. Returns (rows, source)."""
+    if analytics_engine(engine) == 'columnar':
+        return columnar.platform_totals(artist_id), 'columnar'
+    queryset, source = aggregate_source(artist_id)
+    rows = queryset.values(
+        'platform_id', platform_name=F('platform__name'), platform_icon=F('platform__api_name')
+    ).annotate(streams=Sum('streams'), revenue=sum_micros('revenue_micros')).order_by('-streams', 'platform_id')
+    return list(rows), source
+
+
+def top_tracks(artist_id, limit=10, start_date=None, end_date=None, sort_by='streams', engine=None):
+    """Top tracks ranked across all platforms.
+
+    Returns (rows, source); each row has track_id, track_name, streams,
+    revenue (micros) and platform_count.
+    """
+    if analytics_engine(engine) == 'columnar':
+        return columnar.top_tracks(artist_id, limit, start_date, end_date, sort_by), 'columnar'
+    queryset, source = aggregate_source(artist_id, start_date, end_date)
+    rows = queryset.values('track_id', track_name=F('track__name')).annotate(
+        streams=Sum('streams'),
+        revenue=sum_micros('revenue_micros'),
+        platform_count=Count('platform_id', distinct=True),
+    ).order_by(f'-{sort_by}', 'track_id')[:limit]
+    return list(rows), source
+
+
+def top_tracks_per_platform(artist_id, limit=5, start_date=None, end_date=None, sort_by='streams', engine=None):
+    """Top `limit` tracks within each platform, ranked with ROW_NUMBER() in one query.
+
+    Returns (rows, source); rows are ordered by platform then rank.
+    """
+    if analytics_engine(engine) == 'columnar':
+        return columnar.top_tracks_per_platform(artist_id, limit, start_date, end_date, sort_by), 'columnar'
+    queryset, source = aggregate_source(artist_id, start_date, end_date)
+    ranked = queryset.values(
+        'platform_id', 'track_id', platform_name=F('platform__name'), track_name=F('track__name')
+    ).annotate(
+        streams=Sum('streams'),
+        revenue=sum_micros('revenue_micros'),
+    ).annotate(
+        rank=Window(
+            RowNumber(),
+            partition_by=[F('platform_id')],
+            order_by=[F(sort_by).desc(), F('track_id').asc()],
+        )
+    ).filter(rank__lte=limit).order_by('platform_name', 'rank')
+    return list(ranked), source
+
+
+def territory_totals(artist_id, start_date=None, end_date=None, engine=None):
+    """Per-territory sums, most streamed first, in one grouped query. Returns (rows, source)."""
+    if analytics_engine(engine) == 'columnar':
+        return columnar.territory_totals(artist_id, start_date, end_date), 'columnar'
+    queryset, source = territory_source(artist_id, start_date, end_date)
+    rows = queryset.values('territory').annotate(
+        streams=Sum('streams'), revenue=sum_micros('revenue_micros')
+    ).order_by('-streams', 'territory')
+    return list(rows), source
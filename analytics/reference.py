@@ -0,0 +1,106 @@
+"""Process-local cache of the Platform dimension.
+
+Platforms are few, global and rarely edited, so each process keeps one
+snapshot with lookup maps instead of querying the table per request or per
+row. Saves and deletes replace a version token in the Django cache; every
+process compares its snapshot against that token on access. When CACHES is
+process-local (the default locmem backend) other processes only see the new
+token after ANALYTICS_REFERENCE_CACHE_SECONDS, when snapshots are reloaded
+regardless. Each snapshot also carries a digest of its rows, which is what
+GET /api/platforms validates against, so every process serving the same rows
+sends the same ETag.
+"""
+import hashlib
+import re
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Platform
+
+VERSION_KEY = 'analytics:platforms:version'
+PLATFORM_LIST_MAX_AGE = 24 * 60 * 60  # GET /api/platforms; revalidated by ETag afterwards
+_NON_ALNUM = re.compile(r'[\W_]+')
+
+
+def platform_key(name):
+    """Normalized platform name: "Apple Music", "apple_music" and "AppleMusic" share a key."""
+    return _NON_ALNUM.sub('', str(name).casefold())
+
+
+class PlatformCatalog:
+    """Immutable snapshot of the platform table."""
+
+    def __init__(self, version, platforms):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.platforms = platforms  # Platform.Meta.ordering (by name)
+        self.by_id = {p.id: p for p in platforms}
+        self.by_name = {p.name.lower(): p for p in platforms}
+        self.by_api_name = {p.api_name.casefold(): p for p in platforms}
+        self.by_key = {}
+        for p in platforms:
+            self.by_key.setdefault(platform_key(p.name), p)
+        # Content fingerprint: equal in every process that loaded the same rows (the version token is per
+        # process when CACHES is)
+        fields = [field.attname for field in Platform._meta.concrete_fields]
+        self.digest = hashlib.sha1(
+            repr([[getattr(p, field) for field in fields] for p in platforms]).encode()
+        ).hexdigest()
+
+    def lookup(self, name):
+        """Match a reported platform name by name, then api_name (both in any case), then normalized name."""
+        name = str(name)
+        return (self.by_name.get(name.lower()) or self.by_api_name.get(name.casefold())
+                or self.by_key.get(platform_key(name)))
+
+
+_snapshot = None
+
+
+def platform_cache_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def platform_catalog():
+    """The current PlatformCatalog, reloaded when the version token changed or the snapshot aged out.
+
+    Snapshots loaded inside a transaction are used but not kept.
+    """
+    global _snapshot
+    version = platform_cache_version()
+    snapshot = _snapshot
+    max_age = getattr(settings, 'ANALYTICS_REFERENCE_CACHE_SECONDS', 300)
+    if snapshot is None or snapshot.version != version or time.monotonic() - snapshot.loaded_at > max_age:
+        snapshot = PlatformCatalog(version, list(Platform.objects.all()))
+        # Rows read inside a transaction may still be rolled back
+        if not transaction.get_connection().in_atomic_block:
+            _snapshot = snapshot
+    return snapshot
+
+
+def platforms_by_id(ids):
+    """{id: Platform} for `ids`; ids missing from the snapshot (created elsewhere moments ago) are queried."""
+    by_id = platform_catalog().by_id
+    found = {pk: by_id[pk] for pk in ids if pk in by_id}
+    if len(found) < len(ids):
+        found.update(Platform.objects.in_bulk([pk for pk in ids if pk not in found]))
+    return found
+
+
+def invalidate_platforms():
+    """Drop every process's platform snapshot. Called from Platform save/delete signals and after bulk writes.
+
+    The token changes on commit, so other processes cannot reload uncommitted
+    rows into a snapshot stamped with the new version.
+    """
+    global _snapshot
+    _snapshot = None
+    transaction.on_commit(lambda: cache.set(VERSION_KEY, uuid.uuid4().hex, None))
@@ -0,0 +1,133 @@
+from datetime import timedelta
+
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Max, Sum, When
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import ArtistDataState, RoyaltyStatement, StatementRollup, TerritoryRollup
+from .money import sum_micros
+
+
+def mark_artist_data_changed(artist_id, create=True, statements_changed=True):
+    """Bump the artist's data version.
+
+    The version drives HTTP validators (see analytics.caching) and rollup
+    freshness. With statements_changed=False (e.g. a failed upload or a track
+    rename) current rollups stay current. Pass create=False from delete paths,
+    where the artist itself may be going away.
+    """
+    changes = {'version': F('version') + 1, 'changed_at': timezone.now()}
+    if not statements_changed:
+        changes['rollup_version'] = Case(
+            When(rollup_version=F('version'), then=F('version') + 1),
+            default=F('rollup_version'),
+            output_field=models.PositiveBigIntegerField(),
+        )
+    updated = ArtistDataState.objects.filter(artist_id=artist_id).update(**changes)
+    if not updated and create:
+        ArtistDataState.objects.get_or_create(artist_id=artist_id, defaults={'version': 1})
+
+
+def get_artist_data_state(artist_id):
+    state, _ = ArtistDataState.objects.get_or_create(artist_id=artist_id)
+    return state
+
+
+def rebuild_artist_rollups(artist_id):
+    """Recompute the monthly StatementRollup and TerritoryRollup rows for one artist."""
+    with transaction.atomic():
+        state, _ = ArtistDataState.objects.select_for_update().get_or_create(artist_id=artist_id)
+        monthly = RoyaltyStatement.objects.filter(artist_id=artist_id).annotate(
+            rollup_month=TruncMonth('period_end')
+        ).values('track_id', 'platform_id', 'rollup_month').annotate(
+            total_streams=Sum('streams'), total_revenue=sum_micros('revenue_micros'), row_count=Count('id'),
+            last_period_end=Max('period_end'),
+        ).order_by()
+
+        StatementRollup.objects.filter(artist_id=artist_id).delete()
+        StatementRollup.objects.bulk_create([
+            StatementRollup(
+                artist_id=artist_id,
+                track_id=row['track_id'],
+                platform_id=row['platform_id'],
+                month=row['rollup_month'],
+                streams=row['total_streams'] or 0,
+                revenue_micros=row['total_revenue'] or 0,
+                statement_count=row['row_count'],
+                last_period_end=row['last_period_end'],
+            )
+            for row in monthly.iterator(chunk_size=2000)
+        ], batch_size=1000)
+
+        by_territory = RoyaltyStatement.objects.filter(artist_id=artist_id).annotate(
+            rollup_month=TruncMonth('period_end')
+        ).values('territory', 'rollup_month').annotate(
+            total_streams=Sum('streams'), total_revenue=sum_micros('revenue_micros'), row_count=Count('id'),
+        ).order_by()
+        TerritoryRollup.objects.filter(artist_id=artist_id).delete()
+        TerritoryRollup.objects.bulk_create([
+            TerritoryRollup(
+                artist_id=artist_id,
+                territory=row['territory'],
+                month=row['rollup_month'],
+                streams=row['total_streams'] or 0,
+                revenue_micros=row['total_revenue'] or 0,
+                statement_count=row['row_count'],
+            )
+            for row in by_territory.iterator(chunk_size=2000)
+        ], batch_size=1000)
+
+        state.rollup_version = state.version
+        state.save(update_fields=['rollup_version'])
+
+
+def rollups_available(artist_id):
+    return ArtistDataState.objects.filter(artist_id=artist_id, rollup_version=F('version')).exists()
+
+
+def month_aligned(start_date, end_date):
+    """True when a period_end window maps exactly onto whole rollup months."""
+    if start_date and start_date.day != 1:
+        return False
+    if end_date and (end_date + timedelta(days=1)).day != 1:
+        return False
+    return True
+
+
+def rollup_queryset(artist_id, start_date=None, end_date=None, model=StatementRollup):
+    """Rollup rows for a month-aligned window (see month_aligned)."""
+    queryset = model.objects.filter(artist_id=artist_id)
+    if start_date:
+        queryset = queryset.filter(month__gte=start_date)
+    if end_date:
+        queryset = queryset.filter(month__lte=end_date.replace(day=1))
+    return queryset
+
+
+def aggregate_source(artist_id, start_date=None, end_date=None, allow_rollup=True):
+    """Pick the cheapest source for per-track/per-platform sums in a window.
+
+    Returns (queryset, source) where source is 'rollup' or 'statements'. Both
+    querysets expose artist, track, platform, streams and revenue_micros; the date
+    column is `month` on rollups and `period_end` on statements.
+    """
+    if allow_rollup and month_aligned(start_date, end_date) and rollups_available(artist_id):
+        return rollup_queryset(artist_id, start_date, end_date), 'rollup'
+    queryset = RoyaltyStatement.objects.filter(artist_id=artist_id)
+    if start_date:
+        queryset = queryset.filter(period_end__gte=start_date)
+    if end_date:
+        queryset = queryset.filter(period_end__lte=end_date)
+    return queryset, 'statements'
+
+
+def territory_source(artist_id, start_date=None, end_date=None):
+    """Like aggregate_source, for per-territory sums: TerritoryRollup or statements.
+
+    The statements queryset is served by the (artist, territory, period_end)
+    covering index.
+    """
+    if month_aligned(start_date, end_date) and rollups_available(artist_id):
+        return rollup_queryset(artist_id, start_date, end_date, model=TerritoryRollup), 'rollup'
+    return aggregate_source(artist_id, start_date, end_date, allow_rollup=False)
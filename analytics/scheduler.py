@@ -0,0 +1,309 @@
+"""Fair scheduling of queued CSV uploads.
+
+The upload request stores the file and leaves a 'pending' CsvUpload; the
+table itself is the queue, so every process sees the same queue, running
+counts and wait times. Whenever an upload is queued or one finishes,
+dispatch() claims pending uploads while fewer than ANALYTICS_UPLOAD_WORKERS
+are processing, asking the SchedulingPolicy named by ANALYTICS_UPLOAD_POLICY
+which upload goes next. Claims are serialized (a PostgreSQL advisory lock
+across processes, a thread lock within one), so the global and per-artist
+limits hold however many processes share the queue.
+
+Processing uploads whose heartbeat (heartbeat_at, set at claim and touched
+by the progress reporter as the import advances) is older than
+ANALYTICS_UPLOAD_STALE_SECONDS (a crashed worker) are marked failed by the
+next claim; a slow upload that still reports progress is left alone. Files imported by the
+backfill_statements command are CsvUploads too, 'processing' in
+BACKFILL_STAGE; the command owns and resumes them, so they neither count
+against the limits nor get failed here. Pending uploads left behind by
+a restart start when the process comes back up (resume(), called from the
+ASGI and WSGI entry points) or from the dispatch_uploads command.
+"""
+import logging
+import threading
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import CsvUpload
+from .rollups import mark_artist_data_changed
+from .uploads import process_upload
+
+logger = logging.getLogger(__name__)
+
+QUEUE_LOCK_CLASS = 4502  # pg_advisory_xact_lock(class, 0) namespace for upload claims
+QUEUE_FIELDS = ['queue_position', 'queue_depth', 'wait_seconds']
+BACKFILL_STAGE = 'backfill'
+STALE_ERROR = "Processing stopped before the upload finished (its worker exited); upload the file again."
+
+
+@dataclass(frozen=True)
+class QueuedUpload:
+    id: int
+    artist_id: uuid.UUID
+    size_bytes: int
+    queued_at: datetime
+    batch_id: int = None
+
+
+class SchedulingPolicy:
+    """Chooses which pending upload starts next. Subclasses implement select() and sort_key()."""
+
+    def __init__(self, artist_limit=None, batch_limit=None):
+        self.artist_limit = artist_limit or settings.ANALYTICS_UPLOAD_ARTIST_LIMIT
+        # More batch files than there are workers can never run at once
+        batch_limit = batch_limit or min(settings.ANALYTICS_UPLOAD_BATCH_PARALLELISM, settings.ANALYTICS_UPLOAD_WORKERS)
+        self.batch_limit = max(batch_limit, self.artist_limit)
+
+    def limit(self, job):
+        """How many of the artist's uploads may be running for `job` to start; batch files share a larger cap."""
+        return self.batch_limit if job.batch_id else self.artist_limit
+
+    def eligible(self, queued, running):
+        """Pending uploads whose artist is below the concurrency cap."""
+        return [job for job in queued if running.get(job.artist_id, 0) < self.limit(job)]
+
+    def select(self, queued, running, now):
+        """The QueuedUpload from `queued` to start at `now`, or None to leave the free worker idle.
+
+        `running` maps artist ids to their number of processing uploads.
+        """
+        raise NotImplementedError
+
+    def sort_key(self, job):
+        """Order of one artist's own pending uploads; used for queue positions."""
+        raise NotImplementedError
+
+
+class FifoPolicy(SchedulingPolicy):
+    """Oldest upload first, within the per-artist cap."""
+
+    def select(self, queued, running, now):
+        return min(self.eligible(queued, running), key=self.sort_key, default=None)
+
+    def sort_key(self, job):
+        return (job.queued_at, job.id)
+
+
+class FairSharePolicy(SchedulingPolicy):
+    """Artists with the fewest running uploads first, then the smallest file, then the oldest.
+
+    An upload that has waited starvation_seconds goes ahead of everything
+    else (oldest first), so large files still start under a steady stream
+    of small ones.
+    """
+
+    def __init__(self, artist_limit=None, batch_limit=None, starvation_seconds=None):
+        super().__init__(artist_limit, batch_limit)
+        if starvation_seconds is None:
+            starvation_seconds = settings.ANALYTICS_UPLOAD_STARVATION_SECONDS
+        self.starvation = timedelta(seconds=starvation_seconds)
+
+    def select(self, queued, running, now):
+        eligible = self.eligible(queued, running)
+        overdue = [job for job in eligible if now - job.queued_at >= self.starvation]
+        if overdue:
+            return min(overdue, key=lambda job: (job.queued_at, job.id))
+        return min(eligible, key=lambda job: (running.get(job.artist_id, 0),) + self.sort_key(job), default=None)
+
+    def sort_key(self, job):
+        return (job.size_bytes, job.queued_at, job.id)
+
+
+def get_policy():
+    return import_string(settings.ANALYTICS_UPLOAD_POLICY)()
+
+
+def _lock_queue():
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, 0)', [QUEUE_LOCK_CLASS])
+
+
+def _stale_before(now):
+    return now - timedelta(seconds=settings.ANALYTICS_UPLOAD_STALE_SECONDS)
+
+
+def _alive(queryset):
+    """Alias `alive_at`: an upload's last heartbeat (its start, for uploads claimed before heartbeats)."""
+    return queryset.alias(alive_at=Coalesce('heartbeat_at', 'started_at'))
+
+
+def _running(now):
+    """{artist_id: processing uploads}, ignoring uploads silent past the stale timeout."""
+    artists = _alive(CsvUpload.objects.filter(status='processing')).filter(
+        alive_at__gte=_stale_before(now)
+    ).exclude(stage=BACKFILL_STAGE).values_list('artist_id', flat=True)
+    return Counter(artists)
+
+
+def fail_stale_uploads(now=None):
+    """Mark processing uploads silent past the stale timeout as failed; returns how many."""
+    now = now or timezone.now()
+    stale = _alive(CsvUpload.objects.filter(status='processing')).filter(
+        alive_at__lt=_stale_before(now)
+    ).exclude(stage=BACKFILL_STAGE)
+    artist_ids = set(stale.values_list('artist_id', flat=True))
+    count = stale.update(status='failed', stage='', finished_at=now, error_log=STALE_ERROR)
+    for artist_id in artist_ids:
+        mark_artist_data_changed(artist_id, statements_changed=False)
+    return count
+
+
+def _queued():
+    rows = CsvUpload.objects.filter(status='pending', queued_at__isnull=False).order_by('queued_at', 'id').values(
+        'id', 'artist_id', 'size_bytes', 'queued_at', 'batch_id'
+    )
+    return [QueuedUpload(**row) for row in rows]
+
+
+class UploadScheduler:
+    """Starts pending uploads on a per-process thread pool as the policy and limits allow."""
+
+    def __init__(self, policy=None):
+        self._policy = policy
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @property
+    def policy(self):
+        if self._policy is None:
+            self._policy = get_policy()
+        return self._policy
+
+    def claim(self):
+        """Mark the next upload 'processing' and return its id; None when nothing may start now."""
+        with transaction.atomic():
+            _lock_queue()
+            now = timezone.now()
+            fail_stale_uploads(now)
+            running = _running(now)
+            if sum(running.values()) >= settings.ANALYTICS_UPLOAD_WORKERS:
+                return None
+            job = self.policy.select(_queued(), running, now)
+            if job is None:
+                return None
+            CsvUpload.objects.filter(id=job.id).update(status='processing', started_at=now, heartbeat_at=now)
+            return job.id
+
+    def dispatch(self, inline=None):
+        """Start uploads until the queue is empty or the limits are reached.
+
+        Inline (default ANALYTICS_RUN_TASKS_INLINE) the uploads are processed
+        right here, one after another.
+        """
+        if inline is None:
+            inline = getattr(settings, 'ANALYTICS_RUN_TASKS_INLINE', False)
+        while True:
+            with self._lock:
+                upload_id = self.claim()
+            if upload_id is None:
+                return
+            if inline:
+                self._process(upload_id)
+            else:
+                self._get_executor().submit(self._run, upload_id)
+
+    def resume(self):
+        """Fail stale uploads and start pending ones in the background; for process startup."""
+        self._get_executor().submit(self._resume)
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=settings.ANALYTICS_UPLOAD_WORKERS, thread_name_prefix='analytics-upload',
+            )
+        return self._executor
+
+    def _process(self, upload_id):
+        try:
+            process_upload(upload_id)
+        except Exception:
+            logger.exception("Upload %s failed", upload_id)
+            CsvUpload.objects.filter(id=upload_id, status='processing').update(
+                status='failed', finished_at=timezone.now()
+            )
+
+    def _run(self, upload_id):
+        close_old_connections()
+        try:
+            self._process(upload_id)
+            # The finished upload frees a worker
+            self.dispatch()
+        except Exception:
+            # Still-pending uploads start on the next enqueue or finished upload
+            logger.exception("Upload dispatch failed")
+        finally:
+            close_old_connections()
+
+    def _resume(self):
+        close_old_connections()
+        try:
+            self.dispatch()
+        except Exception:
+            logger.exception("Upload dispatch failed")
+        finally:
+            close_old_connections()
+
+
+upload_scheduler = UploadScheduler()
+
+
+def enqueue_uploads(uploads):
+    """Queue saved uploads and start whatever the limits now allow (on commit, inside a transaction)."""
+    now = timezone.now()
+    for upload in uploads:
+        upload.status = 'pending'
+        upload.queued_at = now
+    CsvUpload.objects.bulk_update(uploads, ['status', 'queued_at'])
+    # Inside a transaction, claims wait until the queued rows are committed
+    transaction.on_commit(upload_scheduler.dispatch)
+
+
+def enqueue_upload(upload):
+    enqueue_uploads([upload])
+
+
+def uploads_in_flight(artist_id):
+    """Whether the artist has uploads queued or processing (stale ones do not count)."""
+    return _alive(CsvUpload.objects.filter(artist_id=artist_id)).filter(
+        Q(status='pending') | Q(status='processing', alive_at__gte=_stale_before(timezone.now()))
+    ).exists()
+
+
+def queue_status(uploads, now=None):
+    """QUEUE_FIELDS for CsvUpload API output, keyed by upload id.
+
+    `uploads` are dicts with id, status, queued_at and started_at.
+
+    queue_position is the upload's place among its artist's pending uploads
+    in the policy's order (1 starts next), queue_depth the number of pending
+    uploads across all artists and wait_seconds the time spent queued so far
+    (until started, for uploads that have left the queue).
+    """
+    now = now or timezone.now()
+    uploads = list(uploads)
+    pending = _queued() if any(upload['status'] == 'pending' for upload in uploads) else []
+    own = {}
+    for job in sorted(pending, key=upload_scheduler.policy.sort_key):
+        own.setdefault(job.artist_id, []).append(job.id)
+    positions = {pk: index + 1 for ids in own.values() for index, pk in enumerate(ids)}
+    status = {}
+    for upload in uploads:
+        queued_at, started_at = upload['queued_at'], upload['started_at']
+        waited = ((started_at or now) - queued_at).total_seconds() if queued_at else None
+        status[upload['id']] = {
+            'queue_position': positions.get(upload['id']),
+            'queue_depth': len(pending),
+            'wait_seconds': round(max(waited, 0), 1) if waited is not None else None,
+        }
+    return status
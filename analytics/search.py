@@ -0,0 +1,157 @@
+import re
+
+import numpy as np
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import Case, FloatField, Q, Value, When
+
+from .columnar import ColumnCache
+from .models import Album, Platform, Track
+from .rollups import get_artist_data_state
+
+SEARCH_TYPES = ['track', 'album', 'platform']
+MIN_WORD_SIMILARITY = 0.3
+
+# type -> (model, searched field, whether rows belong to one artist)
+_SEARCH_MODELS = {
+    'track': (Track, 'name', True),
+    'album': (Album, 'title', True),
+    'platform': (Platform, 'name', False),
+}
+
+
+def search_backend(backend=None):
+    """'database' (pg_trgm) on PostgreSQL, 'memory' elsewhere; ANALYTICS_SEARCH_BACKEND or the argument override."""
+    backend = backend or getattr(settings, 'ANALYTICS_SEARCH_BACKEND', 'auto')
+    if backend == 'auto':
+        return 'database' if connection.vendor == 'postgresql' else 'memory'
+    return backend
+
+
+def trigrams(text):
+    """pg_trgm-style trigrams: lower-cased words padded with two leading and one trailing space."""
+    grams = set()
+    for word in re.findall(r'\w+', text.lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _bonus(name, query):
+    name = name.lower()
+    return 1.0 if name.startswith(query) else 0.5 if query in name else 0.0
+
+
+class SearchIndex:
+    """In-process trigram index over one artist's tracks and albums plus all platforms.
+
+    Postings are NumPy arrays, so scoring a query is a bincount over the
+    postings of its trigrams rather than a scan over every name.
+    """
+
+    def __init__(self, version, entries):
+        self.version = version
+        self.types = np.array([SEARCH_TYPES.index(kind) for kind, _, _ in entries], dtype=np.int8)
+        self.ids = np.array([pk for _, pk, _ in entries], dtype=np.int64)
+        self.names = [name for _, _, name in entries]
+        postings = {}
+        counts = []
+        for position, name in enumerate(self.names):
+            grams = trigrams(name)
+            counts.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(position)
+        self.gram_counts = np.array(counts, dtype=np.int32)
+        self.postings = {gram: np.array(positions, dtype=np.int32) for gram, positions in postings.items()}
+
+    @classmethod
+    def build(cls, artist_id, version):
+        entries = []
+        for kind, (model, field, per_artist) in _SEARCH_MODELS.items():
+            queryset = model.objects.filter(artist_id=artist_id) if per_artist else model.objects.all()
+            entries.extend((kind, pk, name) for pk, name in queryset.values_list('id', field).order_by())
+        return cls(version, entries)
+
+    @property
+    def nbytes(self):
+        arrays = self.types.nbytes + self.ids.nbytes + self.gram_counts.nbytes
+        return arrays + sum(p.nbytes for p in self.postings.values()) + sum(len(n) for n in self.names) * 2
+
+    def search(self, query, types=SEARCH_TYPES, limit=20):
+        query_grams = trigrams(query)
+        grams = [gram for gram in query_grams if gram in self.postings]
+        if not grams:
+            return []
+        shared = np.bincount(np.concatenate([self.postings[gram] for gram in grams]), minlength=len(self.names))
+        word_similarity = shared / len(query_grams)
+        keep = word_similarity >= MIN_WORD_SIMILARITY
+        if len(types) < len(SEARCH_TYPES):
+            keep &= np.isin(self.types, [SEARCH_TYPES.index(kind) for kind in types])
+        candidates = np.flatnonzero(keep)
+        shared = shared[candidates]
+        similarity = shared / (len(query_grams) + self.gram_counts[candidates] - shared)
+        score = word_similarity[candidates] + 0.1 * similarity
+
+        # Only a shortlist gets the prefix/substring bonus, which needs the strings
+        query = query.strip().lower()
+        rows = []
+        for i in np.argsort(-score, kind='stable')[:limit * 4]:
+            position = candidates[i]
+            name = self.names[position]
+            rows.append({
+                'type': SEARCH_TYPES[self.types[position]],
+                'id': int(self.ids[position]),
+                'name': name,
+                'score': round(float(score[i]) + _bonus(name, query), 4),
+            })
+        rows.sort(key=lambda row: (-row['score'], row['name'], row['id']))
+        return rows[:limit]
+
+
+search_index_cache = ColumnCache(getattr(settings, 'ANALYTICS_SEARCH_INDEX_BYTES', 64 * 1024 * 1024))
+
+
+def artist_search_index(artist_id):
+    """Cached SearchIndex for the artist's current data version (track/album edits bump it)."""
+    version = get_artist_data_state(artist_id).version
+    index = search_index_cache.get(artist_id, version)
+    if index is None:
+        index = SearchIndex.build(artist_id, version)
+        search_index_cache.put(artist_id, index)
+    return index
+
+
+def _database_search(artist_id, query, types, limit):
+    """pg_trgm: word-similarity (<%) or ILIKE matches served by the GIN trigram indexes."""
+    rows = []
+    lowered = query.strip().lower()
+    for kind in types:
+        model, field, per_artist = _SEARCH_MODELS[kind]
+        queryset = model.objects.filter(artist_id=artist_id) if per_artist else model.objects.all()
+        matches = queryset.filter(
+            Q(**{f'{field}__trigram_word_similar': query}) | Q(**{f'{field}__icontains': lowered})
+        ).annotate(
+            score=TrigramWordSimilarity(Value(query), field) + 0.1 * TrigramSimilarity(field, Value(query)) + Case(
+                When(**{f'{field}__istartswith': lowered}, then=Value(1.0)),
+                When(**{f'{field}__icontains': lowered}, then=Value(0.5)),
+                default=Value(0.0),
+                output_field=FloatField(),
+            ),
+        ).order_by('-score', field, 'id').values('id', 'score', field)[:limit]
+        rows.extend({'type': kind, 'id': row['id'], 'name': row[field], 'score': round(row['score'], 4)}
+                    for row in matches)
+    rows.sort(key=lambda row: (-row['score'], row['name'], row['id']))
+    return rows[:limit]
+
+
+def search_catalog(artist_id, query, types=SEARCH_TYPES, limit=20, backend=None):
+    """Ranked prefix/fuzzy matches over track names, album titles and platform names.
+
+    Prefix matches rank first, then substring matches, then trigram word
+    similarity. Returns (rows, backend); rows have type, id, name and score.
+    """
+    backend = search_backend(backend)
+    if backend == 'database':
+        return _database_search(artist_id, query, types, limit), backend
+    return artist_search_index(artist_id).search(query, types, limit), backend
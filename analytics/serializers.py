@@ -1,5 +1,25 @@
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Platform, Album, Track, RoyaltyStatement, CsvUpload
+from rest_framework.settings import api_settings
+from .models import Platform, Album, Track, RoyaltyStatement, CsvUpload, UploadBatch, DataExport
+from .money import format_micros, from_micros, to_micros
+
+
+class MicroAmountField(serializers.DecimalField):
+    """A DecimalField over integer micro-units (see analytics.money); the conversion is exact.
+
+    The usual string output is formatted straight from the integer, skipping
+    Decimal construction and quantize on every row.
+    """
+
+    def to_representation(self, value):
+        coerce_to_string = getattr(self, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+        if coerce_to_string and not self.localize and self.decimal_places is not None and self.decimal_places <= 6:
+            return format_micros(value, self.decimal_places)
+        return super().to_representation(from_micros(value))
+
+    def to_internal_value(self, data):
+        return to_micros(super().to_internal_value(data))
 
 
 class PlatformSerializer(serializers.ModelSerializer):
@@ -37,13 +57,14 @@ class RoyaltyStatementSerializer(serializers.ModelSerializer):
     track_name = serializers.CharField(source='track.name', read_only=True)
     platform_name = serializers.CharField(source='platform.name', read_only=True)
     artist_name = serializers.CharField(source='artist.username', read_only=True)
+    revenue = MicroAmountField(source='revenue_micros', max_digits=12, decimal_places=4, required=False)
 
     class Meta:
         model = RoyaltyStatement
         fields = [
             'id', 'artist', 'artist_name', 'track', 'track_name', 'platform', 'platform_name',
-            'upload', 'period_start', 'period_end', 'streams', 'revenue', 'currency',
-            'source_row_hash', 'created_at'
+            'upload', 'period_start', 'period_end', 'streams', 'revenue', 'currency', 'territory',
+            'row_key', 'created_at'
         ]
         extra_kwargs = {
             'artist': {'write_only': True},
@@ -59,29 +80,69 @@ class CsvUploadSerializer(serializers.ModelSerializer):
     class Meta:
         model = CsvUpload
         fields = [
-            'id', 'artist', 'artist_name', 'filename', 'uploaded_at', 'status',
-            'processed_rows', 'total_rows', 'success_count', 'error_count', 'error_log'
+            'id', 'artist', 'artist_name', 'batch', 'filename', 'uploaded_at', 'status',
+            'processed_rows', 'total_rows', 'success_count', 'error_count', 'error_log', 'size_bytes',
+            'queued_at', 'started_at', 'finished_at', 'stage', 'stage_timings', 'duration_seconds',
+            'rows_per_second', 'process_rss_peak_bytes', 'process_tracemalloc_peak_bytes'
+        ]
+        read_only_fields = [
+            'batch', 'uploaded_at', 'processed_rows', 'success_count', 'error_count', 'size_bytes', 'queued_at',
+            'started_at', 'finished_at', 'stage', 'stage_timings', 'duration_seconds', 'rows_per_second',
+            'process_rss_peak_bytes', 'process_tracemalloc_peak_bytes'
         ]
-        read_only_fields = ['uploaded_at', 'processed_rows', 'success_count', 'error_count']
         extra_kwargs = {
             'artist': {'write_only': True}
         }
 
 
+class UploadBatchSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadBatch
+        fields = ['id', 'created_at', 'file_count']
+        read_only_fields = fields
+
+
+class DataExportSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = DataExport
+        fields = [
+            'id', 'file_format', 'filters', 'status', 'row_count', 'created_at', 'completed_at',
+            'error_log', 'download_url'
+        ]
+
+    def get_download_url(self, obj):
+        if obj.status != 'completed' or not obj.file:
+            return None
+        url = reverse('data-export-download', kwargs={'pk': obj.pk})
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
 # Serializers for dashboard responses
 class PlatformBreakdownSerializer(serializers.Serializer):
     platform_name = serializers.CharField()
     platform_icon = serializers.CharField()
     streams = serializers.IntegerField()
-    revenue = serializers.DecimalField(max_digits=12, decimal_places=2)
+    revenue = MicroAmountField(max_digits=12, decimal_places=2)
     percentage = serializers.IntegerField()
 
 
+class TerritoryBreakdownSerializer(serializers.Serializer):
+    territory = serializers.CharField()
+    territory_name = serializers.CharField()
+    streams = serializers.IntegerField()
+    revenue = MicroAmountField(max_digits=16, decimal_places=4)
+    percentage = serializers.FloatField()
+
+
 class DashboardSummarySerializer(serializers.Serializer):
     total_streams = serializers.IntegerField()
-    total_revenue = serializers.DecimalField(max_digits=12, decimal_places=2)
+    total_revenue = MicroAmountField(max_digits=12, decimal_places=2)
     currency = serializers.CharField()
     platform_breakdown = PlatformBreakdownSerializer(many=True)
+    territory_breakdown = TerritoryBreakdownSerializer(many=True, required=False)
     # Optional: Add more summary fields
     total_albums = serializers.IntegerField(required=False)
     total_tracks = serializers.IntegerField(required=False)
@@ -98,8 +159,49 @@ class TopTracksSerializer(serializers.Serializer):
     track_name = serializers.CharField()
     track_id = serializers.IntegerField()
     streams = serializers.IntegerField()
-    revenue = serializers.DecimalField(max_digits=12, decimal_places=2)
-    platform = serializers.CharField()
+    revenue = MicroAmountField(max_digits=12, decimal_places=2)
+    platform_count = serializers.IntegerField()
+
+
+class PlatformTopTrackSerializer(serializers.Serializer):
+    rank = serializers.IntegerField()
+    track_name = serializers.CharField()
+    track_id = serializers.IntegerField()
+    streams = serializers.IntegerField()
+    revenue = MicroAmountField(max_digits=12, decimal_places=2)
+
+
+class PlatformTopTracksSerializer(serializers.Serializer):
+    platform_id = serializers.IntegerField()
+    platform_name = serializers.CharField()
+    tracks = PlatformTopTrackSerializer(many=True)
+
+
+# Serializers for catalog listings
+class TrackCatalogSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    album_id = serializers.IntegerField(allow_null=True)
+    album_title = serializers.CharField(allow_null=True)
+    track_number = serializers.IntegerField(allow_null=True)
+    duration_seconds = serializers.IntegerField(allow_null=True)
+    created_at = serializers.DateTimeField()
+    streams = serializers.IntegerField()
+    revenue = MicroAmountField(max_digits=16, decimal_places=4)
+    platform_count = serializers.IntegerField()
+    last_period_end = serializers.DateField(allow_null=True)
+
+
+class AlbumCatalogSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    title = serializers.CharField()
+    release_date = serializers.DateField(allow_null=True)
+    created_at = serializers.DateTimeField()
+    track_count = serializers.IntegerField()
+    streams = serializers.IntegerField()
+    revenue = MicroAmountField(max_digits=16, decimal_places=4)
+    platform_count = serializers.IntegerField()
+    last_period_end = serializers.DateField(allow_null=True)
 
 
 # from rest_framework import serializers
@@ -0,0 +1,31 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Album, CsvUpload, Platform, Track
+from .reference import invalidate_platforms
+from .rollups import mark_artist_data_changed
+
+
+@receiver(post_delete, sender=CsvUpload)
+@receiver(post_delete, sender=Track)
+def artist_data_deleted(sender, instance, **kwargs):
+    # Both cascade to the artist's royalty statements
+    mark_artist_data_changed(instance.artist_id, create=False)
+
+
+@receiver(post_save, sender=Track)
+@receiver(post_save, sender=Album)
+def artist_catalog_saved(sender, instance, **kwargs):
+    # Catalog edits show up in listings but leave statement sums untouched
+    mark_artist_data_changed(instance.artist_id, statements_changed=False)
+
+
+@receiver(post_delete, sender=Album)
+def artist_album_deleted(sender, instance, **kwargs):
+    mark_artist_data_changed(instance.artist_id, create=False, statements_changed=False)
+
+
+@receiver(post_save, sender=Platform)
+@receiver(post_delete, sender=Platform)
+def platform_changed(sender, instance, **kwargs):
+    invalidate_platforms()
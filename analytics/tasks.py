@@ -0,0 +1,41 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'ANALYTICS_BACKGROUND_WORKERS', 2),
+            thread_name_prefix='analytics-task',
+        )
+    return _executor
+
+
+def _run(func, args, kwargs):
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        logger.exception("Background task %s failed", getattr(func, '__name__', func))
+        raise
+    finally:
+        close_old_connections()
+
+
+def run_in_background(func, *args, **kwargs):
+    """Run func off the request thread.
+
+    With ANALYTICS_RUN_TASKS_INLINE enabled (tests, local debugging) the task
+    runs synchronously instead, so it shares the caller's transaction.
+    """
+    if getattr(settings, 'ANALYTICS_RUN_TASKS_INLINE', False):
+        return func(*args, **kwargs)
+    return _get_executor().submit(_run, func, args, kwargs)
@@ -1,3 +1,1203 @@
-from django.test import TestCase
+import asyncio
+import csv
+import heapq
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import close_old_connections, connection
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import exports, queries
+from .dashboard import BUNDLE_WIDGETS
+from .exports import DOWNLOAD_CHUNK_SIZE, EXPORT_COLUMNS, STREAMING_FORMATS, parquet_available
+from .hashing import HASH_COLUMNS, key_frame, statement_key
+from .ingestion import ingest_dataframe, parse_dates, read_statements, resolve_platforms
+from .instrumentation import UploadMetrics, ingestion_throughput
+from .matching import track_match_key
+from .money import format_micros, from_micros, micros_to_float, to_micros
+from .models import Album, CsvUpload, DataExport, Platform, RoyaltyStatement, Track
+from .progress import EVENT_FIELDS, ProgressHub, _notify, event_stream, progress_event
+from .reference import invalidate_platforms
+from .rollups import mark_artist_data_changed, rebuild_artist_rollups
+from .serializers import MicroAmountField, RoyaltyStatementSerializer
+from .scheduler import (
+    FairSharePolicy, FifoPolicy, QueuedUpload, UploadScheduler, fail_stale_uploads, uploads_in_flight
+)
+from .timeseries import GRANULARITIES, SPLITS, time_series
+
+
+class AnalyticsTestCase(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='artist', email='artist@example.com', password='password'
+        )
+        self.platform = Platform.objects.create(name='Spotify', api_name='spotify')
+        self.track = Track.objects.create(artist=self.user, name='Song')
+        RoyaltyStatement.objects.create(
+            artist=self.user, track=self.track, platform=self.platform,
+            period_start='2024-01-01', period_end='2024-01-31', streams=100, revenue='1.2500'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, path, **extra):
+        return self.client.get(path, secure=True, **extra)
+
+    def statement(self, track, platform, period_end, streams, revenue, **fields):
+        period_end = date.fromisoformat(period_end)
+        return RoyaltyStatement.objects.create(
+            artist=self.user, track=track, platform=platform, period_start=period_end.replace(day=1),
+            period_end=period_end, streams=streams, revenue=revenue, **fields
+        )
+
+
+class ConditionalGetTests(AnalyticsTestCase):
+    def test_matching_etag_returns_304_without_aggregate_queries(self):
+        response = self.get('/api/streams/by-platform')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get('/api/streams/by-platform', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 1)
+        for query in queries.captured_queries:
+            self.assertNotIn('SUM(', query['sql'].upper())
+            self.assertNotIn('analytics_royaltystatement', query['sql'])
+
+    def test_data_change_invalidates_etag(self):
+        etag = self.get('/api/streams/total')['ETag']
+        mark_artist_data_changed(self.user.id)
+        response = self.get('/api/streams/total', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_varies_with_query_and_media_type(self):
+        etag = self.get('/api/streams/top-tracks?limit=5&sort_by=streams')['ETag']
+        self.assertEqual(self.get('/api/streams/top-tracks?sort_by=streams&limit=5')['ETag'], etag)
+        self.assertNotEqual(self.get('/api/streams/top-tracks?limit=1&sort_by=streams')['ETag'], etag)
+
+        response = self.get('/api/streams/top-tracks?limit=1&sort_by=streams', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Accept', response['Vary'])
+
+        html = self.get('/api/streams/top-tracks?limit=5&sort_by=streams', HTTP_ACCEPT='text/html', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(html.status_code, 200)
+        self.assertNotEqual(html['ETag'], etag)
+
+    def test_list_endpoints_send_validators(self):
+        for path in ['/api/royalty-statements', '/api/tracks', '/api/albums', '/api/csv-uploads']:
+            response = self.get(path)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('ETag', response)
+            self.assertIn('Last-Modified', response)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN plans are PostgreSQL-specific')
+class CoveringIndexPlanTests(TransactionTestCase):
+    """The main per-artist aggregates must be answerable from the covering indexes alone."""
+
+    def setUp(self):
+        platforms = [Platform.objects.create(name=f'P{i}', api_name=f'p{i}') for i in range(4)]
+        statements = []
+        for a in range(10):
+            artist = get_user_model().objects.create_user(
+                username=f'artist{a}', email=f'artist{a}@example.com', password='password'
+            )
+            tracks = [Track.objects.create(artist=artist, name=f'T{i}') for i in range(10)]
+            for i in range(300):
+                statements.append(RoyaltyStatement(
+                    artist=artist, track=tracks[i % 10], platform=platforms[i % 4],
+                    period_start=date(2024, i % 12 + 1, 1), period_end=date(2024, i % 12 + 1, 28),
+                    streams=i, revenue=i / 100
+                ))
+        RoyaltyStatement.objects.bulk_create(statements)
+        self.artist = artist
+        with connection.cursor() as cursor:
+            cursor.execute('VACUUM ANALYZE analytics_royaltystatement')
+            # Plans must not fall back to the heap even when the planner could
+            cursor.execute('SET enable_seqscan = off')
+            cursor.execute('SET enable_bitmapscan = off')
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            cursor.execute('RESET enable_seqscan')
+            cursor.execute('RESET enable_bitmapscan')
+
+    def assertIndexOnly(self, queryset):
+        plan = queryset.explain()
+        self.assertRegex(plan, r'Index Only Scan using stmt_artist_\w+_cov_idx on analytics_royaltystatement')
+        self.assertNotRegex(plan, re.compile(r'(Seq|Bitmap Heap) Scan on analytics_royaltystatement'))
+
+    def test_totals(self):
+        self.assertIndexOnly(RoyaltyStatement.objects.filter(artist=self.artist).values('artist').annotate(
+            streams=Sum('streams'), revenue=Sum('revenue_micros')))
+
+    def test_by_platform(self):
+        self.assertIndexOnly(RoyaltyStatement.objects.filter(artist=self.artist).values('platform_id').annotate(
+            streams=Sum('streams'), revenue=Sum('revenue_micros')))
+
+    def test_by_track(self):
+        self.assertIndexOnly(RoyaltyStatement.objects.filter(artist=self.artist).values('track_id').annotate(
+            streams=Sum('streams'), revenue=Sum('revenue_micros')))
+
+    def test_date_window(self):
+        self.assertIndexOnly(RoyaltyStatement.objects.filter(
+            artist=self.artist, period_end__gte=date(2024, 3, 1), period_end__lte=date(2024, 6, 30)
+        ).values('platform_id', 'track_id').annotate(streams=Sum('streams'), revenue=Sum('revenue_micros')))
+
+
+class UploadBatchTests(AnalyticsTestCase):
+    HEADER = b"track_name,platform,streams,revenue,period_end\n"
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name, ANALYTICS_RUN_TASKS_INLINE=True))
+
+    def test_overlapping_files_import_shared_rows_once(self):
+        first = self.HEADER + b"Intro,Spotify,10,0.5,2024-02-29\nOutro,Spotify,20,1.0,2024-02-29\n"
+        second = self.HEADER + b"Outro,Spotify,20,1.0,2024-02-29\nBonus,Spotify,30,1.5,2024-02-29\n"
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/csv-uploads/batch', {'files': [
+                SimpleUploadedFile('a.csv', first, 'text/csv'), SimpleUploadedFile('b.csv', second, 'text/csv'),
+            ]}, format='multipart', secure=True)
+        self.assertEqual(response.status_code, 202)
+
+        batch = self.get(f"/api/csv-uploads/batches/{response.data['id']}").data
+        self.assertEqual(batch['status'], 'completed')
+        self.assertEqual((batch['processed_rows'], batch['success_count'], batch['duplicate_rows']), (4, 3, 1))
+        self.assertEqual(RoyaltyStatement.objects.filter(period_end=date(2024, 2, 29)).aggregate(
+            total=Sum('streams'))['total'], 60)
+
+
+class TopTracksTests(AnalyticsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.deezer = Platform.objects.create(name='Deezer', api_name='deezer')
+        hit, solo, deep = (Track.objects.create(artist=self.user, name=name) for name in ['Hit', 'Solo', 'Deep'])
+        for track, platform, streams, revenue in [
+            (hit, self.platform, 120, '0.50'), (hit, self.deezer, 120, '0.50'),
+            (solo, self.platform, 150, '3.00'), (deep, self.deezer, 10, '5.00'),
+        ]:
+            self.statement(track, platform, '2024-02-29', streams, revenue)
+
+    def test_tracks_are_ranked_on_their_total_across_platforms(self):
+        rows = self.get('/api/streams/top-tracks').data
+        self.assertEqual([(row['track_name'], row['streams'], row['platform_count']) for row in rows],
+                         [('Hit', 240, 2), ('Solo', 150, 1), ('Song', 100, 1), ('Deep', 10, 1)])
+        self.assertEqual(rows[0]['revenue'], '1.00')
+
+        rows = self.get('/api/streams/top-tracks?sort_by=revenue&limit=2').data
+        self.assertEqual([(row['track_name'], row['revenue']) for row in rows], [('Deep', '5.00'), ('Solo', '3.00')])
+        rows = self.get('/api/streams/top-tracks?start_date=2024-02-01').data
+        self.assertNotIn('Song', [row['track_name'] for row in rows])
+
+    def test_top_tracks_within_each_platform(self):
+        platforms = self.get('/api/streams/top-tracks/by-platform?limit=2').data['platforms']
+        self.assertEqual(
+            [(p['platform_name'], [(t['rank'], t['track_name'], t['streams']) for t in p['tracks']]) for p in platforms],
+            [('Deezer', [(1, 'Hit', 120), (2, 'Deep', 10)]), ('Spotify', [(1, 'Solo', 150), (2, 'Hit', 120)])]
+        )
+
+    def test_unknown_sort_field_is_rejected(self):
+        self.assertEqual(self.get('/api/streams/top-tracks?sort_by=plays').status_code, 400)
+
+
+class TimeSeriesTests(AnalyticsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.deezer = Platform.objects.create(name='Deezer', api_name='deezer')
+        self.statement(self.track, self.deezer, '2024-03-31', 40, '0.75')
+        self.statement(self.track, self.platform, '2024-04-30', 20, '0.50')
+
+    def series(self, query='', granularity='month'):
+        response = self.get(f'/api/streams/time-series?granularity={granularity}{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.data['series']
+
+    @staticmethod
+    def points(series, field='streams'):
+        return [(point['date'], point[field]) for point in series['points']]
+
+    def test_empty_buckets_are_filled_with_zeros(self):
+        [series] = self.series()
+        self.assertEqual(self.points(series), [
+            ('2024-01-01', 100), ('2024-02-01', 0), ('2024-03-01', 40), ('2024-04-01', 20),
+        ])
+        # The requested window is filled too, beyond the first and last statements
+        [series] = self.series('&start_date=2023-12-01&end_date=2024-05-31')
+        self.assertEqual([streams for _, streams in self.points(series)], [0, 100, 0, 40, 20, 0])
+        [series] = self.series(granularity='quarter')
+        self.assertEqual(self.points(series), [('2024-01-01', 140), ('2024-04-01', 20)])
+
+    def test_split_series_share_the_buckets(self):
+        series = {item['label']: [streams for _, streams in self.points(item)]
+                  for item in self.series('&split=platform')}
+        self.assertEqual(series, {'Spotify': [100, 0, 0, 20], 'Deezer': [0, 0, 40, 0]})
+
+    def test_cumulative_mode(self):
+        [series] = self.series('&mode=cumulative')
+        self.assertEqual([streams for _, streams in self.points(series)], [100, 100, 140, 160])
+        self.assertEqual([revenue for _, revenue in self.points(series, 'revenue')], [1.25, 1.25, 2.0, 2.5])
+
+    def test_moving_average_mode(self):
+        response = self.get('/api/streams/time-series?granularity=month&mode=moving_average&window=2')
+        self.assertEqual(response.data['window'], 2)
+        [series] = response.data['series']
+        self.assertEqual([streams for _, streams in self.points(series)], [100.0, 50.0, 20.0, 30.0])
+        self.assertEqual([revenue for _, revenue in self.points(series, 'revenue')], [1.25, 0.625, 0.375, 0.625])
+
+    def test_invalid_parameters_are_rejected(self):
+        for query in ['granularity=hour', 'split=album', 'mode=median']:
+            self.assertEqual(self.get(f'/api/streams/time-series?{query}').status_code, 400)
+
+
+class PeriodComparisonTests(AnalyticsTestCase):
+    def setUp(self):
+        super().setUp()
+        deezer = Platform.objects.create(name='Deezer', api_name='deezer')
+        fresh, fading = (Track.objects.create(artist=self.user, name=name) for name in ['Fresh', 'Fading'])
+        self.statement(self.track, self.platform, '2024-02-29', 150, '1.50')
+        self.statement(fresh, deezer, '2024-02-29', 30, '0.30')
+        self.statement(fading, self.platform, '2024-01-31', 80, '0.80')
+        self.statement(fading, self.platform, '2024-02-29', 20, '0.20')
+
+    def compare(self, query=''):
+        response = self.get(f'/api/streams/compare?start_date=2024-02-01&end_date=2024-02-29{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_totals_and_platform_changes(self):
+        data = self.compare()
+        self.assertEqual((data['previous']['start_date'], data['previous']['end_date']),
+                         (date(2024, 1, 1), date(2024, 1, 31)))
+        self.assertEqual((data['current']['streams'], data['previous']['streams']), (200, 180))
+        self.assertEqual((data['change']['streams_change'], data['change']['streams_change_pct']), (20, 11.11))
+        self.assertEqual(
+            [(p['platform_name'], p['streams_change'], p['streams_change_pct']) for p in data['platforms']],
+            [('Spotify', -10, -5.56), ('Deezer', 30, None)]
+        )
+        # Omitting the window compares the latest month with the one before
+        self.assertEqual(self.get('/api/streams/compare').data['current'], data['current'])
+
+    def test_movers(self):
+        tracks = self.compare()['movers']['tracks']
+        self.assertEqual([(t['name'], t['streams_change']) for t in tracks['gainers']], [('Song', 50), ('Fresh', 30)])
+        self.assertEqual([(t['name'], t['streams_change'], t['streams_change_pct']) for t in tracks['losers']],
+                         [('Fading', -60, -75.0)])
+        gainers = self.compare('&sort_by=revenue&limit=1')['movers']['tracks']['gainers']
+        self.assertEqual([(t['name'], t['revenue_change']) for t in gainers], [('Fresh', 0.3)])
+
+    def test_changes_from_nothing_have_no_percentage(self):
+        data = self.compare('&compare_to=year')
+        self.assertEqual(data['previous']['start_date'], date(2023, 2, 1))
+        self.assertEqual((data['previous']['streams'], data['change']['streams_change_pct']), (0, None))
+        self.assertIsNone(data['change']['revenue_change_pct'])
+
+    def test_half_open_window_is_rejected(self):
+        self.assertEqual(self.get('/api/streams/compare?start_date=2024-02-01').status_code, 400)
+
+
+class SparseFieldsetTests(AnalyticsTestCase):
+    def test_full_rows_match_the_serializer(self):
+        statement = RoyaltyStatement.objects.select_related('artist', 'track', 'platform').get()
+        row = self.get('/api/royalty-statements').json()[0]
+        self.assertEqual(row, json.loads(json.dumps(RoyaltyStatementSerializer(statement).data)))
+        self.assertEqual(row['revenue'], '1.2500')
+
+    def test_only_requested_columns_are_selected(self):
+        with CaptureQueriesContext(connection) as queries:
+            rows = self.get('/api/royalty-statements?fields=id,streams').data
+        self.assertEqual(rows, [{'id': RoyaltyStatement.objects.get().id, 'streams': 100}])
+        [select] = [q['sql'] for q in queries.captured_queries if 'analytics_royaltystatement' in q['sql']]
+        # Only the default ordering's platform join remains
+        for column in ['analytics_track', get_user_model()._meta.db_table, 'revenue_micros', 'row_key']:
+            self.assertNotIn(column, select)
+
+        rows = self.get('/api/royalty-statements?fields=track_name,artist_name,revenue').data
+        self.assertEqual(rows, [{'track_name': 'Song', 'artist_name': 'artist', 'revenue': '1.2500'}])
+
+    def test_unknown_fields_are_rejected(self):
+        for path in ['/api/royalty-statements', '/api/tracks', '/api/albums', '/api/csv-uploads']:
+            with self.subTest(path=path):
+                response = self.get(f'{path}?fields=id,plays')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('plays', str(response.data['fields']))
+
+    def test_upload_queue_fields_can_be_selected(self):
+        CsvUpload.objects.create(artist=self.user, filename='a.csv')
+        rows = self.get('/api/csv-uploads?fields=filename,queue_position').data
+        self.assertEqual(rows, [{'filename': 'a.csv', 'queue_position': None}])
+
+
+class CatalogTests(AnalyticsTestCase):
+    def setUp(self):
+        super().setUp()
+        deezer = Platform.objects.create(name='Deezer', api_name='deezer')
+        album = Album.objects.create(artist=self.user, title='LP')
+        hit = Track.objects.create(artist=self.user, name='Hit', album=album)
+        Track.objects.filter(id=self.track.id).update(album=album)
+        Track.objects.create(artist=self.user, name='Quiet')
+        Album.objects.create(artist=self.user, title='EP')
+        self.statement(hit, self.platform, '2024-02-29', 300, '3.00')
+        self.statement(hit, deezer, '2024-02-29', 50, '0.50')
+
+    def names(self, query=''):
+        response = self.get(f'/api/catalog/tracks?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [row['name'] for row in response.data['results']]
+
+    def test_tracks_carry_their_totals(self):
+        rows = {row['name']: row for row in self.get('/api/catalog/tracks').data['results']}
+        self.assertEqual((rows['Hit']['streams'], rows['Hit']['revenue'], rows['Hit']['platform_count']),
+                         (350, '3.5000', 2))
+        self.assertEqual((rows['Hit']['album_title'], rows['Hit']['last_period_end']), ('LP', '2024-02-29'))
+        self.assertEqual((rows['Quiet']['streams'], rows['Quiet']['last_period_end']), (0, None))
+
+    def test_sorting(self):
+        self.assertEqual(self.names(), ['Hit', 'Song', 'Quiet'])
+        self.assertEqual(self.names('sort_by=name&order=asc'), ['Hit', 'Quiet', 'Song'])
+        # Tracks without statements sort last either way
+        self.assertEqual(self.names('sort_by=last_period_end&order=asc'), ['Song', 'Hit', 'Quiet'])
+        self.assertEqual(self.names('sort_by=last_period_end'), ['Hit', 'Song', 'Quiet'])
+        self.assertEqual(self.get('/api/catalog/tracks?sort_by=plays').status_code, 400)
+
+    def test_pagination(self):
+        page = self.get('/api/catalog/tracks?page_size=2').data
+        self.assertEqual((page['count'], len(page['results'])), (3, 2))
+        self.assertIsNotNone(page['next'])
+        self.assertEqual(self.names('page_size=2&page=2'), ['Quiet'])
+        self.assertEqual(self.get('/api/catalog/tracks?page=3').status_code, 404)
+
+    def test_rollups_give_the_same_catalog(self):
+        statements = self.get('/api/catalog/tracks').data['results']
+        rebuild_artist_rollups(self.user.id)
+        response = self.get('/api/catalog/tracks')
+        self.assertEqual(response['X-Analytics-Source'], 'rollup')
+        self.assertEqual(response.data['results'], statements)
+
+    def test_albums(self):
+        rows = self.get('/api/catalog/albums').data['results']
+        self.assertEqual([(row['title'], row['track_count'], row['streams'], row['platform_count']) for row in rows],
+                         [('LP', 2, 450, 2), ('EP', 0, 0, 0)])
+        rows = self.get('/api/catalog/albums?sort_by=title&order=asc').data['results']
+        self.assertEqual([row['title'] for row in rows], ['EP', 'LP'])
+
+
+@override_settings(ANALYTICS_SEARCH_BACKEND='memory')
+class MemorySearchTests(AnalyticsTestCase):
+    def setUp(self):
+        super().setUp()
+        for name in ['Midnight Train', 'Train of Thought', 'Trainer', 'Rain']:
+            Track.objects.create(artist=self.user, name=name)
+        Album.objects.create(artist=self.user, title='Night Trains')
+        other = get_user_model().objects.create_user(username='other', email='other@example.com', password='password')
+        Track.objects.create(artist=other, name='Train Ride')
+
+    def search(self, query):
+        response = self.get(f'/api/search?{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Search-Backend'], 'memory')
+        return [(row['type'], row['name']) for row in response.data['results']]
+
+    def test_prefix_then_substring_then_similar_matches(self):
+        self.assertEqual(self.search('q=train'), [
+            ('track', 'Train of Thought'), ('track', 'Trainer'), ('track', 'Midnight Train'),
+            ('album', 'Night Trains'), ('track', 'Rain'),
+        ])
+
+    def test_misspellings_match_by_trigrams(self):
+        self.assertEqual(self.search('q=midnite')[0], ('track', 'Midnight Train'))
+
+    def test_types_and_limit(self):
+        self.assertEqual(self.search('q=train&types=album'), [('album', 'Night Trains')])
+        self.assertEqual(self.search('q=spot'), [('platform', 'Spotify')])
+        self.assertEqual(len(self.search('q=train&limit=2')), 2)
+        self.assertEqual(self.get('/api/search?q=train&types=artist').status_code, 400)
+        self.assertEqual(self.get('/api/search?q=').status_code, 400)
+
+    def test_index_follows_catalog_changes(self):
+        self.assertEqual(self.search('q=lullaby'), [])
+        Track.objects.create(artist=self.user, name='Lullaby')
+        self.assertEqual(self.search('q=lullaby'), [('track', 'Lullaby')])
+
+
+class RowKeyTests(AnalyticsTestCase):
+    VARIANTS = [
+        {'revenue': '0.00005', 'currency': 'usd', 'territory': 'ZZ'},  # half a unit rounds to even
+        {'revenue': '0.00015', 'currency': '', 'territory': 'GB'},
+        {'revenue': '12.3456', 'currency': 'eur', 'territory': 'NA'},
+        {'revenue': '-1.5', 'currency': 'USD', 'territory': 'US', 'period_end': '2024-02-29'},
+    ]
+
+    def build(self, period_end='2024-01-31', **fields):
+        return RoyaltyStatement(artist=self.user, track=self.track, platform=self.platform,
+                                period_start='2024-01-01', period_end=date.fromisoformat(period_end), streams=7,
+                                **fields)
+
+    def test_save_matches_the_vectorized_keys(self):
+        saved = []
+        for fields in self.VARIANTS:
+            statement = self.build(**fields)
+            with self.assertNumQueries(1):  # the INSERT; keys need no lookups
+                statement.save()
+            saved.append(statement)
+        frame = pd.DataFrame.from_records(
+            RoyaltyStatement.objects.filter(id__in=[s.id for s in saved]).order_by('id').values(*HASH_COLUMNS)
+        )
+        self.assertEqual(key_frame(frame).tolist(), [statement.row_key for statement in saved])
+        self.assertEqual(len({statement.row_key for statement in saved}), len(saved))
+
+    def test_bulk_create_matches_save(self):
+        saved = []
+        for fields in self.VARIANTS:
+            statement = self.build(**fields)
+            saved.append(statement_key(statement))
+        created = RoyaltyStatement.objects.bulk_create([self.build(**fields) for fields in self.VARIANTS])
+        self.assertEqual([statement.row_key for statement in created], saved)
+
+    def test_ingested_rows_match_save(self):
+        upload = CsvUpload.objects.create(artist=self.user, filename='s.csv')
+        csv = ("track_name,platform,streams,revenue,currency,period_end,country\n"
+               "Song,Spotify,7,0.00015,eur,2024-01-31,GB\nSong,Spotify,7,2.5,,2024-02-29,\n")
+        self.assertEqual(ingest_dataframe(upload, read_statements(io.StringIO(csv))), (2, []))
+        statements = RoyaltyStatement.objects.filter(upload=upload).order_by('period_end')
+        self.assertEqual([statement.currency for statement in statements], ['EUR', 'USD'])
+        for statement in statements:
+            self.assertEqual(statement.row_key, statement_key(statement))
+
+
+class DashboardBundleTests(AnalyticsTestCase):
+    def setUp(self):
+        super().setUp()
+        deezer = Platform.objects.create(name='Deezer', api_name='deezer')
+        other = Track.objects.create(artist=self.user, name='Other Song')
+        for track, platform, streams, revenue, territory in [
+            (self.track, self.platform, 40, '0.5000', 'GB'),
+            (other, deezer, 300, '0.9999', 'US'),
+            (other, self.platform, 5, '0.0001', 'US'),
+        ]:
+            RoyaltyStatement.objects.create(
+                artist=self.user, track=track, platform=platform, territory=territory,
+                period_start='2024-02-01', period_end='2024-02-29', streams=streams, revenue=revenue
+            )
+
+    def test_platform_revenue_matches_by_platform_endpoint(self):
+        platforms = self.get('/api/streams/by-platform').data['platforms']
+        self.assertEqual([(p['platform_name'], p['revenue']) for p in platforms],
+                         [('Deezer', 0.9999), ('Spotify', 1.7501)])
+        bundle = self.get('/api/artist/dashboard-bundle?widgets=summary,by_platform').data
+        self.assertEqual(bundle['by_platform']['platforms'], platforms)
+        breakdown = {row['platform_name']: row['revenue'] for row in bundle['summary']['platform_breakdown']}
+        self.assertEqual(breakdown, {'Deezer': '1.00', 'Spotify': '1.75'})
+
+    def test_widgets_match_their_standalone_endpoints(self):
+        bundle = self.get('/api/artist/dashboard-bundle').data
+        self.assertEqual(set(bundle), set(BUNDLE_WIDGETS))
+        for widget, path in [
+            ('total_streams', '/api/streams/total'),
+            ('total_revenue', '/api/revenue/total'),
+            ('by_platform', '/api/streams/by-platform'),
+            ('by_territory', '/api/streams/by-territory'),
+            ('over_time', '/api/streams/over-time'),
+            ('top_tracks', '/api/streams/top-tracks'),
+        ]:
+            with self.subTest(widget=widget):
+                self.assertEqual(bundle[widget], self.get(path).data)
+        self.assertEqual(self.get('/api/artist/dashboard-bundle?widgets=over_time&period=1year').data['over_time'],
+                         self.get('/api/streams/over-time?period=1year').data)
+
+    def test_only_the_reads_the_widgets_need_run(self):
+        with mock.patch('analytics.dashboard._pair_scan') as pair_scan:
+            response = self.get('/api/artist/dashboard-bundle?widgets=over_time,by_territory')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data), {'over_time', 'by_territory'})
+        self.assertIn('X-Analytics-Source', response)
+        pair_scan.assert_not_called()
+
+    def test_unknown_widget_is_rejected(self):
+        response = self.get('/api/artist/dashboard-bundle?widgets=summary,weather')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('weather', response.data['error'])
+
+
+class ExportTests(AnalyticsTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        for month in range(2, 6):
+            RoyaltyStatement.objects.create(
+                artist=self.user, track=self.track, platform=self.platform, territory='GB',
+                period_start=date(2024, month, 1), period_end=date(2024, month, 28), streams=month, revenue='0.5'
+            )
+        self.token = str(AccessToken.for_user(self.user))
+
+    def export(self, query=''):
+        response = self.get(f'/api/royalty-statements/export{query}')
+        return response, b''.join(response.streaming_content).decode()
+
+    def post_export(self, data):
+        return self.client.post('/api/royalty-statements/export', data, format='json', secure=True)
+
+    def test_csv_has_a_header_and_exact_revenue(self):
+        response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('filename="royalty-statements.csv"', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(body)))
+        self.assertEqual(rows[0], EXPORT_COLUMNS)
+        self.assertEqual(len(rows), 6)
+        latest = dict(zip(EXPORT_COLUMNS, rows[1]))
+        self.assertEqual(
+            [latest['track_name'], latest['platform_name'], latest['period_end'], latest['streams'], latest['revenue']],
+            ['Song', 'Spotify', '2024-05-28', '5', '0.500000']
+        )
+        self.assertEqual(rows[-1][EXPORT_COLUMNS.index('revenue')], '1.250000')
+
+    def test_ndjson_emits_one_object_per_row(self):
+        response, body = self.export('?file_format=ndjson&territory=gb&start_date=2024-04-01')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row['period_end'] for row in rows], ['2024-05-28', '2024-04-28'])
+        self.assertEqual(list(rows[0]), EXPORT_COLUMNS)
+        self.assertEqual((rows[0]['revenue'], rows[0]['territory'], rows[0]['streams']), ('0.500000', 'GB', 5))
+
+    def test_filters_match_the_list_view(self):
+        other = Platform.objects.create(name='Deezer', api_name='deezer')
+        self.statement(self.track, other, '2024-03-31', 7, '2')
+        _, body = self.export('?platform=deezer')
+        self.assertEqual(len(body.splitlines()), 2)
+        _, body = self.export(f'?platform={self.platform.id}&end_date=2024-02-29')
+        self.assertEqual([row[EXPORT_COLUMNS.index('period_end')] for row in csv.reader(io.StringIO(body))][1:],
+                         ['2024-02-28', '2024-01-31'])
+
+        self.assertEqual(self.get('/api/royalty-statements/export?start_date=May').status_code, 400)
+        self.assertEqual(self.get('/api/royalty-statements/export?file_format=xlsx').status_code, 400)
+
+    @override_settings(ANALYTICS_RUN_TASKS_INLINE=True)
+    def test_parquet_export_lifecycle(self):
+        if not parquet_available():
+            self.skipTest('pyarrow is not installed')
+        import pyarrow.parquet as pq
+
+        seen = []
+        write = exports.write_parquet
+
+        def recording(queryset, path):
+            seen.append(DataExport.objects.get().status)
+            return write(queryset, path)
+
+        with mock.patch('analytics.exports.write_parquet', recording):
+            response = self.post_export({'territory': 'GB'})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(seen, ['processing'])
+        self.assertEqual((response.data['status'], response.data['row_count']), ('completed', 4))
+        self.assertEqual(response.data['filters'], {'territory': 'GB'})
+        self.assertTrue(response.data['download_url'].endswith(f"/api/exports/{response.data['id']}/download"))
+
+        export = DataExport.objects.get()
+        self.assertIsNotNone(export.completed_at)
+        with export.file.open('rb') as fh:
+            table = pq.read_table(fh)
+        self.assertEqual(table.column_names, EXPORT_COLUMNS)
+        self.assertEqual(table.column('revenue').to_pylist(), [Decimal('0.5')] * 4)
+
+    @override_settings(ANALYTICS_RUN_TASKS_INLINE=True)
+    def test_parquet_export_failures(self):
+        if not parquet_available():
+            self.skipTest('pyarrow is not installed')
+        self.assertEqual(self.post_export({'file_format': 'csv'}).status_code, 400)
+        self.assertEqual(self.post_export({'upload': 'latest'}).status_code, 400)
+        self.assertFalse(DataExport.objects.exists())
+
+        with mock.patch('analytics.exports.write_parquet', side_effect=OSError('disk full')):
+            response = self.post_export({})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual((response.data['status'], response.data['error_log']), ('failed', 'disk full'))
+        self.assertIsNone(response.data['download_url'])
+        export = DataExport.objects.get()
+        self.assertIsNotNone(export.completed_at)
+        self.assertEqual(self.get(f'/api/exports/{export.id}/download').status_code, 404)
+
+    async def asgi_get(self, path):
+        return await self.async_client.get(path, secure=True, headers={'authorization': f'Bearer {self.token}'})
+
+    async def test_asgi_export_is_consumed_lazily(self):
+        consumed = []
+        stream_csv = STREAMING_FORMATS['csv'][0]
+
+        def counting(queryset):
+            for line in stream_csv(queryset):
+                consumed.append(line)
+                yield line
+
+        formats = {**STREAMING_FORMATS, 'csv': (counting, 'text/csv', 'csv')}
+        with mock.patch('analytics.views.STREAMING_FORMATS', formats), \
+                mock.patch('analytics.exports.EXPORT_CHUNK_SIZE', 2):
+            response = await self.asgi_get('/api/royalty-statements/export')
+            self.assertTrue(response.is_async)
+            chunks = aiter(response.streaming_content)
+            first = await anext(chunks)
+            self.assertEqual((first.count(b'\n'), len(consumed)), (2, 2))
+            rest = b''.join([chunk async for chunk in chunks])
+        self.assertEqual((first + rest).count(b'\n'), 6)
+
+    async def test_asgi_download_is_read_in_chunks(self):
+        export = await DataExport.objects.acreate(artist=self.user, status='completed')
+        body = os.urandom(DOWNLOAD_CHUNK_SIZE * 2 + 10)
+        await sync_to_async(export.file.save)('export.parquet', ContentFile(body))
+        response = await self.asgi_get(f'/api/exports/{export.id}/download')
+        self.assertTrue(response.is_async)
+        self.assertEqual(response['Content-Length'], str(len(body)))
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual((len(chunks), b''.join(chunks)), (3, body))
+
+
+class PlatformTests(AnalyticsTestCase):
+    def test_api_name_matches_in_any_case(self):
+        ytm = Platform.objects.create(name='YouTube Music', api_name='ytm')
+        self.assertEqual(resolve_platforms(['YTM', 'ytm']), {'YTM': ytm.id, 'ytm': ytm.id})
+        self.assertEqual(Platform.objects.count(), 2)
+
+    def test_etag_follows_the_rows_not_the_cache_version(self):
+        etag = self.get('/api/platforms')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_platforms()
+        self.assertEqual(self.get('/api/platforms', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Platform.objects.create(name='Tidal', api_name='tidal')
+        self.assertEqual(self.get('/api/platforms', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs concurrent writers (SQLite test databases serialize them)')
+class ConcurrentUploadTests(TransactionTestCase):
+    """Parallel uploads from one artist with overlapping tracks, platforms and rows."""
+    UPLOADS = 8
+
+    def setUp(self):
+        self.artist = get_user_model().objects.create_user(
+            username='artist', email='artist@example.com', password='password'
+        )
+
+    def frame(self, n):
+        # Every upload shares tracks, a new platform and half of its rows with the others
+        rows = []
+        for i in range(40):
+            shared = i % 2 == 0
+            rows.append({
+                'track_name': f'Song {i % 10}' if shared else f'Song {i % 10} (feat. Guest {n})',
+                'platform': 'Concurrent FM' if i % 3 else f'Station {i % 4}',
+                'streams': i + 1 if shared else 1000 * n + i,
+                'revenue': '0.0125',
+                'period_end': f'2024-{i % 12 + 1:02d}-28',
+            })
+        return pd.DataFrame(rows)
+
+    def test_parallel_uploads_have_no_spurious_errors(self):
+        frames = [self.frame(n) for n in range(self.UPLOADS)]
+        barrier = threading.Barrier(self.UPLOADS)
+        results, failures = [], []
+
+        def upload(df):
+            try:
+                record = CsvUpload.objects.create(artist=self.artist, filename='s.csv', total_rows=len(df))
+                barrier.wait(timeout=60)
+                results.append(ingest_dataframe(record, df))
+            except Exception as e:  # surfaced by the assertions below
+                failures.append(e)
+            finally:
+                close_old_connections()
+
+        threads = [threading.Thread(target=upload, args=(df,)) for df in frames]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(failures, [])
+        self.assertEqual([errors for _, errors in results], [[]] * self.UPLOADS)
+        distinct = pd.concat(frames).drop_duplicates()
+        statements = RoyaltyStatement.objects.filter(artist=self.artist)
+        self.assertEqual(sum(count for count, _ in results), len(distinct))
+        self.assertEqual(statements.count(), len(distinct))
+        self.assertEqual(statements.aggregate(total=Sum('streams'))['total'], distinct['streams'].sum())
+        # Every "Song N" variant resolves to one track per match key
+        self.assertEqual(Track.objects.filter(artist=self.artist).count(), 10)
+        self.assertEqual(Platform.objects.filter(name='Concurrent FM').count(), 1)
+
+
+class TerritoryIngestionTests(TestCase):
+    CSV = "track_name,platform,streams,revenue,period_end{header}\nSong,Spotify,10,0.5,2024-01-31{value}\n"
+
+    def setUp(self):
+        self.artist = get_user_model().objects.create_user(
+            username='artist', email='artist@example.com', password='password'
+        )
+
+    def ingest(self, header='', value=''):
+        upload = CsvUpload.objects.create(artist=self.artist, filename='s.csv')
+        return ingest_dataframe(upload, read_statements(io.StringIO(self.CSV.format(header=header, value=value))))
+
+    def test_na_is_namibia(self):
+        self.assertEqual(self.ingest(',country', ',NA'), (1, []))
+        self.assertEqual(RoyaltyStatement.objects.get().territory, 'NA')
+
+    def test_reupload_with_territory_matches_unknown_territory_rows(self):
+        self.assertEqual(self.ingest(), (1, []))
+        self.assertEqual(self.ingest(',country', ',NA'), (0, []))
+        self.assertEqual(RoyaltyStatement.objects.get().territory, 'ZZ')
+
+
+class ColumnarEngineTests(TestCase):
+    """The columnar engine must return exactly what the SQL engine does."""
+
+    def setUp(self):
+        self.artist = get_user_model().objects.create_user(
+            username='artist', email='artist@example.com', password='password'
+        )
+        platforms = [Platform.objects.create(name=name, api_name=name.lower()) for name in ['Spotify', 'Deezer']]
+        tracks = [Track.objects.create(artist=self.artist, name=f'Song {i}') for i in range(4)]
+        territories = ['US', 'GB', 'NA', 'ZZ']
+        day = date(2023, 11, 30)
+        for i in range(40):
+            RoyaltyStatement.objects.create(
+                artist=self.artist, track=tracks[i % 4], platform=platforms[i % 2],
+                territory=territories[i % 3 + (i % 5 == 0)], period_start=day - timedelta(days=6), period_end=day,
+                streams=(i * 37) % 101, revenue=f'{(i * 53) % 97}.{i:04d}',
+            )
+            day += timedelta(days=9)
+
+    def assertEnginesAgree(self, function, *args, **kwargs):
+        sql, _ = function(self.artist.id, *args, engine='sql', **kwargs)
+        columnar, source = function(self.artist.id, *args, engine='columnar', **kwargs)
+        self.assertEqual(source, 'columnar')
+        self.assertTrue(sql)
+        self.assertEqual(columnar, sql)
+        return sql
+
+    def test_top_tracks(self):
+        for sort_by in queries.TOP_TRACKS_SORT_FIELDS:
+            self.assertEnginesAgree(queries.top_tracks, limit=3, sort_by=sort_by)
+            self.assertEnginesAgree(queries.top_tracks, sort_by=sort_by, start_date=date(2024, 2, 1),
+                                    end_date=date(2024, 6, 30))
+
+    def test_territory_totals(self):
+        rows = self.assertEnginesAgree(queries.territory_totals)
+        self.assertEqual({row['territory'] for row in rows}, {'US', 'GB', 'NA', 'ZZ'})
+        self.assertEnginesAgree(queries.territory_totals, start_date=date(2024, 2, 1), end_date=date(2024, 6, 30))
+
+    def test_time_buckets(self):
+        def by_key(series):
+            return sorted(series, key=lambda item: (item['key'] is not None, item['key'] or 0))
+
+        for granularity in GRANULARITIES:
+            for split in SPLITS:
+                with self.subTest(granularity=granularity, split=split):
+                    sql, _ = time_series(self.artist.id, granularity, split, engine='sql')
+                    columnar, _ = time_series(self.artist.id, granularity, split, engine='columnar')
+                    self.assertTrue(sql)
+                    self.assertEqual(by_key(columnar), by_key(sql))
+
+    def test_time_buckets_before_1970(self):
+        track, platform = Track.objects.filter(artist=self.artist)[0], Platform.objects.get(name='Deezer')
+        for period_end in [date(1969, 12, 31), date(1968, 3, 31)]:
+            RoyaltyStatement.objects.create(
+                artist=self.artist, track=track, platform=platform, period_start=period_end.replace(day=1),
+                period_end=period_end, streams=5, revenue='1.5',
+            )
+        for split in SPLITS:
+            with self.subTest(split=split):
+                sql, _ = time_series(self.artist.id, 'year', split, engine='sql')
+                columnar, _ = time_series(self.artist.id, 'year', split, engine='columnar')
+                self.assertEqual(columnar, sql)
+                self.assertEqual(columnar[0]['points'][0]['date'], '1968-01-01')
+
+    def test_rollups_agree_with_columnar(self):
+        rebuild_artist_rollups(self.artist.id)
+        self.assertEnginesAgree(queries.top_tracks)
+        self.assertEnginesAgree(queries.territory_totals)
+        sql, source = time_series(self.artist.id, 'quarter', 'platform', engine='sql')
+        self.assertEqual(source, 'rollup')
+        self.assertEqual(time_series(self.artist.id, 'quarter', 'platform', engine='columnar')[0], sql)
+
+
+class MoneyTests(SimpleTestCase):
+    def test_to_micros_rounds_half_even(self):
+        for value, micros in [
+            ('1.2345675', 1234568), ('1.2345665', 1234566), ('0.0000005', 0), ('0.0000015', 2),
+            (Decimal('-2.5'), -2500000), (1.0001, 1000100), (3, 3000000), (np.int64(2), 2000000), (None, 0),
+        ]:
+            with self.subTest(value=value):
+                self.assertEqual(to_micros(value), micros)
+        for value in ['abc', 'NaN', 'Infinity', '']:
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                to_micros(value)
+
+    def test_round_trip_is_exact(self):
+        for value in ['0', '0.000001', '1.25', '-3.1', '99999999.999999', '0.1', '0.2', '0.3']:
+            with self.subTest(value=value):
+                self.assertEqual(from_micros(to_micros(value)), Decimal(value))
+        # Float sums drift; micro sums do not
+        self.assertEqual(from_micros(sum(to_micros(0.1) for _ in range(10))), Decimal(1))
+
+    def test_format_micros_matches_decimal_quantize(self):
+        values = [0, 1, 5, 15, 25, 499999, 500000, 1500000, 2500000, 1234567, -1234567, -5, -15, 10 ** 15 + 5]
+        for micros in values:
+            for places in range(7):
+                with self.subTest(micros=micros, places=places):
+                    # Amounts that round to zero lose their sign rather than printing -0.00
+                    self.assertEqual(format_micros(micros, places), str(from_micros(micros, places) + 0))
+
+    def test_api_representations(self):
+        self.assertEqual(micros_to_float(1750000), 1.75)
+        self.assertEqual(micros_to_float(1234567), 1.2346)
+        self.assertEqual(micros_to_float(1234567, places=None), 1.234567)
+        field = MicroAmountField(max_digits=12, decimal_places=2)
+        self.assertEqual(field.to_representation(1005000), '1.00')
+        self.assertEqual(field.to_representation(1015000), '1.02')
+        self.assertEqual(field.to_internal_value('1.25'), 1250000)
+        field = MicroAmountField(max_digits=12, decimal_places=2, coerce_to_string=False)
+        self.assertEqual(field.to_representation(1015000), Decimal('1.02'))
+
+
+class TrackMatchKeyTests(SimpleTestCase):
+    """Platform name variants share a key; different recordings and titles do not."""
+
+    def test_variants_share_a_key(self):
+        for name in ['Song (feat. X)', 'Song [ft. A & B]', 'Song (with Y)', 'Song - feat. X', 'SONG',
+                     'Song - Remastered 2011', 'Song (2011 Remaster)', 'Song (Radio Edit)']:
+            self.assertEqual(track_match_key(name), 'song', name)
+
+    def test_other_recordings_keep_their_suffix(self):
+        self.assertEqual(track_match_key('Song (feat. X) (Live)'), 'song live')
+        self.assertEqual(track_match_key('Song (feat. X) (Live)'), track_match_key('Song (Live)'))
+        self.assertNotEqual(track_match_key('Song (Live)'), track_match_key('Song'))
+
+    def test_title_words_are_not_suffixes(self):
+        self.assertEqual(track_match_key('Song - With You'), 'song with you')
+        self.assertEqual(track_match_key('Welcome to Ft. Lauderdale'), 'welcome to ft lauderdale')
+        self.assertEqual(track_match_key('Song feat. X'), 'song feat x')
+        self.assertEqual(track_match_key('(feat. X)'), 'feat x')
+
+
+def simulate(policy, jobs, workers):
+    """Run (artist_id, size, arrival_seconds[, batch_id]) jobs through `policy`; a job takes `size` seconds.
+
+    Returns ({job index: (start, end)}, peak per-artist concurrency, peak total concurrency).
+    """
+    epoch = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    arrivals = sorted(range(len(jobs)), key=lambda i: jobs[i][2])
+    queued, running, finishing, spans = [], Counter(), [], {}
+    peak_artist, peak_total, now = Counter(), 0, 0
+    while arrivals or queued or finishing:
+        while finishing and finishing[0][0] <= now:
+            _, i = heapq.heappop(finishing)
+            running[jobs[i][0]] -= 1
+        while arrivals and jobs[arrivals[0]][2] <= now:
+            i = arrivals.pop(0)
+            queued.append(QueuedUpload(i, jobs[i][0], jobs[i][1], epoch + timedelta(seconds=jobs[i][2]), *jobs[i][3:]))
+        while len(finishing) < workers:
+            job = policy.select(queued, +running, epoch + timedelta(seconds=now))
+            if job is None:
+                break
+            queued.remove(job)
+            running[job.artist_id] += 1
+            spans[job.id] = (now, now + job.size_bytes)
+            heapq.heappush(finishing, (now + job.size_bytes, job.id))
+            peak_artist[job.artist_id] = max(peak_artist[job.artist_id], running[job.artist_id])
+            peak_total = max(peak_total, len(finishing))
+        upcoming = [finishing[0][0]] if finishing else []
+        if arrivals:
+            upcoming.append(jobs[arrivals[0]][2])
+        if not upcoming:
+            break  # nothing running and nothing the policy will start
+        now = min(upcoming)
+    return spans, peak_artist, peak_total
+
+
+class UploadSchedulingTests(SimpleTestCase):
+    """Simulated upload queues: fairness, limits and small-file priority."""
+
+    def test_bulk_label_does_not_starve_other_artists(self):
+        # A label queues 200 files, then three artists upload one file each
+        jobs = [(1, 60, 0)] * 200 + [(2, 30, 5), (3, 90, 10), (4, 10, 15)]
+        fair, _, _ = simulate(FairSharePolicy(artist_limit=2, starvation_seconds=3600), jobs, workers=4)
+        # Without a per-artist cap the label's backlog holds every worker
+        fifo, _, _ = simulate(FifoPolicy(artist_limit=4), jobs, workers=4)
+        for i in range(200, 203):
+            self.assertLessEqual(fair[i][0] - jobs[i][2], 60)  # at worst until one running file ends
+            self.assertGreater(fifo[i][0], 200 * 60 / 4 - 60)
+
+    def test_limits_are_never_exceeded(self):
+        jobs = [(artist, 5 + (i * 37) % 50, i * 3) for i, artist in enumerate([1, 1, 2, 3, 1, 2, 4, 1, 5] * 20)]
+        for limit, workers in [(1, 2), (2, 3), (3, 8)]:
+            spans, peak_artist, peak_total = simulate(FairSharePolicy(artist_limit=limit), jobs, workers)
+            self.assertEqual(len(spans), len(jobs))
+            self.assertLessEqual(max(peak_artist.values()), limit)
+            self.assertLessEqual(peak_total, workers)
+
+    def test_small_files_first_within_an_artist(self):
+        jobs = [(1, 50, 0), (1, 5, 0), (1, 20, 0), (1, 5, 1)]
+        spans, _, _ = simulate(FairSharePolicy(artist_limit=1), jobs, workers=1)
+        self.assertEqual(sorted(spans, key=lambda i: spans[i][0]), [1, 3, 2, 0])
+
+    def test_waiting_uploads_age_past_small_ones(self):
+        # A large file competing with a steady stream of small files from many artists
+        jobs = [(0, 500, 0)] + [(artist, 10, t) for t in range(0, 3000, 5) for artist in (1, 2)]
+        fair, _, _ = simulate(FairSharePolicy(artist_limit=1, starvation_seconds=600), jobs, workers=1)
+        self.assertLessEqual(fair[0][0], 610)
+
+    def test_batch_files_run_in_parallel_up_to_the_batch_limit(self):
+        # One artist's 8-file batch next to a single upload from another artist
+        jobs = [(1, 10, 0, 7)] * 8 + [(2, 10, 0)]
+        spans, peak_artist, peak_total = simulate(FairSharePolicy(artist_limit=1, batch_limit=3), jobs, workers=4)
+        self.assertEqual(peak_artist[1], 3)
+        self.assertEqual(peak_total, 4)
+        self.assertEqual(spans[8][0], 0)  # the batch does not hold back other artists
+        self.assertEqual(max(end for _, end in spans.values()), 30)
+        # Stand-alone uploads keep the per-artist limit
+        spans, peak_artist, _ = simulate(FairSharePolicy(artist_limit=1, batch_limit=3), [(1, 10, 0)] * 4, workers=4)
+        self.assertEqual(peak_artist[1], 1)
+
+    @override_settings(ANALYTICS_UPLOAD_WORKERS=2, ANALYTICS_UPLOAD_BATCH_PARALLELISM=4)
+    def test_batch_parallelism_is_capped_at_the_worker_count(self):
+        self.assertEqual(FairSharePolicy(artist_limit=1).batch_limit, 2)
+
+    @override_settings(ANALYTICS_UPLOAD_POLICY='analytics.scheduler.FifoPolicy', ANALYTICS_UPLOAD_ARTIST_LIMIT=3)
+    def test_policy_is_configurable(self):
+        policy = UploadScheduler().policy
+        self.assertIsInstance(policy, FifoPolicy)
+        self.assertEqual(policy.artist_limit, 3)
+
+
+class UploadRecoveryTests(TestCase):
+    def setUp(self):
+        self.artist = get_user_model().objects.create_user(
+            username='artist', email='artist@example.com', password='password'
+        )
+
+    @override_settings(ANALYTICS_UPLOAD_STALE_SECONDS=60)
+    def test_stale_processing_upload_is_failed(self):
+        now = datetime.now(timezone.utc)
+        stale = CsvUpload.objects.create(artist=self.artist, filename='a.csv', status='processing',
+                                         started_at=now - timedelta(minutes=5))
+        running = CsvUpload.objects.create(artist=self.artist, filename='b.csv', status='processing', started_at=now)
+        self.assertTrue(uploads_in_flight(self.artist.id))
+        running.delete()
+        self.assertFalse(uploads_in_flight(self.artist.id))
+
+        backfill = CsvUpload.objects.create(artist=self.artist, filename='c.csv', status='processing',
+                                            stage='backfill', started_at=now - timedelta(minutes=5))
+        self.assertIsNone(UploadScheduler(FifoPolicy()).claim())
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, 'failed')
+        self.assertIsNotNone(stale.finished_at)
+        # backfill_statements resumes its own files
+        backfill.refresh_from_db()
+        self.assertEqual(backfill.status, 'processing')
+
+    @override_settings(ANALYTICS_UPLOAD_STALE_SECONDS=60)
+    def test_slow_upload_with_recent_heartbeat_keeps_running(self):
+        now = datetime.now(timezone.utc)
+        slow = CsvUpload.objects.create(artist=self.artist, filename='a.csv', status='processing',
+                                        started_at=now - timedelta(hours=2), heartbeat_at=now - timedelta(seconds=10))
+        self.assertTrue(uploads_in_flight(self.artist.id))
+        self.assertEqual(fail_stale_uploads(), 0)
+        slow.refresh_from_db()
+        self.assertEqual(slow.status, 'processing')
+
+        CsvUpload.objects.filter(id=slow.id).update(heartbeat_at=now - timedelta(minutes=5))
+        self.assertFalse(uploads_in_flight(self.artist.id))
+        self.assertEqual(fail_stale_uploads(), 1)
+
+
+class ProgressEventTests(SimpleTestCase):
+    def upload(self, **values):
+        started_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        return {'id': 1, 'status': 'processing', 'stage': 'inserting', 'processed_rows': 500, 'total_rows': 2000,
+                'error_count': 0, 'started_at': started_at, **values}
+
+    def test_rate_and_eta_while_inserting(self):
+        now = datetime(2024, 1, 1, 0, 0, 10, tzinfo=timezone.utc)
+        event = progress_event(self.upload(), now)
+        self.assertEqual((event['rows_per_second'], event['eta_seconds']), (50.0, 30.0))
+        event = progress_event(self.upload(stage='resolving'), now)
+        self.assertEqual((event['stage'], event['rows_per_second'], event['eta_seconds']), ('resolving', None, None))
+
+    def test_finished_upload_has_no_eta(self):
+        now = datetime(2024, 1, 1, 0, 0, 20, tzinfo=timezone.utc)
+        event = progress_event(self.upload(status='completed', stage='', processed_rows=2000), now)
+        self.assertEqual((event['stage'], event['rows_per_second'], event['eta_seconds']), ('completed', 100.0, None))
+
+    def test_hub_delivers_events_published_from_other_threads(self):
+        hub = ProgressHub()
+        hub._thread = threading.current_thread()  # no listener: events come from publish() only
+
+        async def receive():
+            loop, events = subscription = hub.subscribe(1)
+            threading.Thread(target=hub.publish, args=({'id': 1, 'status': 'processing'},)).start()
+            hub.publish({'id': 2, 'status': 'processing'})
+            event = await asyncio.wait_for(events.get(), timeout=5)
+            hub.unsubscribe(1, subscription)
+            return event, events.empty()
+
+        self.assertEqual(async_to_sync(receive)(), ({'id': 1, 'status': 'processing'}, True))
+        self.assertEqual(hub._subscribers, {})
+
+
+@override_settings(ANALYTICS_UPLOAD_EVENTS_POLL_SECONDS=0.05, ANALYTICS_UPLOAD_EVENTS_HEARTBEAT=0.1,
+                   ANALYTICS_UPLOAD_EVENTS_TIMEOUT=10)
+class EventStreamTests(TransactionTestCase):
+    """The polling listener on SQLite, LISTEN/NOTIFY on PostgreSQL."""
+
+    def test_stream_follows_the_upload_until_it_finishes(self):
+        artist = get_user_model().objects.create_user(
+            username='artist', email='artist@example.com', password='password'
+        )
+        upload = CsvUpload.objects.create(artist=artist, filename='s.csv', status='processing', total_rows=10,
+                                          started_at=datetime.now(timezone.utc))
+
+        def finish():
+            uploads = CsvUpload.objects.filter(id=upload.id)
+            uploads.update(status='completed', processed_rows=10)
+            if connection.vendor == 'postgresql':
+                # Workers announce changes there; nothing polls
+                with connection.cursor() as cursor:
+                    _notify(progress_event(uploads.values(*EVENT_FIELDS).get()), cursor)
+
+        async def collect():
+            chunks = []
+            async for chunk in event_stream(upload.id):
+                chunks.append(chunk)
+                if len(chunks) == 1:
+                    await sync_to_async(finish)()
+            return chunks
+
+        chunks = async_to_sync(collect)()
+        self.assertTrue(chunks[0].startswith('retry: '))
+        self.assertIn('"status":"processing"', chunks[0])
+        self.assertIn('"status":"completed"', chunks[-1])
+        self.assertTrue(all(chunk == ': keepalive\n\n' for chunk in chunks[1:-1]))
+
+
+class IngestionMetricsTests(TestCase):
+    def test_parse_dates_accepts_both_formats(self):
+        df = pd.DataFrame({'period_end': ['2024-01-31', '29/02/2024', '2024-13-01', None]})
+        self.assertEqual(parse_dates(df), [date(2024, 1, 31), date(2024, 2, 29), None, None])
+        self.assertEqual(parse_dates(pd.DataFrame({'streams': [1]})), [None])
+
+    def test_throughput_buckets_by_finish_day(self):
+        artist = get_user_model().objects.create_user(
+            username='artist', email='artist@example.com', password='password'
+        )
+        day = datetime(2024, 3, 1, 12, tzinfo=timezone.utc)
+        for finished_at, rows, seconds, status in [
+            (day, 1000, 10, 'completed'), (day, 3000, 10, 'failed'), (day + timedelta(days=1), 500, 5, 'completed'),
+        ]:
+            CsvUpload.objects.create(
+                artist=artist, filename='s.csv', status=status, total_rows=rows, finished_at=finished_at,
+                duration_seconds=seconds, stage_timings={'parsing': seconds / 2}, process_rss_peak_bytes=rows,
+            )
+        CsvUpload.objects.create(artist=artist, filename='s.csv', status='processing', total_rows=99)
+
+        first, second = ingestion_throughput('day')
+        self.assertEqual(first, {
+            'bucket': date(2024, 3, 1), 'uploads': 2, 'failed': 1, 'total_rows': 4000, 'rows_per_second': 200.0,
+            'process_rss_peak_bytes': 3000, 'average_stage_seconds': {'parsing': 5.0},
+        })
+        self.assertEqual((second['bucket'], second['rows_per_second']), (date(2024, 3, 2), 100.0))
+        self.assertEqual(len(ingestion_throughput('month', start_date=date(2024, 3, 2))), 1)
+
+    def test_overlapping_uploads_keep_the_shared_tracemalloc_peak(self):
+        if not tracemalloc.is_tracing():
+            self.addCleanup(tracemalloc.stop)
+        first = UploadMetrics(trace_memory=True)
+        block = bytearray(8 * 2 ** 20)
+        del block
+        second = UploadMetrics(trace_memory=True)  # starts while the first is running: no peak reset
+        self.assertGreaterEqual(first.finish(1)['process_tracemalloc_peak_bytes'], 8 * 2 ** 20)
+        second.finish(1)
+        third = UploadMetrics(trace_memory=True)  # alone again: measures from here
+        self.assertLess(third.finish(1)['process_tracemalloc_peak_bytes'], 8 * 2 ** 20)
+
+
+class BackfillCheckpointTests(TransactionTestCase):
+    """backfill_statements records each file as a CsvUpload and skips or resumes by that record."""
+
+    def setUp(self):
+        invalidate_platforms()  # the flush between tests sends no signals
+        self.artist = get_user_model().objects.create_user(
+            username='artist', email='artist@example.com', password='password'
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        for name, track in [('a.csv', 'Intro'), ('b.csv', 'Outro')]:
+            with open(os.path.join(self.directory, name), 'w') as fh:
+                fh.write(f"track_name,platform,streams,revenue,period_end\n{track},Spotify,10,0.5,2024-01-31\n")
+
+    def backfill(self):
+        out = io.StringIO()
+        call_command('backfill_statements', self.directory, artist='artist', workers=1, stdout=out)
+        return out.getvalue()
+
+    def test_rerun_skips_imported_files_and_resumes_unfinished_ones(self):
+        self.assertIn('2 files, 0 already imported, 2 to import.', self.backfill())
+        self.assertEqual(RoyaltyStatement.objects.count(), 2)
+        self.assertFalse(CsvUpload.objects.filter(started_at__isnull=True).exists())
+
+        # A run killed part-way through b.csv leaves its checkpoint processing
+        killed = CsvUpload.objects.get(filename__endswith='b.csv')
+        killed.status, killed.stage = 'processing', 'backfill'
+        killed.save()
+        self.assertIn('2 files, 1 already imported, 1 to import.', self.backfill())
+        killed.refresh_from_db()
+        self.assertEqual((killed.status, killed.stage, killed.success_count), ('completed', '', 0))
+        self.assertEqual(CsvUpload.objects.count(), 2)
+        self.assertEqual(RoyaltyStatement.objects.count(), 2)
+
+        self.assertIn('2 files, 2 already imported, 0 to import.', self.backfill())
+
+    def test_indexes_left_dropped_by_an_interrupted_run_are_rebuilt(self):
+        def drop_indexes():
+            with connection.schema_editor() as editor:
+                for index in RoyaltyStatement._meta.indexes:
+                    editor.remove_index(RoyaltyStatement, index)
+
+        def missing_indexes():
+            with connection.cursor() as cursor:
+                existing = connection.introspection.get_constraints(cursor, RoyaltyStatement._meta.db_table)
+            return [index.name for index in RoyaltyStatement._meta.indexes if index.name not in existing]
+
+        # A --defer-indexes run killed during the load; the next run does not defer
+        drop_indexes()
+        self.assertTrue(missing_indexes())
+        self.assertIn(f'Rebuilding {len(RoyaltyStatement._meta.indexes)} statement indexes', self.backfill())
+        self.assertEqual(missing_indexes(), [])
+
+        drop_indexes()
+        self.assertIn('Nothing to import.', self.backfill())
+        self.assertEqual(missing_indexes(), [])
@@ -0,0 +1,121 @@
+import pandas as pd
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth, TruncQuarter, TruncWeek, TruncYear
+
+from . import columnar
+from .columnar import analytics_engine
+from .money import micros_to_units, sum_micros
+from .rollups import aggregate_source
+
+# granularity -> (SQL truncation, pandas frequency of the truncated buckets)
+GRANULARITIES = {
+    'day': (None, 'D'),
+    'week': (TruncWeek, 'W-MON'),
+    'month': (TruncMonth, 'MS'),
+    'quarter': (TruncQuarter, 'QS'),
+    'year': (TruncYear, 'YS'),
+}
+SPLITS = ['none', 'platform', 'track']
+MODES = ['raw', 'cumulative', 'moving_average']
+
+_SPLIT_FIELDS = {
+    'platform': ('platform_id', 'platform__name'),
+    'track': ('track_id', 'track__name'),
+}
+
+
+def _truncate(value, granularity):
+    """Truncate a date the same way the SQL bucket expression does."""
+    ts = pd.Timestamp(value)
+    if granularity == 'week':
+        return ts - pd.Timedelta(days=ts.weekday())
+    if granularity == 'month':
+        return ts.replace(day=1)
+    if granularity == 'quarter':
+        return ts.replace(month=3 * ((ts.month - 1) // 3) + 1, day=1)
+    if granularity == 'year':
+        return ts.replace(month=1, day=1)
+    return ts
+
+
+def time_series(artist_id, granularity='month', split='none', mode='raw', window=3,
+                start_date=None, end_date=None, engine=None):
+    """Streams and revenue per time bucket, gap-filled with zero rows.
+
+    Sums are computed in one grouped query (from rollups when the granularity
+    and window allow it); gap filling, cumulative sums and moving averages are
+    a vectorized pandas step over the result. Returns (series, source), where
+    series is a list of {'key', 'label', 'points'} dicts.
+    """
+    if analytics_engine(engine) == 'columnar':
+        frame = columnar.bucket_frame(artist_id, granularity, split, start_date, end_date)
+        return fill_series(frame, granularity, split, mode, window, start_date, end_date), 'columnar'
+
+    trunc = GRANULARITIES[granularity][0]
+    queryset, source = aggregate_source(
+        artist_id, start_date, end_date, allow_rollup=granularity not in ('day', 'week')
+    )
+    date_field = 'month' if source == 'rollup' else 'period_end'
+    bucket = trunc(date_field) if trunc else F(date_field)
+
+    group_fields = ['bucket']
+    if split != 'none':
+        key_field, label_field = _SPLIT_FIELDS[split]
+        queryset = queryset.annotate(key=F(key_field), label=F(label_field))
+        group_fields += ['key', 'label']
+    rows = queryset.annotate(bucket=bucket).values(*group_fields).annotate(
+        streams=Sum('streams'), revenue=sum_micros('revenue_micros')
+    ).order_by()
+
+    frame = pd.DataFrame.from_records(list(rows), columns=group_fields + ['streams', 'revenue'])
+    if split == 'none':
+        frame['key'] = 0
+        frame['label'] = 'All'
+    return fill_series(frame, granularity, split, mode, window, start_date, end_date), source
+
+
+def fill_series(frame, granularity, split='none', mode='raw', window=3, start_date=None, end_date=None):
+    """Turn grouped (bucket, key, label, streams, revenue micros) rows into gap-filled series."""
+    freq = GRANULARITIES[granularity][1]
+    frame = frame.copy()
+    frame['bucket'] = pd.to_datetime(frame['bucket'])
+    frame['streams'] = frame['streams'].fillna(0).astype('int64')
+    frame['revenue'] = frame['revenue'].fillna(0).astype('int64')
+
+    first = _truncate(start_date, granularity) if start_date else frame['bucket'].min()
+    last = _truncate(end_date, granularity) if end_date else frame['bucket'].max()
+    if pd.isna(first) or pd.isna(last):
+        return []
+    buckets = pd.date_range(first, last, freq=freq)
+    keys = [0] if split == 'none' else frame['key'].unique().tolist()
+    labels = dict(zip(frame['key'], frame['label']))
+
+    def pivot(values):
+        return frame.pivot_table(index='bucket', columns='key', values=values, aggfunc='sum').reindex(
+            index=buckets, columns=keys, fill_value=0
+        ).fillna(0)
+
+    streams = pivot('streams')
+    revenue = pivot('revenue')
+    if mode == 'cumulative':
+        streams = streams.cumsum()
+        revenue = revenue.cumsum()
+    elif mode == 'moving_average':
+        streams = streams.rolling(window, min_periods=1).mean().round(2)
+        revenue = revenue.rolling(window, min_periods=1).mean()
+    if mode != 'moving_average':
+        streams = streams.astype('int64')
+    revenue = micros_to_units(revenue).round(4)
+
+    dates = [ts.date().isoformat() for ts in buckets]
+    series = []
+    for key in keys:
+        series.append({
+            'key': None if split == 'none' else key,
+            'label': labels.get(key, 'All'),
+            'points': [
+                {'date': date, 'streams': s, 'revenue': r}
+                for date, s, r in zip(dates, streams[key].tolist(), revenue[key].tolist())
+            ],
+        })
+    return series
@@ -0,0 +1,103 @@
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .columnar import column_cache
+from .ingestion import ingest_dataframe, read_statements
+from .instrumentation import UploadMetrics
+from .models import CsvUpload
+from .progress import ProgressReporter
+from .rollups import mark_artist_data_changed, rebuild_artist_rollups
+from .tasks import run_in_background
+
+
+def process_upload(upload_id):
+    """Import a claimed upload's stored file and record the outcome on the CsvUpload.
+
+    Called by the upload scheduler once the upload is 'processing'; failures
+    are recorded on the upload rather than raised.
+    """
+    upload = CsvUpload.objects.get(id=upload_id)
+    progress = ProgressReporter(upload)
+    metrics = UploadMetrics()
+
+    def report(stage, processed_rows=None, error_count=None):
+        metrics.stage(stage)
+        progress.update(stage, processed_rows, error_count)
+
+    try:
+        report('reading')
+        with upload.file.open('rb') as fh:
+            df = read_statements(fh)
+        upload.total_rows = len(df)
+        upload.save(update_fields=['total_rows'])
+
+        # Tracks resolve by normalized name, so platform variants land on one track
+        success_count, error_messages = ingest_dataframe(upload, df, progress=report)
+        error_count = len(error_messages)
+
+        upload.success_count = success_count
+        upload.error_count = error_count
+        # Every row was handled: imported, rejected or skipped as already imported
+        upload.processed_rows = upload.total_rows
+        if error_messages:
+            upload.error_log = "\n".join(error_messages[:10])
+        upload.status = 'completed' if error_count == 0 else 'completed_with_errors'
+    except Exception as e:
+        upload.status = 'failed'
+        upload.error_log = str(e)
+        success_count = 0
+    for name, value in metrics.finish(upload.total_rows).items():
+        setattr(upload, name, value)
+    upload.stage = ''
+    upload.finished_at = timezone.now()
+    upload.save()
+    progress.finish()
+
+    mark_artist_data_changed(upload.artist_id, statements_changed=bool(success_count))
+    if success_count:
+        column_cache.discard(upload.artist_id)
+        run_in_background(rebuild_artist_rollups, upload.artist_id)
+
+
+BATCH_COUNT_FIELDS = ['total_rows', 'processed_rows', 'success_count', 'error_count']
+UPLOAD_STATUSES = ['pending', 'processing', 'completed', 'completed_with_errors', 'failed']
+
+
+def batch_summaries(batches):
+    """Aggregate status and row counts for UploadBatch records, keyed by batch id.
+
+    A batch is 'pending' until a file starts, 'processing' while any file is
+    pending or processing, and once all are done 'completed', 'failed' (every
+    file failed) or 'completed_with_errors'. duplicate_rows counts rows
+    skipped as already imported, including rows repeated across the batch's
+    own files.
+    """
+    ids = [batch.id for batch in batches]
+    counts = CsvUpload.objects.filter(batch_id__in=ids).values('batch_id').annotate(
+        files=Count('id'),
+        **{status: Count('id', filter=Q(status=status)) for status in UPLOAD_STATUSES},
+        **{name: Sum(name) for name in BATCH_COUNT_FIELDS},
+    ).order_by()
+    counts = {row.pop('batch_id'): row for row in counts}
+    summaries = {}
+    for batch in batches:
+        row = counts.get(batch.id, {})
+        files = row.get('files', 0)
+        if files and row['pending'] == files:
+            status = 'pending'
+        elif row.get('pending') or row.get('processing'):
+            status = 'processing'
+        elif files and row['failed'] == files:
+            status = 'failed'
+        elif row.get('failed') or row.get('completed_with_errors'):
+            status = 'completed_with_errors'
+        else:
+            status = 'completed'
+        totals = {name: row.get(name) or 0 for name in BATCH_COUNT_FIELDS}
+        summaries[batch.id] = {
+            'status': status,
+            'files': {name: row.get(name, 0) for name in UPLOAD_STATUSES},
+            **totals,
+            'duplicate_rows': max(totals['processed_rows'] - totals['success_count'] - totals['error_count'], 0),
+        }
+    return summaries
@@ -4,12 +4,17 @@ from . import views
 urlpatterns = [
     # Dashboard
     path('artist/dashboard-summary', views.DashboardSummaryView.as_view(), name='dashboard-summary'),
+    path('artist/dashboard-bundle', views.DashboardBundleView.as_view(), name='dashboard-bundle'),
 
     # Stream endpoints
     path('streams/total', views.TotalStreamsView.as_view(), name='total-streams'),
     path('streams/by-platform', views.StreamsByPlatformView.as_view(), name='streams-by-platform'),
+    path('streams/by-territory', views.StreamsByTerritoryView.as_view(), name='streams-by-territory'),
     path('streams/over-time', views.StreamsOverTimeView.as_view(), name='streams-over-time'),
+    path('streams/time-series', views.TimeSeriesView.as_view(), name='streams-time-series'),
     path('streams/top-tracks', views.TopTracksView.as_view(), name='top-tracks'),
+    path('streams/top-tracks/by-platform', views.TopTracksByPlatformView.as_view(), name='top-tracks-by-platform'),
+    path('streams/compare', views.PeriodComparisonView.as_view(), name='streams-compare'),
 
     # Revenue endpoints
     path('revenue/total', views.TotalRevenueView.as_view(), name='total-revenue'),
@@ -21,15 +26,28 @@ urlpatterns = [
     # Content endpoints
     path('albums', views.AlbumListView.as_view(), name='album-list'),
     path('tracks', views.TrackListView.as_view(), name='track-list'),
+    path('catalog/tracks', views.TrackCatalogView.as_view(), name='track-catalog'),
+    path('catalog/albums', views.AlbumCatalogView.as_view(), name='album-catalog'),
+    path('search', views.SearchView.as_view(), name='catalog-search'),
 
     # Royalty Statements
     path('royalty-statements', views.RoyaltyStatementListView.as_view(), name='royalty-statement-list'),
+    path('royalty-statements/export', views.RoyaltyStatementExportView.as_view(), name='royalty-statement-export'),
     path('royalty-statements/<int:pk>', views.RoyaltyStatementDetailView.as_view(), name='royalty-statement-detail'),
 
+    # Exports
+    path('exports/<int:pk>', views.DataExportDetailView.as_view(), name='data-export-detail'),
+    path('exports/<int:pk>/download', views.DataExportDownloadView.as_view(), name='data-export-download'),
+
     # CSV Uploads
     path('csv-uploads', views.CsvUploadListView.as_view(), name='csv-upload-list'),
     path('csv-uploads/<int:pk>', views.CsvUploadDetailView.as_view(), name='csv-upload-detail'),
+    path('csv-uploads/<int:pk>/events', views.CsvUploadEventsView.as_view(), name='csv-upload-events'),
+    path('csv-uploads/throughput', views.IngestionThroughputView.as_view(), name='csv-upload-throughput'),
     path('csv-uploads/upload', views.CsvUploadCreateView.as_view(), name='csv-upload-create'),
+    path('csv-uploads/batch', views.UploadBatchCreateView.as_view(), name='upload-batch-create'),
+    path('csv-uploads/batches', views.UploadBatchListView.as_view(), name='upload-batch-list'),
+    path('csv-uploads/batches/<int:pk>', views.UploadBatchDetailView.as_view(), name='upload-batch-detail'),
 ]
 
 # from django.urls import path
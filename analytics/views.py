@@ -1,194 +1,442 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.parsers import MultiPartParser, JSONParser
-from django.db.models import Sum
-from django.db.models.functions import TruncMonth, TruncWeek
-import pandas as pd
-import hashlib
-from datetime import datetime
-from .models import RoyaltyStatement, Platform, Track, Album, CsvUpload
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from .models import RoyaltyStatement, Track, Album, CsvUpload, UploadBatch, DataExport
 from .serializers import (
-    DashboardSummarySerializer, StreamsOverTimeSerializer,
-    TopTracksSerializer, PlatformSerializer, AlbumSerializer,
-    TrackSerializer, RoyaltyStatementSerializer, CsvUploadSerializer
+    StreamsOverTimeSerializer, TopTracksSerializer, PlatformSerializer, AlbumSerializer,
+    TrackSerializer, RoyaltyStatementSerializer, CsvUploadSerializer,
+    DataExportSerializer, PlatformTopTracksSerializer, TrackCatalogSerializer, AlbumCatalogSerializer,
+    TerritoryBreakdownSerializer, UploadBatchSerializer
 )
+from .filters import (
+    filter_statements, parse_window, parse_choice_param, parse_limit_param, parse_fields_param,
+    parse_ordering_params, STATEMENT_FILTER_PARAMS
+)
+from .queries import (
+    totals, platform_totals, territory_totals, top_tracks, top_tracks_per_platform, TOP_TRACKS_SORT_FIELDS
+)
+from .timeseries import time_series, GRANULARITIES, SPLITS, MODES
+from .dashboard import dashboard_bundle, territory_rows, BUNDLE_WIDGETS
+from .search import search_catalog, SEARCH_TYPES
+from .catalog import track_catalog, album_catalog, CatalogPagination, TRACK_SORT_FIELDS, ALBUM_SORT_FIELDS
+from .comparison import compare_periods, default_window, COMPARE_TO, MOVER_SORT_FIELDS
+from .exports import (
+    STREAMING_FORMATS, async_file_chunks, async_stream, export_queryset, parquet_available, run_parquet_export
+)
+from .tasks import run_in_background
+from .caching import conditional_on_artist_data
+from .fastpath import output_fields, serialize_values
+from .scheduler import QUEUE_FIELDS, enqueue_upload, enqueue_uploads, queue_status, uploads_in_flight
+from .uploads import batch_summaries
+from .progress import event_stream
+from .instrumentation import THROUGHPUT_GRANULARITIES, ingestion_throughput
+from .renderers import EventStreamRenderer, FastJSONRenderer
+from .reference import platform_catalog, PLATFORM_LIST_MAX_AGE
+from .money import from_micros, micros_to_float, sum_micros
 class DashboardSummaryView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional_on_artist_data
     def get(self, request):
-        user = request.user
-        totals = RoyaltyStatement.objects.filter(artist=user).aggregate(
-            total_streams=Sum('streams'), total_revenue=Sum('revenue')
-        )
-        platform_data = []
-        platforms = Platform.objects.all()
-        for platform in platforms:
-            platform_stats = RoyaltyStatement.objects.filter(
-                artist=user, platform=platform
-            ).aggregate(streams=Sum('streams'), revenue=Sum('revenue'))
-            if platform_stats['streams']:
-                platform_data.append({
-                    'platform_name': platform.name,
-                    'platform_icon': platform.api_name,
-                    'streams': platform_stats['streams'],
-                    'revenue': platform_stats['revenue'] or 0,
-                    'percentage': 0
-                })
-        total_streams_val = totals['total_streams'] or 1
-        for platform in platform_data:
-            platform['percentage'] = round((platform['streams'] / total_streams_val) * 100)
-        data = {
-            "total_streams": totals['total_streams'] or 0,
-            "total_revenue": totals['total_revenue'] or 0,
-            "currency": "USD", "platform_breakdown": platform_data,
-            "total_albums": Album.objects.filter(artist=user).count(),
-            "total_tracks": Track.objects.filter(artist=user).count()
-        }
-        serializer = DashboardSummarySerializer(data=data)
-        serializer.is_valid(raise_exception=True)
-        return Response(serializer.data)
+        # Same computation as the bundle's summary widget; output is serialized, not re-validated
+        data, source = dashboard_bundle(request.user.id, ['summary'])
+        return Response(data['summary'], headers={'X-Analytics-Source': source})
+
+
+class DashboardBundleView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @conditional_on_artist_data
+    def get(self, request):
+        """GET /api/artist/dashboard-bundle?widgets=summary,top_tracks,...&period= - Several widgets in one call"""
+        requested = request.query_params.get('widgets')
+        widgets = [w.strip() for w in (requested or '').split(',') if w.strip()] or BUNDLE_WIDGETS
+        unknown = [w for w in widgets if w not in BUNDLE_WIDGETS]
+        if unknown:
+            return Response({
+                'error': f"Unknown widgets: {', '.join(unknown)}",
+                'details': f"Available widgets: {', '.join(BUNDLE_WIDGETS)}"
+            }, status=400)
+        data, source = dashboard_bundle(request.user.id, widgets, period=request.GET.get('period', '6months'))
+        return Response(data, headers={'X-Analytics-Source': source})
 
 
 class TotalStreamsView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional_on_artist_data
     def get(self, request):
-        user = request.user
-        total = RoyaltyStatement.objects.filter(artist=user).aggregate(
-            total_streams=Sum('streams'))['total_streams'] or 0
-        return Response({'total_streams': total})
+        sums, source = totals(request.user.id)
+        return Response({'total_streams': sums['streams']}, headers={'X-Analytics-Source': source})
 
 
 class TotalRevenueView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional_on_artist_data
     def get(self, request):
-        user = request.user
-        total = RoyaltyStatement.objects.filter(artist=user).aggregate(
-            total_revenue=Sum('revenue'))['total_revenue'] or 0
-        return Response({'total_revenue': float(total), 'currency': 'USD'})
+        sums, source = totals(request.user.id)
+        return Response({'total_revenue': micros_to_float(sums['revenue'], places=None), 'currency': 'USD'},
+                        headers={'X-Analytics-Source': source})
 
 
 class StreamsByPlatformView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional_on_artist_data
     def get(self, request):
-        user = request.user
-        platform_stats = RoyaltyStatement.objects.filter(artist=user).values(
-            'platform__name', 'platform__api_name'
-        ).annotate(total_streams=Sum('streams'), total_revenue=Sum('revenue')
-                   ).order_by('-total_streams')
+        rows, source = platform_totals(request.user.id)
         data = []
-        for stat in platform_stats:
+        for row in rows:
             data.append({
-                'platform_name': stat['platform__name'],
-                'platform_icon': stat['platform__api_name'],
-                'streams': stat['total_streams'] or 0,
-                'revenue': float(stat['total_revenue'] or 0)
+                'platform_name': row['platform_name'],
+                'platform_icon': row['platform_icon'],
+                'streams': row['streams'] or 0,
+                'revenue': micros_to_float(row['revenue'], places=None)
             })
-        return Response({'platforms': data})
+        return Response({'platforms': data}, headers={'X-Analytics-Source': source})
+
+
+class StreamsByTerritoryView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @conditional_on_artist_data
+    def get(self, request):
+        """GET /api/streams/by-territory?start_date=&end_date=&limit= - Streams and revenue per country"""
+        start_date, end_date = parse_window(request.query_params)
+        limit = parse_limit_param(request.query_params, default=50, maximum=250)
+        rows, source = territory_totals(request.user.id, start_date, end_date)
+        serializer = TerritoryBreakdownSerializer(territory_rows(rows, limit), many=True)
+        return Response({'territories': serializer.data}, headers={'X-Analytics-Source': source})
 
 
 class StreamsOverTimeView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional_on_artist_data
     def get(self, request):
         user = request.user
         period = request.GET.get('period', '6months')
-        queryset = RoyaltyStatement.objects.filter(artist=user)
-        trunc_func = TruncWeek('period_end') if period != '1year' else TruncMonth('period_end')
-        time_series_data = queryset.annotate(period_date=trunc_func).values(
-            'period_date').annotate(total_streams=Sum('streams'), total_revenue=Sum('revenue')
-                                    ).order_by('period_date')
-        formatted_data = []
-        for item in time_series_data:
-            if item['period_date']:
-                formatted_data.append({
-                    'date': item['period_date'].isoformat(),
-                    'streams': item['total_streams'] or 0,
-                    'revenue': float(item['total_revenue'] or 0)
-                })
+        granularity = 'week' if period != '1year' else 'month'
+        series, source = time_series(user.id, granularity=granularity)
+        formatted_data = series[0]['points'] if series else []
         serializer = StreamsOverTimeSerializer(formatted_data, many=True)
-        return Response(serializer.data)
+        return Response(serializer.data, headers={'X-Analytics-Source': source})
+
+
+class TimeSeriesView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @conditional_on_artist_data
+    def get(self, request):
+        """GET /api/streams/time-series?granularity=&split=&mode=&window=&start_date=&end_date="""
+        user = request.user
+        params = request.query_params
+        start_date, end_date = parse_window(params)
+        granularity = parse_choice_param(params, 'granularity', list(GRANULARITIES), 'month')
+        split = parse_choice_param(params, 'split', SPLITS, 'none')
+        mode = parse_choice_param(params, 'mode', MODES, 'raw')
+        window = parse_limit_param(params, 'window', default=3, maximum=52)
+        series, source = time_series(
+            user.id, granularity=granularity, split=split, mode=mode, window=window,
+            start_date=start_date, end_date=end_date,
+        )
+        return Response({
+            'granularity': granularity,
+            'split': split,
+            'mode': mode,
+            'window': window if mode == 'moving_average' else None,
+            'series': series
+        }, headers={'X-Analytics-Source': source})
 
 
 class TopTracksView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional_on_artist_data
     def get(self, request):
+        """GET /api/streams/top-tracks?limit=&sort_by=streams|revenue&start_date=&end_date="""
         user = request.user
-        top_tracks = RoyaltyStatement.objects.filter(artist=user).values(
-            'track__name', 'track__id', 'platform__name'
-        ).annotate(total_streams=Sum('streams'), total_revenue=Sum('revenue')
-                   ).order_by('-total_streams')[:10]
-        data = []
-        for track in top_tracks:
-            data.append({
-                'track_name': track['track__name'],
-                'track_id': track['track__id'],
-                'streams': track['total_streams'] or 0,
-                'revenue': float(track['total_revenue'] or 0),
-                'platform': track['platform__name']
-            })
-        serializer = TopTracksSerializer(data, many=True)
-        return Response(serializer.data)
+        start_date, end_date = parse_window(request.query_params)
+        rows, source = top_tracks(
+            user.id,
+            limit=parse_limit_param(request.query_params),
+            start_date=start_date,
+            end_date=end_date,
+            sort_by=parse_choice_param(request.query_params, 'sort_by', TOP_TRACKS_SORT_FIELDS, 'streams'),
+        )
+        serializer = TopTracksSerializer(rows, many=True)
+        return Response(serializer.data, headers={'X-Analytics-Source': source})
+
+
+class TopTracksByPlatformView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @conditional_on_artist_data
+    def get(self, request):
+        """GET /api/streams/top-tracks/by-platform - Top tracks within each platform"""
+        user = request.user
+        start_date, end_date = parse_window(request.query_params)
+        rows, source = top_tracks_per_platform(
+            user.id,
+            limit=parse_limit_param(request.query_params, default=5, maximum=50),
+            start_date=start_date,
+            end_date=end_date,
+            sort_by=parse_choice_param(request.query_params, 'sort_by', TOP_TRACKS_SORT_FIELDS, 'streams'),
+        )
+        platforms = []
+        for row in rows:
+            if not platforms or platforms[-1]['platform_id'] != row['platform_id']:
+                platforms.append({
+                    'platform_id': row['platform_id'],
+                    'platform_name': row['platform_name'],
+                    'tracks': []
+                })
+            platforms[-1]['tracks'].append(row)
+        serializer = PlatformTopTracksSerializer(platforms, many=True)
+        return Response({'platforms': serializer.data}, headers={'X-Analytics-Source': source})
+
+
+class PeriodComparisonView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @conditional_on_artist_data
+    def get(self, request):
+        """GET /api/streams/compare?start_date=&end_date=&compare_to=previous|year&sort_by=&limit= - Period-over-period changes"""
+        user = request.user
+        params = request.query_params
+        start_date, end_date = parse_window(params)
+        if bool(start_date) != bool(end_date):
+            return Response({
+                'error': 'Both start_date and end_date are required',
+                'details': 'Omit both to compare the latest month with the one before it'
+            }, status=400)
+        if not start_date:
+            start_date, end_date = default_window(user.id)
+        data, source = compare_periods(
+            user.id, start_date, end_date,
+            compare_to=parse_choice_param(params, 'compare_to', COMPARE_TO, 'previous'),
+            sort_by=parse_choice_param(params, 'sort_by', MOVER_SORT_FIELDS, 'streams'),
+            limit=parse_limit_param(params, default=5, maximum=50),
+        )
+        return Response(data, headers={'X-Analytics-Source': source})
 
 
 class RevenueByPlatformView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional_on_artist_data
     def get(self, request):
         user = request.user
         revenue_stats = RoyaltyStatement.objects.filter(artist=user).values(
-            'platform__name').annotate(total_revenue=Sum('revenue')
+            'platform__name').annotate(total_revenue=sum_micros('revenue_micros')
                                        ).order_by('-total_revenue')
-        return Response({'revenue_by_platform': list(revenue_stats)})
+        return Response({'revenue_by_platform': [
+            dict(row, total_revenue=from_micros(row['total_revenue'], places=4)) for row in revenue_stats
+        ]})
 
 
 class PlatformListView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        platforms = Platform.objects.all()
-        serializer = PlatformSerializer(platforms, many=True)
-        return Response(serializer.data)
+        """GET /api/platforms - List platforms from the process-level platform cache"""
+        catalog = platform_catalog()
+        etag = quote_etag(f"platforms-{catalog.digest}")
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response(PlatformSerializer(catalog.platforms, many=True).data)
+        response['ETag'] = etag
+        # The same list for every user and it rarely changes
+        patch_cache_control(response, private=True, max_age=PLATFORM_LIST_MAX_AGE)
+        return response
 
 
 class AlbumListView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional_on_artist_data
     def get(self, request):
+        """GET /api/albums?fields=id,title,... - List the artist's albums"""
         user = request.user
         albums = Album.objects.filter(artist=user)
-        serializer = AlbumSerializer(albums, many=True)
-        return Response(serializer.data)
+        fields = parse_fields_param(request.query_params, output_fields(AlbumSerializer))
+        return Response(serialize_values(albums, AlbumSerializer, fields, {'artist_name': user.username}))
 
 
 class TrackListView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional_on_artist_data
     def get(self, request):
+        """GET /api/tracks?fields=id,name,... - List the artist's tracks"""
         user = request.user
         tracks = Track.objects.filter(artist=user)
-        serializer = TrackSerializer(tracks, many=True)
-        return Response(serializer.data)
+        fields = parse_fields_param(request.query_params, output_fields(TrackSerializer))
+        return Response(serialize_values(tracks, TrackSerializer, fields, {'artist_name': user.username}))
+
+
+class TrackCatalogView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @conditional_on_artist_data
+    def get(self, request):
+        """GET /api/catalog/tracks?sort_by=streams&order=desc&page=&page_size= - Tracks with performance totals"""
+        sort_by, descending = parse_ordering_params(request.query_params, TRACK_SORT_FIELDS, 'streams')
+        queryset, source = track_catalog(request.user.id, sort_by, descending)
+        paginator = CatalogPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        response = paginator.get_paginated_response(TrackCatalogSerializer(page, many=True).data)
+        response['X-Analytics-Source'] = source
+        return response
+
+
+class AlbumCatalogView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @conditional_on_artist_data
+    def get(self, request):
+        """GET /api/catalog/albums?sort_by=streams&order=desc&page=&page_size= - Albums with performance totals"""
+        sort_by, descending = parse_ordering_params(request.query_params, ALBUM_SORT_FIELDS, 'streams')
+        queryset, source = album_catalog(request.user.id, sort_by, descending)
+        paginator = CatalogPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        response = paginator.get_paginated_response(AlbumCatalogSerializer(page, many=True).data)
+        response['X-Analytics-Source'] = source
+        return response
+
+
+class SearchView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @conditional_on_artist_data
+    def get(self, request):
+        """GET /api/search?q=&types=track,album,platform&limit= - Ranked prefix/fuzzy catalog search"""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({
+                'error': 'Missing search query',
+                'details': 'Pass the text to search for as ?q='
+            }, status=400)
+        requested = request.query_params.get('types')
+        types = [t.strip() for t in requested.split(',') if t.strip()] if requested else SEARCH_TYPES
+        unknown = [t for t in types if t not in SEARCH_TYPES]
+        if unknown:
+            return Response({
+                'error': f"Unknown types: {', '.join(unknown)}",
+                'details': f"Available types: {', '.join(SEARCH_TYPES)}"
+            }, status=400)
+        rows, backend = search_catalog(
+            request.user.id, query, types, limit=parse_limit_param(request.query_params, default=20, maximum=100)
+        )
+        return Response({'query': query, 'results': rows}, headers={'X-Search-Backend': backend})
 
 
 class RoyaltyStatementListView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional_on_artist_data
     def get(self, request):
-        """GET /api/royalty-statements - List all royalty statements"""
+        """GET /api/royalty-statements?fields=id,period_end,... - List all royalty statements"""
         user = request.user
-        statements = RoyaltyStatement.objects.filter(artist=user).select_related('track', 'platform')
-        serializer = RoyaltyStatementSerializer(statements, many=True)
+        statements = filter_statements(RoyaltyStatement.objects.filter(artist=user), request.query_params)
+        fields = parse_fields_param(request.query_params, output_fields(RoyaltyStatementSerializer))
+        return Response(serialize_values(
+            statements, RoyaltyStatementSerializer, fields, {'artist_name': user.username}
+        ))
+
+
+class RoyaltyStatementExportView(APIView):
+    permission_classes = [IsAuthenticated]
+    parser_classes = [JSONParser]
+
+    @conditional_on_artist_data
+    def get(self, request):
+        """GET /api/royalty-statements/export?file_format=csv|ndjson - Stream all matching statements"""
+        file_format = request.query_params.get('file_format', 'csv').lower()
+        if file_format not in STREAMING_FORMATS:
+            return Response({
+                'error': f'Unsupported file_format: {file_format}',
+                'details': 'Use csv or ndjson, or POST with file_format=parquet for an asynchronous export'
+            }, status=400)
+
+        stream, content_type, extension = STREAMING_FORMATS[file_format]
+        queryset = export_queryset(request.user, request.query_params)
+        content = stream(queryset)
+        if isinstance(request._request, ASGIRequest):
+            content = async_stream(content)
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="royalty-statements.{extension}"'
+        return response
+
+    def post(self, request):
+        """POST /api/royalty-statements/export - Start an asynchronous Parquet export"""
+        file_format = str(request.data.get('file_format', 'parquet')).lower()
+        if file_format != 'parquet':
+            return Response({'error': 'Only parquet exports are asynchronous; use GET for csv or ndjson'},
+                            status=400)
+        if not parquet_available():
+            return Response({'error': 'Parquet export is not available on this server (pyarrow missing)'},
+                            status=400)
+
+        filters = {}
+        for name in STATEMENT_FILTER_PARAMS:
+            value = request.data.get(name, request.query_params.get(name))
+            if value not in (None, ''):
+                filters[name] = str(value)
+        # Validate up front so bad filters fail the request, not the job
+        filter_statements(RoyaltyStatement.objects.none(), filters)
+
+        export = DataExport.objects.create(artist=request.user, file_format=file_format, filters=filters)
+        run_in_background(run_parquet_export, export.id)
+        export.refresh_from_db()
+        serializer = DataExportSerializer(export, context={'request': request})
+        return Response(serializer.data, status=202)
+
+
+class DataExportDetailView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        """GET /api/exports/{id} - Poll an asynchronous export"""
+        try:
+            export = DataExport.objects.get(id=pk, artist=request.user)
+        except DataExport.DoesNotExist:
+            return Response({'error': 'Not found'}, status=404)
+        serializer = DataExportSerializer(export, context={'request': request})
         return Response(serializer.data)
 
 
+class DataExportDownloadView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        """GET /api/exports/{id}/download - Download a completed export"""
+        try:
+            export = DataExport.objects.get(id=pk, artist=request.user, status='completed')
+        except DataExport.DoesNotExist:
+            return Response({'error': 'Not found'}, status=404)
+        if not export.file:
+            return Response({'error': 'Not found'}, status=404)
+        fh = export.file.open('rb')
+        response = FileResponse(fh, as_attachment=True, filename=f"royalty-statements.{export.file_format}")
+        if isinstance(request._request, ASGIRequest):
+            # Headers come from the file above; the body is read asynchronously
+            response.streaming_content = async_file_chunks(fh)
+        return response
+
+
 class RoyaltyStatementDetailView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional_on_artist_data
     def get(self, request, pk):
         """GET /api/royalty-statements/{id} - Get specific royalty statement"""
         user = request.user
@@ -203,26 +451,71 @@ class RoyaltyStatementDetailView(APIView):
 class CsvUploadListView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional_on_artist_data(volatile=lambda request: uploads_in_flight(request.user.id))
     def get(self, request):
-        """GET /api/csv-uploads - List all CSV uploads for the user"""
+        """GET /api/csv-uploads?fields=id,status,... - List all CSV uploads for the user"""
         user = request.user
-        uploads = CsvUpload.objects.filter(artist=user).order_by('-uploaded_at')
-        serializer = CsvUploadSerializer(uploads, many=True)
-        return Response(serializer.data)
+        uploads = CsvUpload.objects.filter(artist=user).order_by('-uploaded_at', '-id')
+        fields = parse_fields_param(request.query_params, list(output_fields(CsvUploadSerializer)) + QUEUE_FIELDS)
+        rows = serialize_values(uploads, CsvUploadSerializer, fields, {'artist_name': user.username})
+        queue_fields = [name for name in QUEUE_FIELDS if fields is None or name in fields]
+        if queue_fields:
+            # Same ordering as `rows`
+            queued = list(uploads.values('id', 'status', 'queued_at', 'started_at'))
+            status = queue_status(queued)
+            for row, upload in zip(rows, queued):
+                row.update({name: status[upload['id']][name] for name in queue_fields})
+        return Response(rows)
 
 
 class CsvUploadDetailView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional_on_artist_data(volatile=lambda request: uploads_in_flight(request.user.id))
     def get(self, request, pk):
-        """GET /api/csv-uploads/{id} - Get specific CSV upload details"""
+        """GET /api/csv-uploads/{id} - Get specific CSV upload details, with its queue position while queued"""
         user = request.user
         try:
             upload = CsvUpload.objects.get(id=pk, artist=user)
-            serializer = CsvUploadSerializer(upload)
-            return Response(serializer.data)
         except CsvUpload.DoesNotExist:
             return Response({'error': 'Not found'}, status=404)
+        return Response(upload_data(upload))
+
+
+class CsvUploadEventsView(APIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, EventStreamRenderer]
+
+    def get(self, request, pk):
+        """GET /api/csv-uploads/{id}/events - Server-Sent Events stream of upload progress until it finishes"""
+        if not CsvUpload.objects.filter(id=pk, artist=request.user).exists():
+            return Response({'error': 'Not found'}, status=404)
+        response = StreamingHttpResponse(event_stream(pk), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # nginx: pass events through as they are written
+        return response
+
+
+class IngestionThroughputView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        """GET /api/csv-uploads/throughput?granularity=day|week|month&start_date=&end_date= - Import throughput, all uploads"""
+        params = request.query_params
+        start_date, end_date = parse_window(params)
+        granularity = parse_choice_param(params, 'granularity', list(THROUGHPUT_GRANULARITIES), 'day')
+        return Response({
+            'granularity': granularity,
+            'buckets': ingestion_throughput(granularity, start_date, end_date),
+        })
+
+
+def upload_data(upload):
+    data = CsvUploadSerializer(upload).data
+    data.update(queue_status([{
+        'id': upload.id, 'status': upload.status, 'queued_at': upload.queued_at, 'started_at': upload.started_at,
+    }])[upload.id])
+    return data
 
 
 class CsvUploadCreateView(APIView):
@@ -230,128 +523,96 @@ class CsvUploadCreateView(APIView):
     parser_classes = [MultiPartParser, JSONParser]
 
     def post(self, request):
-        """POST /api/csv-uploads - Upload and process a CSV file"""
+        """POST /api/csv-uploads - Queue a CSV file for processing; poll the returned upload for its status"""
         user = request.user
         csv_file = request.FILES.get('file')
 
         if not csv_file:
             return Response({'error': 'No file provided'}, status=400)
 
-        # Create upload record
+        # The file is stored with the record; analytics.scheduler imports it off-request
         upload = CsvUpload.objects.create(
             artist=user,
             filename=csv_file.name,
-            status='processing',
+            file=csv_file,
+            size_bytes=csv_file.size,
             total_rows=0
         )
+        enqueue_upload(upload)
+        upload.refresh_from_db()
+        return Response(upload_data(upload), status=202)
+
+
+def batch_data(batches, user):
+    """UploadBatch API output for `user`'s batches: aggregate status and counts, and each file."""
+    summaries = batch_summaries(batches)
+    uploads = CsvUpload.objects.filter(batch__in=batches).order_by('id')
+    rows = serialize_values(uploads, CsvUploadSerializer, None, {'artist_name': user.username})
+    files = {}
+    for row in rows:
+        files.setdefault(row['batch'], []).append(row)
+    return [
+        {**UploadBatchSerializer(batch).data, **summaries[batch.id], 'uploads': files.get(batch.id, [])}
+        for batch in batches
+    ]
+
+
+class UploadBatchCreateView(APIView):
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
 
-        try:
-            # Process the CSV file
-            df = pd.read_csv(csv_file)
-            upload.total_rows = len(df)
-            upload.save()
-
-            success_count = 0
-            error_count = 0
-            error_messages = []
-
-            for index, row in df.iterrows():
-                try:
-                    # Extract data from CSV row (adjust column names as needed)
-                    track_name = row.get('track_name', '')
-                    platform_name = row.get('platform', '')
-                    streams = int(row.get('streams', 0))
-                    revenue = float(row.get('revenue', 0.0))
-                    currency = row.get('currency', 'USD')
-                    period_end_str = row.get('period_end', '')
-
-                    # Parse date (handle different formats)
-                    try:
-                        period_end = datetime.strptime(period_end_str, '%Y-%m-%d').date()
-                    except:
-                        period_end = datetime.strptime(period_end_str, '%d/%m/%Y').date()
-
-                    period_start = period_end.replace(day=1)  # Assuming monthly reports
-
-                    # Get or create track
-                    track, created = Track.objects.get_or_create(
-                        artist=user,
-                        name=track_name,
-                        defaults={'name': track_name}
-                    )
-
-                    # Get platform
-                    try:
-                        platform = Platform.objects.get(name__iexact=platform_name)
-                    except Platform.DoesNotExist:
-                        platform = Platform.objects.create(
-                            name=platform_name,
-                            api_name=platform_name.lower().replace(' ', '_')
-                        )
-
-                    # Generate unique hash for this data row to prevent duplicates
-                    source_string = f"{user.id}-{track.id}-{platform.id}-{period_end}-{streams}-{revenue}-{currency}"
-                    source_row_hash = hashlib.sha256(source_string.encode()).hexdigest()
-
-                    # Check for duplicate before creating
-                    if not RoyaltyStatement.objects.filter(source_row_hash=source_row_hash).exists():
-
-                        RoyaltyStatement.objects.create(
-                            artist=user,
-                            track=track,
-                            platform=platform,
-                            upload=upload,
-                            period_start=period_start,
-                            period_end=period_end,
-                            streams=streams,
-                            revenue=revenue,
-                            currency=currency,
-                            source_row_hash=source_row_hash
-                        )
-                        success_count += 1
-                    else:
-                        pass
-
-                except Exception as e:
-                    error_count += 1
-                    error_messages.append(f"Row {index + 1}: {str(e)}")
-                    continue
-
-            # Update upload status
-            upload.success_count = success_count
-            upload.error_count = error_count
-            upload.processed_rows = success_count + error_count
-
-            if error_messages:
-                upload.error_log = "\n".join(error_messages[:10])
-
-            if upload.processed_rows >= upload.total_rows:
-                upload.status = 'completed' if error_count == 0 else 'completed_with_errors'
-
-            upload.save()
-
-            response_data = {
-                'message': f'Processed {success_count} rows successfully',
-                'errors': error_count,
-                'upload_id': upload.id
-            }
-
-            if error_count > 0:
-                response_data['error_samples'] = error_messages[:3]  # Show first 3 errors
-
-            serializer = CsvUploadSerializer(upload)
-            return Response(serializer.data, status=201)
-
-        except Exception as e:
-            # Mark upload as failed
-            upload.status = 'failed'
-            upload.error_log = str(e)
-            upload.save()
+    def post(self, request):
+        """POST /api/csv-uploads/batch - Queue several CSV files (repeated `files` field) as one batch"""
+        user = request.user
+        files = request.FILES.getlist('files')
+        limit = settings.ANALYTICS_UPLOAD_BATCH_MAX_FILES
 
+        if not files:
+            return Response({'error': 'No files provided'}, status=400)
+        if len(files) > limit:
             return Response({
-                'error': 'Failed to process CSV file',
-                'details': str(e)
-            }, status=500)
+                'error': 'Too many files',
+                'details': f'A batch holds at most {limit} files; got {len(files)}'
+            }, status=400)
+
+        # Each file is its own upload; the scheduler runs up to ANALYTICS_UPLOAD_BATCH_PARALLELISM at once
+        # (capped at ANALYTICS_UPLOAD_WORKERS).
+        # Rows repeated across files are imported once (see analytics.ingestion).
+        # All files are queued or none: a failure part-way leaves no half-created batch
+        with transaction.atomic():
+            batch = UploadBatch.objects.create(artist=user, file_count=len(files))
+            uploads = [
+                CsvUpload.objects.create(
+                    artist=user, batch=batch, filename=csv_file.name, file=csv_file, size_bytes=csv_file.size,
+                    total_rows=0
+                )
+                for csv_file in files
+            ]
+            enqueue_uploads(uploads)
+        return Response(batch_data([batch], user)[0], status=202)
+
+
+class UploadBatchListView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @conditional_on_artist_data(volatile=lambda request: uploads_in_flight(request.user.id))
+    def get(self, request):
+        """GET /api/csv-uploads/batches - List the user's upload batches with aggregate status"""
+        batches = list(UploadBatch.objects.filter(artist=request.user).order_by('-created_at', '-id'))
+        return Response(batch_data(batches, request.user))
+
+
+class UploadBatchDetailView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @conditional_on_artist_data(volatile=lambda request: uploads_in_flight(request.user.id))
+    def get(self, request, pk):
+        """GET /api/csv-uploads/batches/{id} - Batch status, row counts and per-file progress"""
+        try:
+            batch = UploadBatch.objects.get(id=pk, artist=request.user)
+        except UploadBatch.DoesNotExist:
+            return Response({'error': 'Not found'}, status=404)
+        return Response(batch_data([batch], request.user)[0])
 
 
 # from rest_framework.views import APIView
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_asgi_application()
+
+# Start uploads queued before a restart and fail those a dead worker left processing
+from analytics.scheduler import upload_scheduler  # noqa: E402
+
+upload_scheduler.resume()
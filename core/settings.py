@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework_simplejwt',
     'rest_framework_simplejwt.token_blacklist',
@@ -54,6 +55,10 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'analytics.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
    ' APPEND_SLASH': True,
 }
 
@@ -70,6 +75,31 @@ SIMPLE_JWT = {
 DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Background work (exports) runs on an in-process thread pool
+ANALYTICS_BACKGROUND_WORKERS = int(os.getenv('ANALYTICS_BACKGROUND_WORKERS', '2'))
+ANALYTICS_RUN_TASKS_INLINE = os.getenv('ANALYTICS_RUN_TASKS_INLINE', 'False') == 'True'
+ANALYTICS_PARTITION_STATEMENTS = os.getenv('ANALYTICS_PARTITION_STATEMENTS', 'False') == 'True'
+ANALYTICS_STATEMENT_PARTITION_INTERVAL = os.getenv('ANALYTICS_STATEMENT_PARTITION_INTERVAL', 'month')
+ANALYTICS_ENGINE = os.getenv('ANALYTICS_ENGINE', 'sql')
+ANALYTICS_COLUMN_CACHE_BYTES = int(os.getenv('ANALYTICS_COLUMN_CACHE_BYTES', str(256 * 1024 * 1024)))
+ANALYTICS_SEARCH_BACKEND = os.getenv('ANALYTICS_SEARCH_BACKEND', 'auto')
+ANALYTICS_REFERENCE_CACHE_SECONDS = int(os.getenv('ANALYTICS_REFERENCE_CACHE_SECONDS', '300'))
+# CSV upload queue (see analytics.scheduler)
+ANALYTICS_UPLOAD_WORKERS = int(os.getenv('ANALYTICS_UPLOAD_WORKERS', '2'))
+ANALYTICS_UPLOAD_ARTIST_LIMIT = int(os.getenv('ANALYTICS_UPLOAD_ARTIST_LIMIT', '1'))
+# Files of one batch processed at once; never more than ANALYTICS_UPLOAD_WORKERS take effect
+ANALYTICS_UPLOAD_BATCH_PARALLELISM = int(os.getenv('ANALYTICS_UPLOAD_BATCH_PARALLELISM', '2'))
+ANALYTICS_UPLOAD_BATCH_MAX_FILES = int(os.getenv('ANALYTICS_UPLOAD_BATCH_MAX_FILES', '50'))
+ANALYTICS_UPLOAD_POLICY = os.getenv('ANALYTICS_UPLOAD_POLICY', 'analytics.scheduler.FairSharePolicy')
+ANALYTICS_UPLOAD_STARVATION_SECONDS = int(os.getenv('ANALYTICS_UPLOAD_STARVATION_SECONDS', '600'))
+ANALYTICS_UPLOAD_STALE_SECONDS = int(os.getenv('ANALYTICS_UPLOAD_STALE_SECONDS', '3600'))
+ANALYTICS_UPLOAD_TRACEMALLOC = os.getenv('ANALYTICS_UPLOAD_TRACEMALLOC', 'False') == 'True'  # slows imports
+# Upload progress streams (see analytics.progress)
+ANALYTICS_UPLOAD_EVENTS_TIMEOUT = int(os.getenv('ANALYTICS_UPLOAD_EVENTS_TIMEOUT', '300'))
+ANALYTICS_UPLOAD_EVENTS_HEARTBEAT = int(os.getenv('ANALYTICS_UPLOAD_EVENTS_HEARTBEAT', '15'))
+ANALYTICS_UPLOAD_EVENTS_POLL_SECONDS = float(os.getenv('ANALYTICS_UPLOAD_EVENTS_POLL_SECONDS', '1'))
+ANALYTICS_UPLOAD_EVENTS_RETRY_MS = int(os.getenv('ANALYTICS_UPLOAD_EVENTS_RETRY_MS', '3000'))
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',